@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import hashlib
+import subprocess
+
+from cache import file_hash
+from segments import video_codec_args, write_segment_list
+
+
+# 片头、片尾和背景视频按任务的分辨率、帧率和编码参数预先转码一次，按素材内容和参数的哈希缓存
+# 同一个片头用于大量视频时，每个任务只需流复制拼接，不再重新编码
+ASSET_NAMES = {
+    "intro": "片头",
+    "outro": "片尾",
+    "background": "背景视频"
+}
+
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+# 视频流的时间基，如12800 tbn、90k tbn
+TIMEBASE_PATTERN = re.compile(r"([\d.]+k?) tbn")
+
+
+def probe_media(path):
+    # 解析ffmpeg -i的输出，不依赖ffprobe；返回{'duration': 秒或None, 'audio': 是否有音频流,
+    # 'timebase': 视频流的时间基或None}
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-i", path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    output = result.stderr.decode('utf-8', errors='replace')
+    match = DURATION_PATTERN.search(output)
+    duration = None
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    audio = any("Stream #" in line and "Audio:" in line for line in output.splitlines())
+    timebase = None
+    for line in output.splitlines():
+        if "Stream #" in line and "Video:" in line:
+            match = TIMEBASE_PATTERN.search(line)
+            timebase = match.group(1) if match else None
+            break
+    return {'duration': duration, 'audio': audio, 'timebase': timebase}
+
+
+def fit_size(width, height, max_width, max_height):
+    # 按比例缩放到不超过max_width x max_height，宽高取偶数
+    scale = min(max_width / width, max_height / height)
+    return int(width * scale) // 2 * 2, int(height * scale) // 2 * 2
+
+
+def background_filter(background_index, slide_label, output_label):
+    # 幻灯片画面居中叠加在循环播放的背景视频上，幻灯片结束时输出结束
+    return (f"[{background_index}:v][{slide_label}]overlay=(W-w)/2:(H-h)/2:shortest=1,"
+            f"format=yuv420p[{output_label}]")
+
+
+class AssetNormalizer:
+    def __init__(self, converter, cache, width, height, fps, encoder_args, audio, work_dir):
+        self.converter = converter
+        self.cache = cache
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.encoder_args = encoder_args
+        # 主视频有音轨时片头片尾也必须有音轨(没有时补静音)，否则无法流复制拼接
+        self.audio = audio
+        self.work_dir = work_dir
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def signature(self):
+        return {
+            'size': f"{self.width}x{self.height}",
+            'fps': self.fps,
+            'video': video_codec_args(self.encoder_args, self.width, self.height),
+            'audio': "aac|44100|stereo" if self.audio else ""
+        }
+
+    def cache_key(self, asset_path, kind):
+        inputs = {'asset': file_hash(asset_path), 'kind': kind, 'profile': self.signature()}
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def prepare(self, asset_path, kind):
+        # 返回转码后的素材路径，已缓存时直接取出
+        if not os.path.isfile(asset_path):
+            raise Exception(f"找不到{ASSET_NAMES[kind]}文件：{asset_path}")
+        key = self.cache_key(asset_path, kind)
+        output_path = os.path.join(self.work_dir, kind + ".mp4")
+        if self.cache is not None and self.cache.fetch(key, ".mp4", output_path):
+            self.converter.log(f"使用已缓存的{ASSET_NAMES[kind]}：{asset_path}")
+            return output_path
+        self.converter.log(f"转码{ASSET_NAMES[kind]}：{asset_path}")
+        if kind == "background":
+            self.encode_background(asset_path, output_path)
+        else:
+            self.encode_clip(asset_path, output_path)
+        if self.cache is not None:
+            self.cache.put(key, output_path, ".mp4")
+            self.cache.evict()
+        return output_path
+
+    def encode_clip(self, asset_path, output_path):
+        # 片头片尾缩放后居中补边，统一帧率、像素格式和音频格式
+        video_filter = (f"[0:v]scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,"
+                        f"pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1,"
+                        f"fps={self.fps:g},format=yuv420p[v]")
+        cmd = ["ffmpeg", "-y", "-i", asset_path]
+        if not self.audio:
+            cmd += ["-filter_complex", video_filter, "-map", "[v]", "-an"]
+        elif probe_media(asset_path)['audio']:
+            cmd += ["-filter_complex", f"{video_filter};[0:a]aresample=44100,aformat=channel_layouts=stereo[a]",
+                    "-map", "[v]", "-map", "[a]", "-c:a", "aac"]
+        else:
+            cmd += ["-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo",
+                    "-filter_complex", video_filter, "-map", "[v]", "-map", "1:a", "-c:a", "aac", "-shortest"]
+        cmd += video_codec_args(self.encoder_args, self.width, self.height) + [output_path]
+        self.converter.run_ffmpeg(cmd, f"{ASSET_NAMES['intro']}/{ASSET_NAMES['outro']}转码失败", progress=False)
+
+    def encode_background(self, asset_path, output_path):
+        # 背景视频缩放裁剪铺满画面，只保留画面
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", asset_path,
+            "-vf", f"scale={self.width}:{self.height}:force_original_aspect_ratio=increase,"
+                   f"crop={self.width}:{self.height},setsar=1,fps={self.fps:g},format=yuv420p",
+            "-an"
+        ] + video_codec_args(self.encoder_args, self.width, self.height) + [output_path]
+        self.converter.run_ffmpeg(cmd, "背景视频转码失败", progress=False)
+
+
+def join_clips(converter, clip_paths, output_path):
+    # 片头、正片、片尾编码参数一致，直接流复制拼接
+    # 时间基不同时流复制会得到时间戳错乱的文件，直接报错
+    timebases = {path: probe_media(path)['timebase'] for path in clip_paths}
+    if len(set(timebases.values())) > 1:
+        detail = "、".join(f"{os.path.basename(path)} {timebase}" for path, timebase in timebases.items())
+        raise Exception(f"片头片尾与正片的时间基不一致，无法流复制拼接：{detail}")
+    list_path = write_segment_list(output_path + ".txt", clip_paths)
+    cmd = [
+        "ffmpeg", "-y",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-map", "0",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        output_path
+    ]
+    converter.run_ffmpeg(cmd, "片头片尾拼接失败", progress=False)
+    return output_path
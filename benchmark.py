@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import statistics
+import subprocess
+import multiprocessing
+
+from PIL import Image, ImageDraw
+
+from converter import QUALITY_SETTINGS, TRANSITION_EFFECTS, convert_deck
+
+try:
+    from pptx import Presentation
+    from pptx.util import Emu, Pt
+except ImportError:
+    Presentation = None
+
+
+# 端到端基准测试：生成合成的PPT和背景音乐，按分辨率 x 质量 x 转场效果的矩阵逐项转换，
+# 记录各阶段的耗时、CPU时间和内存峰值，结果保存为JSON，可与基准结果对比检查性能回退
+BENCH_RESOLUTIONS = ("1280x720", "1920x1080", "2560x1440")
+BENCH_QUALITIES = ("低质量", "中等质量", "高质量")
+BENCH_TRANSITIONS = tuple(TRANSITION_EFFECTS)
+
+# 16:9页面，与PowerPoint默认的宽屏尺寸相同
+SLIDE_WIDTH_EMU = 12192000
+SLIDE_HEIGHT_EMU = 6858000
+
+WORDS = ("性能", "编码", "转场", "渲染", "缓存", "时间线", "分辨率", "字幕", "配音", "背景音乐", "幻灯片",
+         "pipeline", "encoder", "latency", "throughput", "frame", "bitrate", "preset", "segment", "render")
+
+# 对比时低于这些差值的变化视为噪声，不算回退
+MIN_DELTA_SECONDS = 0.5
+MIN_DELTA_MB = 20.0
+COMPARED_FIELDS = (("seconds", MIN_DELTA_SECONDS), ("cpu_seconds", MIN_DELTA_SECONDS),
+                   ("peak_rss_mb", MIN_DELTA_MB), ("children_peak_rss_mb", MIN_DELTA_MB))
+
+
+def synthetic_image(path, rng, width=800, height=600):
+    # 渐变底色上随机叠加图形，既有平滑区域也有边缘，接近照片和图表混排的编码难度
+    gradient = Image.linear_gradient("L").resize((width, height)).rotate(rng.randint(0, 359))
+    shift = rng.randint(0, 255)
+    img = Image.merge("RGB", (gradient, gradient.point(lambda v: (v + shift) % 256),
+                              Image.new("L", (width, height), rng.randint(0, 255))))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(10, 30)):
+        x0, y0 = rng.randint(0, width), rng.randint(0, height)
+        x1, y1 = x0 + rng.randint(20, width // 2), y0 + rng.randint(20, height // 2)
+        fill = tuple(rng.randint(0, 255) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), fill=fill)
+        else:
+            draw.ellipse((x0, y0, x1, y1), fill=fill)
+    img.save(path)
+    return path
+
+
+def synthetic_text(rng, words):
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(4, 12))
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)))
+        words -= length
+    return sentences
+
+
+def make_deck(path, slides=10, images_per_slide=1, words_per_slide=60, seed=0):
+    # 生成合成的PPTX：每页标题、正文、images_per_slide张图片和演讲者备注，同样的参数生成的内容相同
+    if Presentation is None:
+        raise Exception("未安装python-pptx，无法生成测试用PPT")
+    rng = random.Random(seed)
+    prs = Presentation()
+    prs.slide_width = Emu(SLIDE_WIDTH_EMU)
+    prs.slide_height = Emu(SLIDE_HEIGHT_EMU)
+    image_dir = os.path.splitext(path)[0] + "_images"
+    os.makedirs(image_dir, exist_ok=True)
+    for i in range(1, slides + 1):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f"第{i}页 " + " ".join(rng.choice(WORDS) for _ in range(3))
+        body = slide.placeholders[1]
+        body.left, body.top = Emu(SLIDE_WIDTH_EMU // 20), Emu(SLIDE_HEIGHT_EMU // 4)
+        body.width, body.height = Emu(SLIDE_WIDTH_EMU * 9 // 20), Emu(SLIDE_HEIGHT_EMU * 2 // 3)
+        frame = body.text_frame
+        for j, sentence in enumerate(synthetic_text(rng, words_per_slide)):
+            paragraph = frame.paragraphs[0] if j == 0 else frame.add_paragraph()
+            paragraph.text = sentence
+            paragraph.font.size = Pt(16)
+        # 图片排在页面右半边的网格中
+        columns = max(1, round(images_per_slide ** 0.5))
+        rows = max(1, -(-images_per_slide // columns))
+        cell_width = SLIDE_WIDTH_EMU // 2 // columns
+        cell_height = SLIDE_HEIGHT_EMU * 3 // 4 // rows
+        for k in range(images_per_slide):
+            image_path = synthetic_image(os.path.join(image_dir, f"{i}_{k}.png"), rng)
+            slide.shapes.add_picture(image_path, Emu(SLIDE_WIDTH_EMU // 2 + k % columns * cell_width),
+                                     Emu(SLIDE_HEIGHT_EMU // 5 + k // columns * cell_height),
+                                     Emu(cell_width), Emu(cell_height))
+        slide.notes_slide.notes_text_frame.text = "\n".join(synthetic_text(rng, words_per_slide // 2))
+    prs.save(path)
+    return path
+
+
+def make_bgm(path, seconds=60):
+    # 几个正弦波和少量噪声混合的立体声，避免纯音在响度归一化和编码时过于理想
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds:g}",
+        "-f", "lavfi", "-i", f"sine=frequency=330:duration={seconds:g}",
+        "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.05:duration={seconds:g}:seed=1",
+        "-filter_complex", "[0:a][1:a][2:a]amix=inputs=3,aformat=channel_layouts=stereo,"
+                           "aresample=44100,volume=2[a]",
+        "-map", "[a]", path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise Exception(f"生成测试用背景音乐失败：{result.stderr.decode('utf-8', errors='replace').strip()}")
+    return path
+
+
+def case_id(resolution, quality, transition):
+    return f"{resolution}|{quality}|{transition}"
+
+
+def _run_case(ppt_path, bgm_path, output_path, config, work_dir, cache_dir):
+    # 在子进程中运行，每项的内存峰值互不影响；报告由转换自己写出
+    try:
+        convert_deck(ppt_path, bgm_path, output_path, config, work_dir, cache_dir=cache_dir)
+    except Exception:
+        sys.exit(1)
+
+
+def run_case(ppt_path, bgm_path, output_path, config, work_dir, cache_dir):
+    # 返回转换写出的运行报告，子进程异常退出(如被OOM结束)时返回只有错误信息的报告
+    stem = os.path.splitext(os.path.basename(ppt_path))[0]
+    report_path = os.path.join(os.path.dirname(output_path), stem + "_report.json")
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    process = multiprocessing.Process(target=_run_case,
+                                      args=(ppt_path, bgm_path, output_path, config, work_dir, cache_dir))
+    process.start()
+    process.join()
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'ok': False, 'error': f"转换进程异常退出，返回码{process.exitcode}"}
+
+
+def summarize(reports):
+    # 多次重复取各项的中位数
+    ok_reports = [report for report in reports if report.get('ok')]
+    if not ok_reports:
+        return {'ok': False, 'error': reports[-1].get('error')}
+    summary = {'ok': True, 'runs': len(ok_reports)}
+    for field, _ in COMPARED_FIELDS:
+        values = [report[field] for report in ok_reports if report.get(field) is not None]
+        summary[field] = round(statistics.median(values), 3) if values else None
+    stages = {}
+    for report in ok_reports:
+        for total in report['stage_totals']:
+            stages.setdefault(total['stage'], []).append(total['seconds'])
+    summary['stages'] = {stage: round(statistics.median(values), 3) for stage, values in stages.items()}
+    encodes = [record for record in ok_reports[-1]['ffmpeg'] if record['stage'] == "encode" and record.get('fps')]
+    if encodes:
+        summary['encode_fps'] = round(sum(record['fps'] for record in encodes) / len(encodes), 1)
+    return summary
+
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'processor': platform.processor() or platform.machine()
+    }
+
+
+def run_benchmark(work_dir, resolutions=BENCH_RESOLUTIONS, qualities=BENCH_QUALITIES,
+                  transitions=BENCH_TRANSITIONS, slides=10, images_per_slide=1, words_per_slide=60,
+                  slide_duration=3.0, repeat=1, config=None, cold_render=False, log=print):
+    # 每项在独立的子进程中转换；默认同一分辨率只在第一项渲染，之后的项使用渲染缓存，只比较编码
+    # cold_render时每项都重新渲染
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    deck_name = f"deck_{slides}x{images_per_slide}x{words_per_slide}.pptx"
+    ppt_path = os.path.join(work_dir, deck_name)
+    if not os.path.exists(ppt_path):
+        log(f"生成测试PPT：{deck_name}")
+        make_deck(ppt_path, slides, images_per_slide, words_per_slide)
+    bgm_path = os.path.join(work_dir, "bgm.wav")
+    if not os.path.exists(bgm_path):
+        make_bgm(bgm_path)
+
+    cache_dir = os.path.join(work_dir, "CACHE")
+    output_dir = os.path.join(work_dir, "output")
+    base_config = dict(config or {})
+    base_config.update({
+        'slide_duration': f"{slide_duration:g}",
+        'save_text': False,
+        'segment_cache': False,
+        'render_cache': not cold_render
+    })
+
+    cases = []
+    for resolution in resolutions:
+        for quality in qualities:
+            if quality not in QUALITY_SETTINGS:
+                raise Exception(f"不支持的视频质量：{quality}")
+            for transition in transitions:
+                if transition not in TRANSITION_EFFECTS:
+                    raise Exception(f"不支持的转场效果：{transition}")
+                case = {'id': case_id(resolution, quality, transition), 'resolution': resolution,
+                        'quality': quality, 'transition': transition}
+                case_config = dict(base_config, resolution=resolution, video_quality=quality,
+                                   transition_effect=transition)
+                output_path = os.path.join(output_dir, f"case_{len(cases)}.mp4")
+                reports = [run_case(ppt_path, bgm_path, output_path, case_config, work_dir, cache_dir)
+                           for _ in range(repeat)]
+                for path in (output_path, os.path.splitext(output_path)[0] + ".srt"):
+                    if os.path.exists(path):
+                        os.remove(path)
+                case.update(summarize(reports))
+                cases.append(case)
+                if case['ok']:
+                    log(f"[{len(cases)}] {case['id']}：{case['seconds']:.2f}秒，CPU {case['cpu_seconds']:.2f}秒")
+                else:
+                    log(f"[{len(cases)}] {case['id']}：失败，{case['error']}")
+
+    return {
+        'created': time.time(),
+        'machine': machine_info(),
+        'deck': {'slides': slides, 'images_per_slide': images_per_slide, 'words_per_slide': words_per_slide,
+                 'slide_duration': slide_duration},
+        'config': {key: base_config[key] for key in sorted(base_config)},
+        'repeat': repeat,
+        'cold_render': cold_render,
+        'cases': cases
+    }
+
+
+def save_results(path, results):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(baseline, results, threshold=0.1):
+    # 返回回退项列表：同一项的耗时、CPU时间或内存峰值比基准高出threshold(比例)以上，且超过噪声下限
+    # 基准中成功而本次失败的项也算回退
+    regressions = []
+    baseline_cases = {case['id']: case for case in baseline['cases']}
+    for case in results['cases']:
+        base = baseline_cases.get(case['id'])
+        if base is None or not base.get('ok'):
+            continue
+        if not case.get('ok'):
+            regressions.append({'id': case['id'], 'field': 'ok', 'baseline': True, 'current': False})
+            continue
+        for field, min_delta in COMPARED_FIELDS:
+            old, new = base.get(field), case.get(field)
+            if not old or new is None:
+                continue
+            if new - old > min_delta and new > old * (1 + threshold):
+                regressions.append({'id': case['id'], 'field': field, 'baseline': old, 'current': new,
+                                    'change': round(new / old - 1, 3)})
+    return regressions
+
+
+def baseline_mismatches(baseline, results):
+    # 合成PPT参数或重复次数不同时结果不可比，返回不同的项
+    keys = ('deck', 'repeat', 'cold_render')
+    return [key for key in keys if baseline.get(key) != results.get(key)]
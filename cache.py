@@ -0,0 +1,126 @@
+import os
+import shutil
+import hashlib
+import zipfile
+
+from metrics import copy_atomic
+from pptx_package import read_rels, slide_part_names, slide_size
+
+
+CACHE_DIR = os.path.join(os.getcwd(), "CACHE")
+
+# 渲染效果不受这些关系影响，计算缓存键时不跟随
+IGNORED_REL_TYPES = {"slide", "notesSlide", "notesMaster", "handoutMaster", "comments", "commentAuthors"}
+
+
+class FileCache:
+    # 按内容哈希存放文件的磁盘缓存，超过容量时按最近使用时间淘汰
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, key, ext):
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def get(self, key, ext):
+        path = self.path_for(key, ext)
+        if not os.path.exists(path):
+            return None
+        try:
+            # 更新修改时间作为最近使用时间
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def put(self, key, src_path, ext):
+        # 先写临时文件再改名，多个进程同时写入同一条目也不会读到半个文件
+        return copy_atomic(src_path, self.path_for(key, ext))
+
+    def fetch(self, key, ext, dst_path):
+        path = self.get(key, ext)
+        if path is None:
+            return False
+        link_or_copy(path, dst_path)
+        return True
+
+    def evict(self):
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def link_or_copy(src_path, dst_path):
+    if os.path.exists(dst_path):
+        os.remove(dst_path)
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copyfile(src_path, dst_path)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def slide_cache_keys(ppt_path, extra=""):
+    # 每页的缓存键 = 该页XML及其引用的版式、母版、主题、媒体部件内容 + 幻灯片尺寸 + 渲染参数
+    # 只编辑了一页时只有这一页的键会变化；.ppt格式无法拆分部件，返回None
+    if not zipfile.is_zipfile(ppt_path):
+        return None
+
+    part_hashes = {}
+    with zipfile.ZipFile(ppt_path) as zf:
+        def part_hash(part_name):
+            if part_name not in part_hashes:
+                try:
+                    part_hashes[part_name] = hashlib.sha256(zf.read(part_name)).hexdigest()
+                except KeyError:
+                    part_hashes[part_name] = "missing"
+            return part_hashes[part_name]
+
+        def collect_parts(part_name, seen):
+            if part_name in seen:
+                return
+            seen.add(part_name)
+            for _, rel_type, target in read_rels(zf, part_name):
+                if rel_type in IGNORED_REL_TYPES:
+                    continue
+                # 母版会引用全部版式，只有幻灯片自己使用的版式才影响渲染
+                if rel_type == "slideLayout" and "slideMasters/" in part_name:
+                    continue
+                collect_parts(target, seen)
+
+        size = "%dx%d" % slide_size(zf)
+        keys = []
+        for slide_part in slide_part_names(zf):
+            parts = set()
+            collect_parts(slide_part, parts)
+            digest = hashlib.sha256(f"{size}|{extra}".encode('utf-8'))
+            for part_name in sorted(parts):
+                digest.update(f"|{part_name}:{part_hash(part_name)}".encode('utf-8'))
+            keys.append(digest.hexdigest())
+    return keys
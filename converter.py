@@ -0,0 +1,1335 @@
+import os
+import io
+import json
+import shutil
+import subprocess
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from cache import CACHE_DIR, FileCache, slide_cache_keys, file_hash
+from renderers import get_renderer
+from renderer_pool import get_pooled_renderer
+from frame_stream import FrameStreamer
+from segments import SegmentEncoder, BuildManifest, timeline_frames, frame_counts, video_codec_args
+from transitions import (TRANSITION_EFFECTS, plan_transitions, clamp_transition_duration,
+                         build_xfade_graph, build_timeline)
+from slide_text import extract_slides, slide_content, NOTES_HEADER, SOURCE_PREFIX
+from plan import read_deck, planned_dimensions, estimate_narration_durations, estimate_cost
+from narration import Narrator, read_text_source, read_slide_texts, narration_durations, build_narration_track
+from subtitles import SUBTITLE_MODES, build_cues, offset_cues, trim_cues, write_srt, write_ass, subtitles_filter
+from renditions import RenditionLadder, parse_list, AUDIO_BITRATE
+from dedup import duplicate_groups, collapse_timeline
+from assets import AssetNormalizer, probe_media, fit_size, background_filter, join_clips
+from loudness import LoudnessAnalyzer, loudnorm_filter
+from encoders import (ENCODER_NAMES, EncoderProfiler, get_encoder, available_encoders, available_share,
+                      candidate_encoders, select_encoder, video_stream_args)
+from metrics import RunMetrics, write_json_report, write_prometheus_textfile
+from workspace import (Workspace, RAM_ROOT, estimate_workspace_bytes, clear_directory, same_filesystem,
+                       handoff, handoff_tree)
+
+
+# 默认参数，与界面及config.json中的字段保持一致
+DEFAULT_CONFIG = {
+    'slide_duration': '5',
+    'transition_duration': '1',
+    'video_quality': '高质量',
+    'bgm_volume': '1.0',
+    'resolution': '自动',
+    'auto_next': True,
+    'save_text': True,
+    'transition_effect': '无',
+    'render_cache': True,
+    'cache_size_mb': '2048',
+    'renderer': '自动',
+    'render_workers': '',
+    'encode_mode': 'concat',
+    'fps': '25',
+    'hold_fps': '5',
+    'encode_workers': '',
+    'segment_cache': True,
+    'segment_cache_size_mb': '4096',
+    'transition_seed': '',
+    'narration': False,
+    'tts_engine': 'pyttsx3',
+    'tts_voice': '',
+    'tts_rate': '',
+    'tts_workers': '',
+    'narration_padding': '0.5',
+    'bgm_duck': True,
+    'subtitles': '软字幕',
+    'tts_cache_size_mb': '1024',
+    'extract_workers': '',
+    'renderer_pool': False,
+    'renderer_pool_size': '',
+    'renderer_max_documents': '50',
+    'renderer_max_memory_mb': '1500',
+    'render_timeout': '600',
+    'renditions': '',
+    'stream_formats': 'mp4',
+    'hls_segment_seconds': '6',
+    'collapse_duplicates': False,
+    'duplicate_threshold': '',
+    'intro_video': '',
+    'outro_video': '',
+    'background_video': '',
+    'asset_cache_size_mb': '2048',
+    'bgm_loudness': '-20',
+    'ram_workspace': False,
+    'preview': False,
+    'preview_start': '1',
+    'run_report': True,
+    'metrics_textfile': '',
+    'video_codec': 'libx264',
+    'encoder_threads': '',
+    'encoder_slices': '',
+    'encode_deadline': '',
+    'realtime_factor': ''
+}
+
+QUALITY_SETTINGS = {
+    "低质量": ["-crf", "28", "-preset", "faster"],
+    "中等质量": ["-crf", "23", "-preset", "medium"],
+    "高质量": ["-crf", "18", "-preset", "slow"],
+    "预览": ["-crf", "30", "-preset", "ultrafast"]
+}
+
+# 快速预览：渲染分辨率不变(直接使用渲染缓存)，编码时缩小到约360p，以低帧率和最快的预设编码
+PREVIEW_QUALITY = "预览"
+PREVIEW_HEIGHT = 360
+PREVIEW_FPS = 10
+
+PPT_EXTENSIONS = ('.pptx', '.ppt')
+
+# 多进程批量转换时，PowerPoint只能单实例运行，渲染阶段需要串行
+_render_lock = None
+
+
+class ConvertCancelled(Exception):
+    pass
+
+
+def load_config_file(config_path):
+    config = dict(DEFAULT_CONFIG)
+    if config_path and os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    return config
+
+
+def get_ffmpeg_quality_params(video_quality):
+    return QUALITY_SETTINGS.get(video_quality, QUALITY_SETTINGS["高质量"])
+
+
+def parse_progress_stats(values):
+    # ffmpeg -progress中的frame、fps、speed，无法解析(如N/A)的项省略
+    stats = {}
+    for key, name, parse in (('frame', 'frames', int), ('fps', 'fps', float),
+                             ('speed', 'speed', lambda v: float(v.rstrip('x')))):
+        try:
+            stats[name] = parse(values[key])
+        except (KeyError, ValueError):
+            pass
+    return stats
+
+
+def preview_config(config=None, start_slide=None):
+    # 在正式转换的配置上生成预览配置，转换计划、文案、配音和渲染缓存与正式转换相同
+    # 片头片尾和多规格输出不参与预览
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    fps = min(float(config['fps']), PREVIEW_FPS)
+    config.update({
+        'preview': True,
+        'video_quality': PREVIEW_QUALITY,
+        'video_codec': 'libx264',
+        'encode_deadline': '',
+        'realtime_factor': '',
+        'fps': f"{fps:g}",
+        'hold_fps': f"{min(float(config['hold_fps']), fps):g}",
+        'renditions': '',
+        'stream_formats': 'mp4',
+        'intro_video': '',
+        'outro_video': ''
+    })
+    if start_slide is not None:
+        config['preview_start'] = str(start_slide)
+    return config
+
+
+def preview_size(width, height):
+    # 按比例缩小到PREVIEW_HEIGHT，宽度取偶数；本身不超过该高度时不缩放
+    if not (width and height) or height <= PREVIEW_HEIGHT:
+        return width, height
+    return round(width * PREVIEW_HEIGHT / height / 2) * 2, PREVIEW_HEIGHT
+
+
+class PPTConverter:
+    def __init__(self, config=None, temp_dir=None, log_file="ffmpeg_log.txt",
+                 text_file="ppt_content.txt", progress_callback=None, cache_dir=None,
+                 report_file="run_report.json"):
+        self.config = dict(DEFAULT_CONFIG)
+        if config:
+            self.config.update(config)
+        # 未指定临时目录时在TEMP下分配独立的工作目录，不能直接使用(并清空)其他任务共用的TEMP根目录
+        # 工作目录在close()或进程退出时删除；未指定输出路径时转换结果留在其中
+        self.workspace = None
+        if temp_dir is None:
+            self.workspace = Workspace(os.path.join(os.getcwd(), "TEMP"), "job")
+            temp_dir = self.workspace.path
+        self.temp_dir = temp_dir
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.log_file = log_file
+        self.text_file = text_file
+        # 每次转换各阶段的耗时和资源占用，结束时写入report_file
+        self.report_file = report_file
+        self.metrics = RunMetrics()
+        # 按速度目标选出的(编码器, 预设)，为None时按video_codec和video_quality
+        self.encoder_choice = None
+        # progress_callback(stage, current, total, info)，current为None表示进度未知
+        # info中可能包含ffmpeg汇报的fps和speed；可能在工作线程中被调用
+        self.progress_callback = progress_callback
+
+        # 取消相关：记录正在运行的ffmpeg进程和渲染器，取消时直接结束
+        self.cancel_event = threading.Event()
+        self.processes = set()
+        self.process_lock = threading.Lock()
+        self.renderer = None
+
+    def close(self):
+        # 删除自动分配的工作目录，指定的temp_dir由调用方管理
+        if self.workspace is not None:
+            self.workspace.cleanup()
+            self.workspace = None
+
+    def report_progress(self, stage, current=None, total=None, **info):
+        if self.progress_callback:
+            self.progress_callback(stage, current, total, info)
+
+    def cancel(self):
+        self.cancel_event.set()
+        with self.process_lock:
+            for process in list(self.processes):
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+        if self.renderer is not None:
+            self.renderer.cancel()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise ConvertCancelled("转换已取消")
+
+    def log(self, message):
+        with open(self.log_file, 'a', encoding='utf-8') as log:
+            log.write(message + "\n")
+
+    def get_resolution(self):
+        if self.config['resolution'] == "自动":
+            return 0, 0
+        return tuple(map(int, self.config['resolution'].split('x')))
+
+    def convert(self, ppt_path, bgm_path=None, output_path=None):
+        # 清空并创建临时目录
+        clear_directory(self.temp_dir)
+        output_dir = self.output_staging_dir(ppt_path, output_path)
+
+        # 清空日志文件
+        with open(self.log_file, 'w') as f:
+            f.write("")
+        self.log(f"工作目录：{self.temp_dir}")
+        self.metrics = RunMetrics()
+        plan = None
+        error = None
+
+        try:
+            # 渲染之前根据PPTX包生成转换计划，尺寸和时间安排不依赖渲染结果
+            with self.metrics.stage("plan"):
+                plan = self.plan_job(ppt_path, bgm_path)
+            self.log(f"转换计划：{plan['slide_count']}页，{plan['width']}x{plan['height']}，"
+                     f"预计渲染{plan['cost']['render_seconds']}秒，编码{plan['cost']['encode_seconds']}秒")
+
+            # 提取文本并保存，已有的文案提取自同一个PPT(内容未变)时可能经过人工修改，保留不覆盖
+            subtitle_mode = SUBTITLE_MODES.get(self.config['subtitles'], self.config['subtitles'])
+            if self.config['save_text'] or self.config['narration'] or subtitle_mode:
+                if self.text_is_stale(ppt_path):
+                    self.report_progress("extract")
+                    with self.metrics.stage("extract"):
+                        self.extract_text_from_ppt(ppt_path)
+                else:
+                    self.log(f"使用已有文案：{self.text_file}")
+
+            # 转换PPT到图片，已缓存的页直接复用
+            self.check_cancelled()
+            with self.metrics.stage("render"):
+                self.render_slides(os.path.abspath(ppt_path), self.temp_dir)
+            self.check_cancelled()
+
+            # 旧版.ppt无法预先读取尺寸，仍按渲染结果确定
+            with self.metrics.stage("postprocess"):
+                width, height = plan['width'], plan['height']
+                if not (width and height):
+                    width, height = self.get_max_slide_dimensions(self.temp_dir)
+                    if self.config['preview']:
+                        width, height = preview_size(width, height)
+                image_files = self.list_slide_images(self.temp_dir)
+            if plan['slide_count'] and len(image_files) != plan['slide_count']:
+                self.log(f"渲染页数{len(image_files)}与计划页数{plan['slide_count']}不一致，按渲染结果重新安排时间")
+            narration_track = None
+            if self.config['narration']:
+                # 每页停留时间由配音长度决定，计划中的时长只是按字数估算
+                with self.metrics.stage("narration"):
+                    durations, narration_track = self.prepare_narration(len(image_files))
+            else:
+                durations = self.slide_durations(len(image_files))
+            # 包含最后一页的停留时间，背景音乐按此循环或截断，淡出在视频结束时完成
+            total_duration = sum(durations)
+
+            effects, transition_duration = self.plan_timeline(ppt_path, durations)
+            # 按实际的页数和时长重新选择编码器(配音、旧版.ppt的时长在计划时只是估算)
+            self.select_encoder(durations, effects, transition_duration, width, height, self.log)
+            # 预览从指定页开始时，音轨和字幕仍按完整时间线生成后截取，与正式输出一致
+            start = self.preview_start(len(image_files))
+            start_time = sum(durations[:start])
+
+            # 音轨单独编码一次，之后各步骤直接复制
+            with self.metrics.stage("audio"):
+                audio_track = self.prepare_audio(bgm_path, narration_track, total_duration, start_time)
+
+            # 片头片尾和背景视频按本任务的参数转码，已缓存时直接复用
+            has_audio = bool(audio_track)
+            with self.metrics.stage("assets"):
+                assets = self.prepare_assets(width, height, has_audio)
+            slide_width, slide_height = width, height
+            background = None
+            if assets['background']:
+                # 幻灯片按比例放在画面中间，补边的位置露出背景视频
+                slide_width, slide_height = fit_size(*self.get_max_slide_dimensions(self.temp_dir), width, height)
+                if (slide_width, slide_height) == (width, height):
+                    self.log("幻灯片与输出画面比例相同，背景视频会被完全遮挡")
+                background = (assets['background'], width, height)
+
+            # 记录每页的时间安排，之后修改文案时只需重新生成字幕轨；预览不覆盖正式转换的记录
+            if not self.config['preview']:
+                self.save_schedule(ppt_path, durations, assets['offset'])
+            cues = build_cues(read_slide_texts(self.text_file), durations) if subtitle_mode else []
+            if start:
+                cues = trim_cues(cues, start_time)
+                image_files, durations, effects = image_files[start:], durations[start:], effects[start:]
+                total_duration = sum(durations)
+                self.log(f"预览从第{start + 1}页({start_time:g}秒)开始，时长{total_duration:g}秒")
+            burn_cues = cues if subtitle_mode == "burn" else []
+            # 软字幕在拼接片头之后封装，需要整体后移
+            cues = offset_cues(cues, assets['offset'])
+            if self.config['collapse_duplicates']:
+                # 字幕和配音按原来每页的时间生成，合并后总时长不变
+                image_files, durations, effects = self.collapse_duplicates(image_files, durations, effects,
+                                                                           transition_duration, width, height)
+
+            output_video = os.path.join(output_dir, "output.mp4")
+            # 配置了多个输出规格时，合成画面只解码一次，在同一个ffmpeg进程中编码所有规格
+            ladder = self.rendition_ladder(width, height, output_video)
+            if ladder:
+                if assets['intro'] or assets['outro']:
+                    raise Exception("片头片尾暂不支持与多规格输出同时使用")
+                ladder.prepare()
+            if self.config['encode_mode'] == "segment":
+                with self.metrics.stage("encode", mode="segment"):
+                    self.encode_segments(ppt_path, image_files, durations, effects, transition_duration,
+                                         slide_width, slide_height, audio_track, burn_cues, output_video,
+                                         ladder, background)
+                self.join_assets(output_video, assets)
+                with self.metrics.stage("output"):
+                    return self.finish_output(output_video, output_path, cues, ladder, has_audio)
+
+            subtitle_path = None
+            if burn_cues:
+                subtitle_path = write_ass(burn_cues, os.path.join(self.temp_dir, "subtitles.ass"), width, height)
+            cmd, streamer = self.build_encode_command(image_files, durations, effects, transition_duration,
+                                                      slide_width, slide_height, audio_track,
+                                                      subtitle_path, total_duration, output_video,
+                                                      ladder=ladder, background=background)
+            with self.metrics.stage("encode", mode=self.config['encode_mode']):
+                self.run_ffmpeg(cmd, "FFmpeg转换失败", streamer.feed if streamer else None, duration=sum(durations))
+            if streamer and streamer.error:
+                raise Exception(f"解码幻灯片图片失败：{str(streamer.error)}")
+
+            self.join_assets(output_video, assets)
+            with self.metrics.stage("output"):
+                return self.finish_output(output_video, output_path, cues, ladder, has_audio)
+
+        except Exception as e:
+            # 记录详细错误信息到日志
+            with open(self.log_file, 'a', encoding='utf-8') as log:
+                log.write(f"\nError occurred: {str(e)}\n")
+            error = str(e)
+            if self.cancel_event.is_set() and not isinstance(e, ConvertCancelled):
+                error = "转换已取消"
+                raise ConvertCancelled("转换已取消")
+            raise
+        finally:
+            if output_dir != self.temp_dir:
+                shutil.rmtree(output_dir, ignore_errors=True)
+            self.write_report(ppt_path, output_path, plan, error)
+
+    def write_report(self, ppt_path, output_path, plan, error):
+        # 各阶段的耗时、CPU时间和内存峰值写入JSON报告，配置了metrics_textfile时同时写出Prometheus文本格式
+        if not ((self.config['run_report'] and self.report_file) or self.config['metrics_textfile']):
+            return
+        summary = {'deck': os.path.basename(ppt_path), 'ppt': os.path.abspath(ppt_path),
+                   'output': os.path.abspath(output_path) if output_path else None,
+                   'ok': error is None, 'error': error}
+        if plan:
+            summary.update({'slide_count': plan['slide_count'], 'width': plan['width'], 'height': plan['height'],
+                            'encode_mode': plan['encode_mode'], 'encoder': self.encoder_args(),
+                            'estimated': plan['cost']})
+        report = self.metrics.report(**summary)
+        try:
+            if self.config['run_report'] and self.report_file:
+                write_json_report(self.report_file, report)
+            if self.config['metrics_textfile']:
+                write_prometheus_textfile(self.config['metrics_textfile'], report)
+        except OSError as e:
+            self.log(f"写入运行报告失败：{str(e)}")
+
+    def output_staging_dir(self, ppt_path, output_path):
+        # 临时目录与输出目录不在同一文件系统(如临时目录在内存盘上)时，最终的视频直接写在输出目录下的隐藏目录中，
+        # 完成后原子改名，不需要再复制一遍
+        if not output_path:
+            return self.temp_dir
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        os.makedirs(output_dir, exist_ok=True)
+        if same_filesystem(self.temp_dir, output_dir):
+            return self.temp_dir
+        stem = os.path.splitext(os.path.basename(ppt_path))[0]
+        staging_dir = os.path.join(output_dir, f".{stem}.{os.getpid()}.partial")
+        os.makedirs(staging_dir, exist_ok=True)
+        return staging_dir
+
+    def plan_timeline(self, ppt_path, durations):
+        # 准备转场效果，每个页间边界单独选择
+        effects = plan_transitions(len(durations), self.config['transition_effect'],
+                                   self.transition_seed(ppt_path))
+        transition_duration = clamp_transition_duration(durations, float(self.config['transition_duration']))
+        if not transition_duration:
+            effects = [""] * len(effects)
+        return effects, transition_duration
+
+    def plan_job(self, ppt_path, bgm_path=None):
+        # 只读取PPTX包(尺寸、页数、隐藏页、文本)生成完整的转换计划，不渲染也不编码
+        # 旧版.ppt读取不到时页数和尺寸为0，转换时按渲染结果确定
+        deck = read_deck(ppt_path, int(self.config['extract_workers'] or 0) or None)
+        renderer = get_renderer(self.config['renderer'], workers=int(self.config['render_workers'] or 0) or None)
+        render_width, render_height = self.get_resolution()
+        width, height = render_width, render_height
+        if not (width and height) and deck:
+            width, height = planned_dimensions(deck['slide_size'])
+        if self.config['preview']:
+            width, height = preview_size(width, height)
+
+        slides = deck['slides'] if deck else []
+        count = len(slides)
+        texts = {i: slide['text'] for i, slide in enumerate(slides, 1)}
+        if self.config['narration']:
+            durations = estimate_narration_durations(texts, count, float(self.config['slide_duration']),
+                                                     float(self.config['narration_padding']))
+        else:
+            durations = self.slide_durations(count) if count else []
+        effects, transition_duration = self.plan_timeline(ppt_path, durations)
+        fps = float(self.config['fps'])
+        workers = int(self.config['encode_workers'] or 0) or os.cpu_count() or 1
+        encoder = self.select_encoder(durations, effects, transition_duration, width, height, measure=False)
+        ladder = self.rendition_ladder(width, height, os.path.join(self.temp_dir, "output.mp4"))
+
+        # 渲染缓存中已有的页不需要重新渲染
+        render_count = count
+        if self.config['render_cache'] and deck:
+            keys = slide_cache_keys(ppt_path, f"{renderer.name}|{render_width}x{render_height}") or []
+            cache = FileCache(os.path.join(self.cache_dir, "slides"), 0)
+            render_count = sum(1 for key in keys if not os.path.exists(cache.path_for(key, ".png")))
+
+        plan = {
+            'ppt': os.path.abspath(ppt_path),
+            'renderer': renderer.name,
+            'slide_count': count,
+            'hidden_slides': [i for i, slide in enumerate(slides, 1) if slide['hidden']],
+            'slide_size_emu': list(deck['slide_size']) if deck else None,
+            'width': width,
+            'height': height,
+            'durations': [round(duration, 3) for duration in durations],
+            'durations_estimated': bool(self.config['narration']),
+            'total_duration': round(sum(durations), 3),
+            'transitions': effects,
+            'transition_duration': transition_duration,
+            'encode_mode': self.config['encode_mode'],
+            'encoder': encoder,
+            'fps': fps,
+            'render_slides': render_count
+        }
+        if self.config['preview']:
+            plan['preview_start'] = int(self.config['preview_start'] or 1)
+        if ladder:
+            plan['renditions'] = [{'name': name, 'width': w, 'height': h}
+                                  for name, (w, h) in zip(ladder.names, ladder.sizes)]
+            plan['stream_formats'] = ladder.formats
+        for kind in ('intro_video', 'outro_video', 'background_video'):
+            if self.config[kind]:
+                plan[kind] = os.path.abspath(self.config[kind])
+
+        timeline = build_timeline(durations, effects, transition_duration)
+        counts = self.timeline_frame_counts(timeline)
+        if self.config['encode_mode'] == "segment":
+            plan['segments'] = [{'type': piece['type'], 'slide': piece['slide'] + 1,
+                                 'effect': piece.get('effect', ""), 'frames': frames}
+                                for piece, frames in zip(timeline, counts)]
+        else:
+            audio_track = None
+            if bgm_path or self.config['narration']:
+                audio_track = os.path.join(self.temp_dir, "audio.m4a")
+            subtitle_path = None
+            if SUBTITLE_MODES.get(self.config['subtitles'], self.config['subtitles']) == "burn":
+                subtitle_path = os.path.join(self.temp_dir, "subtitles.ass")
+            image_files = [os.path.join(self.temp_dir, f"slide_{i}.png") for i in range(1, count + 1)]
+            plan['ffmpeg_command'], _ = self.build_encode_command(
+                image_files, durations, effects, transition_duration, width, height, audio_track,
+                subtitle_path, sum(durations), os.path.join(self.temp_dir, "output.mp4"),
+                dry_run=True, ladder=ladder)
+        still_frames = sum(frames for piece, frames in zip(timeline, counts) if piece['type'] == 'hold')
+        quality_params = self.encoder_args()
+        if ladder and self.config['encode_mode'] != "segment":
+            # 单次编码时按各规格的像素总数估算
+            plan['cost'] = estimate_cost(renderer.name, render_count, ladder.pixels(), 1, sum(counts),
+                                         still_frames, quality_params, 1)
+        else:
+            plan['cost'] = estimate_cost(renderer.name, render_count, width, height, sum(counts), still_frames,
+                                         quality_params, workers)
+        if ladder and self.config['encode_mode'] == "segment":
+            # 分段模式拼接后再按各规格以完整帧率编码一遍
+            rendition_frames = sum(frame_counts([piece['duration'] for piece in timeline], fps))
+            rendition_cost = estimate_cost(renderer.name, 0, ladder.pixels(), 1, rendition_frames, 0,
+                                           quality_params, 1)
+            plan['cost']['encode_seconds'] = round(plan['cost']['encode_seconds'] +
+                                                   rendition_cost['encode_seconds'], 1)
+            plan['cost']['total_seconds'] = round(plan['cost']['render_seconds'] +
+                                                  plan['cost']['encode_seconds'], 1)
+        return plan
+
+    def timeline_frame_counts(self, timeline):
+        # 分段模式下停留画面按hold_fps编码，其他模式全部按输出帧率
+        fps = float(self.config['fps'])
+        if self.config['encode_mode'] == "segment":
+            hold_fps = float(self.config['hold_fps'])
+            return timeline_frames([(piece['duration'], hold_fps if piece['type'] == 'hold' else fps)
+                                    for piece in timeline])
+        return frame_counts([piece['duration'] for piece in timeline], fps)
+
+    def estimate_encode_seconds(self, durations, effects, transition_duration, width, height):
+        timeline = build_timeline(durations, effects, transition_duration)
+        counts = self.timeline_frame_counts(timeline)
+        still_frames = sum(frames for piece, frames in zip(timeline, counts) if piece['type'] == 'hold')
+        workers = int(self.config['encode_workers'] or 0) or os.cpu_count() or 1
+        cost = estimate_cost("", 0, width, height, sum(counts), still_frames, self.encoder_args(),
+                             workers if self.config['encode_mode'] == "segment" else 1)
+        return cost['encode_seconds']
+
+    def collapse_duplicates(self, image_files, durations, effects, transition_duration, width, height):
+        # 内容完全相同(设置了duplicate_threshold时还包括近似)的连续页合并为一段停留画面，返回合并后的(图片, 时长, 转场)
+        self.report_progress("dedup")
+        threshold = self.config['duplicate_threshold']
+        with self.metrics.stage("dedup"):
+            groups = duplicate_groups(image_files, int(threshold) if str(threshold).strip() else None,
+                                      [file_hash(image_path) for image_path in image_files])
+        if len(groups) == len(image_files):
+            self.log("没有可以合并的重复页")
+            return image_files, durations, effects
+        collapsed = collapse_timeline(image_files, durations, effects, groups)
+        saved = (self.estimate_encode_seconds(durations, effects, transition_duration, width, height) -
+                 self.estimate_encode_seconds(collapsed[1], collapsed[2], transition_duration, width, height))
+        merged = "、".join(f"{group[0] + 1}-{group[-1] + 1}" for group in groups if len(group) > 1)
+        self.log(f"合并重复页：{merged}，{len(image_files)}页合并为{len(groups)}段，预计节省编码{saved:.1f}秒")
+        self.report_progress("dedup", len(image_files) - len(groups), len(image_files), saved_seconds=round(saved, 1))
+        return collapsed
+
+    def encoder_args(self):
+        # 编码器、质量档位以及线程和分片参数，所有编码步骤共用，流复制拼接时参数一致
+        if self.encoder_choice:
+            encoder, preset = self.encoder_choice
+        else:
+            name = self.config['video_codec']
+            encoder, preset = get_encoder("libx264" if name == "自动" else name), None
+        return encoder.args(self.config['video_quality'], preset, int(self.config['encoder_threads'] or 0),
+                            int(self.config['encoder_slices'] or 0))
+
+    def encode_budget(self, total_duration):
+        # 编码耗时预算(秒)：截止时间和实时倍数(每秒视频的编码时间不超过1/倍数秒)取较小者，都未设置时为None
+        budgets = []
+        if self.config['encode_deadline']:
+            budgets.append(float(self.config['encode_deadline']))
+        if self.config['realtime_factor']:
+            budgets.append(total_duration / float(self.config['realtime_factor']))
+        return min(budgets) if budgets else None
+
+    def select_encoder(self, durations, effects, transition_duration, width, height, log=None, measure=True):
+        # 设置了速度目标时，按本机测得的各编码器速度和当前负载，选择能在预算内完成的压缩率最高的编码器和预设
+        # 负载高时可用的CPU少，自动改用更快的预设；返回计划中记录的编码器信息
+        # 生成计划时不写日志(输出目录可能还不存在)，measure为False，只使用已缓存的速度测试结果
+        log = log or (lambda message: None)
+        self.encoder_choice = None
+        name = self.config['video_codec']
+        if name not in ENCODER_NAMES:
+            raise Exception(f"不支持的视频编码器：{name}，可选：{'、'.join(ENCODER_NAMES)}")
+        if name not in ("自动", "libx264") and name not in available_encoders():
+            raise Exception(f"当前FFmpeg不支持{name}编码器")
+        budget = self.encode_budget(sum(durations))
+        if budget is None or not (width and height and durations):
+            args = self.encoder_args()
+            return {'codec': args[args.index("-c:v") + 1], 'args': args}
+        profiler = EncoderProfiler(self.cache_dir, log)
+        unprofiled = [encoder.name for encoder in candidate_encoders(name) if not profiler.is_profiled(encoder)]
+        if unprofiled and not measure:
+            # 缺少速度测试结果时计划中按质量档位的预设记录，实际转换时再测试并选择
+            args = self.encoder_args()
+            return {'codec': args[args.index("-c:v") + 1], 'args': args, 'budget_seconds': round(budget, 1),
+                    'unprofiled': unprofiled}
+
+        timeline = build_timeline(durations, effects, transition_duration)
+        counts = self.timeline_frame_counts(timeline)
+        still_frames = sum(frames for piece, frames in zip(timeline, counts) if piece['type'] == 'hold')
+        ladder = self.rendition_ladder(width, height, os.path.join(self.temp_dir, "output.mp4"))
+        if ladder:
+            # 各规格一起编码，按像素总数计算
+            width, height = ladder.pixels(), 1
+        share = available_share()
+        encoder, preset, seconds = select_encoder(name, self.config['video_quality'], profiler,
+                                                  width, height, sum(counts), still_frames, budget, share)
+        self.encoder_choice = (encoder, preset)
+        if seconds is None:
+            log(f"编码速度达不到目标(预算{budget:.1f}秒)，使用{encoder.name}最快的预设{preset}")
+        else:
+            log(f"编码器：{encoder.name}，预设{preset}，预计编码{seconds:.1f}秒(预算{budget:.1f}秒，"
+                     f"可用CPU约{share:.0%})")
+        self.metrics.annotate(encoder=encoder.name, encoder_preset=preset)
+        return {'codec': encoder.name, 'preset': preset, 'args': self.encoder_args(),
+                'budget_seconds': round(budget, 1),
+                'predicted_seconds': round(seconds, 1) if seconds is not None else None,
+                'cpu_share': round(share, 2)}
+
+    def rendition_ladder(self, width, height, output_video):
+        names = parse_list(self.config['renditions'])
+        if not names or not (width and height):
+            return None
+        return RenditionLadder(names, parse_list(self.config['stream_formats']) or ["mp4"], width, height,
+                               self.encoder_args(), float(self.config['fps']),
+                               float(self.config['hls_segment_seconds']), output_video)
+
+    def build_encode_command(self, image_files, durations, effects, transition_duration, width, height,
+                             audio_track, subtitle_path, total_duration, output_video,
+                             dry_run=False, ladder=None, background=None):
+        # 单次编码模式的完整命令，返回(命令, FrameStreamer或None)；dry_run时不写入拼接列表
+        # background为(背景视频, 输出宽, 输出高)，此时width和height为幻灯片区域的尺寸
+        fps = float(self.config['fps'])
+        streamer = None
+        base_filter = f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black"
+        if self.config['encode_mode'] == "pipe":
+            # 流式模式：图片在Python中解码缩放一次，转场帧也在Python中合成，直接送入ffmpeg
+            streamer = FrameStreamer(image_files, durations, width, height, fps,
+                                     effects=effects, transition_duration=transition_duration)
+            video_input = streamer.input_args()
+            video_filter = "[0:v]null[vout]"
+        elif any(effects):
+            # 每页作为单独的循环图片输入，逐个边界串联xfade
+            input_durations, video_filter = build_xfade_graph(durations, effects, transition_duration,
+                                                              base_filter, fps)
+            video_input = []
+            for image_path, input_duration in zip(image_files, input_durations):
+                video_input += ["-loop", "1", "-framerate", f"{fps:g}", "-t", f"{input_duration:g}",
+                                "-i", image_path]
+        else:
+            if dry_run:
+                input_list = os.path.join(self.temp_dir, "input.txt")
+            else:
+                input_list = self.write_concat_list(image_files, durations)
+            video_input = ["-f", "concat", "-safe", "0", "-i", input_list]
+            # 拼接列表输入没有固定帧率，按配置的帧率输出
+            video_filter = f"[0:v]{base_filter},fps={fps:g}[vout]"
+        if background:
+            video_input += ["-stream_loop", "-1", "-i", background[0]]
+            video_filter = (video_filter[:-len("[vout]")] + "[slides];" +
+                            background_filter(video_input.count("-i") - 1, "slides", "vout"))
+            width, height = background[1], background[2]
+        if subtitle_path:
+            # 烧录字幕接在视频滤镜链末尾
+            video_filter = video_filter[:-len("[vout]")] + f",{subtitles_filter(subtitle_path)}[vout]"
+
+        # 音轨排在视频输入之后，已单独编码，直接复制
+        audio_map = f"{video_input.count('-i')}:a" if audio_track else None
+        audio_input = ["-i", audio_track] if audio_track else []
+
+        # 构建filter_complex
+        def build_filter_complex():
+            filters = [video_filter]
+            if ladder:
+                filters.append(ladder.video_filter("vout"))
+            return ";".join(filters)
+
+        # 构建FFmpeg命令
+        cmd = ["ffmpeg", "-y"] + video_input + audio_input
+        cmd += ["-filter_complex", build_filter_complex()]
+        if ladder:
+            return cmd + ladder.output_args(audio_map, total_duration), streamer
+        cmd += ["-map", "[vout]"]
+        if audio_map:
+            cmd += ["-map", audio_map, "-c:a", "copy"]
+        encoder_args = self.encoder_args()
+        if self.config['intro_video'] or self.config['outro_video']:
+            # 与片头片尾使用相同的编码参数才能流复制拼接
+            cmd += video_codec_args(encoder_args, width, height)
+        else:
+            cmd += encoder_args + video_stream_args(encoder_args, width, height)
+        cmd += [
+            "-t", f"{total_duration:g}",
+            output_video
+        ]
+        return cmd, streamer
+
+    def finish_output(self, output_video, output_path, cues=None, ladder=None, has_audio=False):
+        # 烧录字幕时同样附带软字幕轨和字幕文件，播放器可以关闭软字幕
+        # 多规格输出时各MP4都附带软字幕轨，HLS和DASH只有音视频
+        subtitle_path = None
+        video_paths = ladder.mp4_paths() if ladder else [output_video]
+        if ladder:
+            ladder.write_master_playlist(has_audio)
+        if cues:
+            subtitle_path = write_srt(cues, os.path.join(self.temp_dir, "output.srt"))
+            for video_path in video_paths:
+                self.mux_subtitles(video_path, subtitle_path)
+        if output_path:
+            handoff(output_video, output_path)
+            for suffix in (ladder.extra_outputs() if ladder else []):
+                target = os.path.splitext(output_path)[0] + suffix
+                if os.path.isdir(ladder.base + suffix):
+                    handoff_tree(ladder.base + suffix, target)
+                else:
+                    handoff(ladder.base + suffix, target)
+            if subtitle_path:
+                shutil.copy2(subtitle_path, os.path.splitext(output_path)[0] + ".srt")
+            return output_path
+        return output_video
+
+    def mux_subtitles(self, video_path, subtitle_path):
+        # 音视频流直接复制，只替换字幕轨，修改文案后毫秒级完成
+        root, ext = os.path.splitext(video_path)
+        tmp_path = f"{root}.subtitles{ext}"
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", video_path,
+            "-i", subtitle_path,
+            "-map", "0:v", "-map", "0:a?", "-map", "1:s",
+            "-c", "copy", "-c:s", "mov_text",
+            "-metadata:s:s:0", "language=chi",
+            tmp_path
+        ]
+        self.run_ffmpeg(cmd, "字幕合成失败", progress=False)
+        os.replace(tmp_path, video_path)
+
+    def update_subtitles(self, ppt_path, video_path):
+        # 按上次转换记录的时间安排和当前文案重新生成字幕，不重新编码
+        schedule = self.load_schedule(ppt_path)
+        if schedule is None:
+            raise Exception("未找到该PPT的转换记录，请先转换PPT")
+        if not os.path.exists(self.text_file):
+            raise Exception(f"未找到文案文件：{self.text_file}")
+        if read_text_source(self.text_file) != file_hash(ppt_path):
+            # 其他PPT的文案，或PPT在转换之后修改过，字幕会与画面对不上
+            raise Exception(f"文案文件不是从当前PPT提取的，请重新转换该PPT：{self.text_file}")
+        cues = offset_cues(build_cues(read_slide_texts(self.text_file), schedule['durations']),
+                           schedule.get('offset', 0.0))
+        if not cues:
+            raise Exception("文案中没有可用的字幕内容")
+        subtitle_path = write_srt(cues, os.path.splitext(video_path)[0] + ".srt")
+        self.mux_subtitles(video_path, subtitle_path)
+        return subtitle_path
+
+    def transition_seed(self, ppt_path):
+        # 随机转场使用固定种子，重新生成时各边界的效果不变，已编码的转场分段可以复用
+        if self.config['transition_seed']:
+            return str(self.config['transition_seed'])
+        return os.path.basename(ppt_path)
+
+    def encode_segments(self, ppt_path, image_files, durations, effects, transition_duration,
+                        width, height, audio_track, burn_cues, output_video, ladder=None, background=None):
+        cache = None
+        manifest = None
+        if self.config['segment_cache']:
+            cache = FileCache(os.path.join(self.cache_dir, "segments"),
+                              int(float(self.config['segment_cache_size_mb']) * 1024 * 1024))
+            # 预览的分段参数不同，使用单独的构建记录，不影响正式转换的增量对比
+            manifest = BuildManifest(self.build_manifest_path(ppt_path,
+                                                              ".preview.json" if self.config['preview'] else ".json"))
+        encoder = SegmentEncoder(self, width, height, self.encoder_args(),
+                                 float(self.config['hold_fps']),
+                                 float(self.config['fps']),
+                                 os.path.join(self.temp_dir, "segments"),
+                                 int(self.config['encode_workers'] or 0) or None,
+                                 cache, manifest)
+        encoder.add_slides(image_files, durations, effects, transition_duration, burn_cues)
+        segment_paths = encoder.build()
+        video_only = os.path.join(self.temp_dir, "video.mp4")
+        encoder.concat(segment_paths, video_only, sum(durations))
+        if ladder:
+            self.encode_renditions(video_only, audio_track, sum(durations), ladder, background)
+        elif background:
+            self.composite_background(video_only, audio_track, sum(durations), background, output_video)
+        else:
+            self.mux_audio(video_only, audio_track, output_video)
+
+    def prepare_assets(self, width, height, has_audio):
+        # 返回{'intro', 'outro', 'background': 转码后的路径或None, 'offset': 片头时长}
+        assets = {'intro': None, 'outro': None, 'background': None, 'offset': 0.0}
+        sources = {'intro': self.config['intro_video'], 'outro': self.config['outro_video'],
+                   'background': self.config['background_video']}
+        if not any(sources.values()):
+            return assets
+        cache = FileCache(os.path.join(self.cache_dir, "assets"),
+                          int(float(self.config['asset_cache_size_mb']) * 1024 * 1024))
+        normalizer = AssetNormalizer(self, cache, width, height, float(self.config['fps']),
+                                     self.encoder_args(), has_audio,
+                                     os.path.join(self.temp_dir, "assets"))
+        for kind, source in sources.items():
+            if source:
+                assets[kind] = normalizer.prepare(source, kind)
+        if assets['intro']:
+            assets['offset'] = probe_media(assets['intro'])['duration'] or 0.0
+        return assets
+
+    def join_assets(self, output_video, assets):
+        if not (assets['intro'] or assets['outro']):
+            return
+        clips = [path for path in (assets['intro'], output_video, assets['outro']) if path]
+        joined = os.path.splitext(output_video)[0] + ".joined.mp4"
+        with self.metrics.stage("join"):
+            join_clips(self, clips, joined)
+            os.replace(joined, output_video)
+
+    def composite_background(self, video_path, audio_track, total_duration, background, output_video):
+        # 拼接好的幻灯片画面叠加到背景视频上，音轨直接复制
+        background_path, width, height = background
+        cmd = ["ffmpeg", "-y", "-i", video_path, "-stream_loop", "-1", "-i", background_path]
+        if audio_track:
+            cmd += ["-i", audio_track]
+        cmd += ["-filter_complex", background_filter(1, "0:v", "vout"), "-map", "[vout]"]
+        if audio_track:
+            cmd += ["-map", "2:a", "-c:a", "copy"]
+        cmd += video_codec_args(self.encoder_args(), width, height) + [
+            "-t", f"{total_duration:g}",
+            output_video
+        ]
+        self.run_ffmpeg(cmd, "背景视频合成失败", duration=total_duration)
+
+    def build_manifest_path(self, ppt_path, suffix=".json"):
+        job_id = hashlib.md5(os.path.abspath(ppt_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, "builds", job_id + suffix)
+
+    def save_schedule(self, ppt_path, durations, offset=0.0):
+        # offset为正片之前片头的时长
+        path = self.build_manifest_path(ppt_path, ".schedule.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'durations': durations, 'offset': offset}, f)
+
+    def load_schedule(self, ppt_path):
+        path = self.build_manifest_path(ppt_path, ".schedule.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def text_is_stale(self, ppt_path):
+        # 文案中记录的PPT哈希与当前PPT不同(其他PPT的文案，或PPT修改过)时需要重新提取
+        if not os.path.exists(self.text_file):
+            return True
+        if read_text_source(self.text_file) != file_hash(ppt_path):
+            self.log(f"文案不是从当前PPT提取的，重新提取：{self.text_file}")
+            return True
+        return False
+
+    def prepare_narration(self, count):
+        self.report_progress("narration")
+        narrator = Narrator(self.config['tts_engine'], self.config['tts_voice'], self.config['tts_rate'],
+                            os.path.join(self.cache_dir, "tts"),
+                            int(float(self.config['tts_cache_size_mb']) * 1024 * 1024),
+                            int(self.config['tts_workers'] or 0) or None)
+        clips = narrator.synthesize(read_slide_texts(self.text_file), count, self.temp_dir, self.log)
+        durations = narration_durations(clips, float(self.config['slide_duration']),
+                                        float(self.config['narration_padding']))
+        track = build_narration_track(clips, durations, os.path.join(self.temp_dir, "narration.wav"))
+        return durations, track
+
+    def prepare_audio(self, bgm_path, narration_track, total_duration, start_time=0.0):
+        # 背景音乐循环或截断到整个时间线，响度归一化后与配音混合，单独编码一次，之后各步骤直接复制
+        # start_time为预览的起始时间，只输出从该时间开始的部分
+        audio_input, audio_filter = self.build_audio_filter(bgm_path, narration_track, 0, total_duration)
+        if not audio_filter:
+            return None
+        track = os.path.join(self.temp_dir, "audio.m4a")
+        cmd = ["ffmpeg", "-y"] + audio_input + [
+            "-filter_complex", audio_filter,
+            "-map", "[aout]",
+            "-c:a", "aac", "-b:a", AUDIO_BITRATE
+        ]
+        if start_time:
+            cmd += ["-ss", f"{start_time:g}"]
+        cmd += [
+            "-t", f"{total_duration - start_time:g}",
+            track
+        ]
+        self.run_ffmpeg(cmd, "音频合成失败", duration=total_duration - start_time, stage="audio")
+        return track
+
+    def bgm_loudnorm(self, bgm_path):
+        # 第一遍的响度测量按文件哈希缓存，返回第二遍使用的loudnorm滤镜
+        if not self.config['bgm_loudness']:
+            return ""
+        target = float(self.config['bgm_loudness'])
+        analyzer = LoudnessAnalyzer(self, os.path.join(self.cache_dir, "loudness"))
+        return loudnorm_filter(target, analyzer.measure(bgm_path, target))
+
+    def build_audio_filter(self, bgm_path, narration_track, first_index, total_duration):
+        # 返回(音频输入参数, 输出[aout]的滤镜)；有配音时背景音乐在配音处自动压低
+        # 背景音乐在输入端循环并按时间线截断，较长的音乐不会被完整解码；末尾补静音，输出时截到总时长
+        inputs = []
+        filters = []
+        bgm_label = None
+        if bgm_path:
+            inputs += ["-stream_loop", "-1", "-t", f"{total_duration:g}", "-i", bgm_path]
+            normalize = self.bgm_loudnorm(bgm_path)
+            filters.append(f"[{first_index}:a]{normalize + ',' if normalize else ''}"
+                           f"aresample=44100,aformat=channel_layouts=stereo,"
+                           f"volume={self.config['bgm_volume']},"
+                           f"afade=t=out:st={max(0, total_duration - 3):g}:d={min(3, total_duration):g}[bgm]")
+            bgm_label = "bgm"
+            first_index += 1
+
+        if narration_track is None:
+            if bgm_label is None:
+                return inputs, ""
+            filters[-1] = filters[-1][:-len("[bgm]")] + ",apad[aout]"
+            return inputs, ";".join(filters)
+
+        inputs += ["-i", narration_track]
+        narration_filter = f"[{first_index}:a]aresample=44100,aformat=channel_layouts=stereo"
+        if bgm_label is None:
+            filters.append(f"{narration_filter},apad[aout]")
+        elif self.config['bgm_duck']:
+            filters.append(f"{narration_filter},asplit=2[voice][sidechain]")
+            filters.append("[bgm][sidechain]sidechaincompress=threshold=0.02:ratio=8:attack=20:release=400[ducked]")
+            filters.append("[ducked][voice]amix=inputs=2:duration=longest:normalize=0,apad[aout]")
+        else:
+            filters.append(f"{narration_filter}[voice]")
+            filters.append("[bgm][voice]amix=inputs=2:duration=longest:normalize=0,apad[aout]")
+        return inputs, ";".join(filters)
+
+    def mux_audio(self, video_path, audio_track, output_video):
+        # 音视频流都直接复制
+        if not audio_track:
+            shutil.move(video_path, output_video)
+            return
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", video_path,
+            "-i", audio_track,
+            "-map", "0:v", "-map", "1:a",
+            "-c", "copy",
+            output_video
+        ]
+        self.run_ffmpeg(cmd, "音频合成失败", progress=False)
+
+    def encode_renditions(self, video_path, audio_track, total_duration, ladder, background=None):
+        # 拼接好的分段视频解码一次，缩放为各规格后编码，音轨直接复制到所有输出
+        video_input = ["-i", video_path]
+        filters = [ladder.video_filter("0:v")]
+        if background:
+            video_input += ["-stream_loop", "-1", "-i", background[0]]
+            filters = [background_filter(1, "0:v", "composed"), ladder.video_filter("composed")]
+        audio_map = None
+        if audio_track:
+            audio_map = f"{video_input.count('-i')}:a"
+            video_input += ["-i", audio_track]
+        cmd = ["ffmpeg", "-y"] + video_input + ["-filter_complex", ";".join(filters)]
+        cmd += ladder.output_args(audio_map, total_duration)
+        self.run_ffmpeg(cmd, "多规格编码失败", duration=total_duration)
+
+    def preview_start(self, count):
+        # 预览的起始页下标(从0开始)，非预览时为0
+        if not self.config['preview']:
+            return 0
+        start = int(self.config['preview_start'] or 1)
+        if not 1 <= start <= count:
+            raise Exception(f"预览起始页超出范围：第{start}页，共{count}页")
+        return start - 1
+
+    def list_slide_images(self, image_dir):
+        image_files = [f for f in os.listdir(image_dir) if f.startswith('slide_') and f.endswith('.png')]
+        image_files.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
+        return [os.path.abspath(os.path.join(image_dir, f)) for f in image_files]
+
+    def slide_durations(self, count):
+        # 最后一帧持续1秒
+        return [float(self.config['slide_duration'])] * (count - 1) + [1.0]
+
+    def write_concat_list(self, image_files, durations):
+        input_list = os.path.join(self.temp_dir, "input.txt")
+        with open(input_list, "w", encoding="utf-8") as f:
+            for image_path, duration in zip(image_files, durations):
+                image_path = image_path.replace('\\', '/')
+                f.write(f"file '{image_path}'\n")
+                f.write(f"duration {duration:g}\n")
+            if image_files:
+                # concat demuxer不使用最后一项的duration，重复最后一项才能保持其停留时间，
+                # 否则视频比音轨短，与片头片尾流复制拼接后音画错位
+                f.write(f"file '{image_path}'\n")
+        return input_list
+
+    def run_ffmpeg(self, cmd, error_message="FFmpeg执行失败", stdin_feeder=None, progress=True,
+                   duration=None, stage="encode", output_lines=None):
+        # 运行FFmpeg并记录日志，stdin_feeder在独立线程中向ffmpeg标准输入写数据
+        # 在工作线程中调用时progress需为False，进度由主线程汇报
+        # duration为输出时长，用于把ffmpeg的-progress输出换算为百分比；output_lines为列表时收集ffmpeg的日志输出
+        self.check_cancelled()
+        cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+        with open(self.log_file, 'a', encoding='utf-8') as log:
+            log.write(" ".join(cmd) + "\n")
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE if stdin_feeder else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            with self.process_lock:
+                self.processes.add(process)
+            feeder = None
+            if stdin_feeder:
+                feeder = threading.Thread(target=stdin_feeder, args=(process.stdin,), daemon=True)
+                feeder.start()
+            stats = {}
+            started = time.perf_counter()
+            reader = threading.Thread(target=self.read_ffmpeg_progress,
+                                      args=(process.stdout, duration, stage if progress else None, stats),
+                                      daemon=True)
+            reader.start()
+
+            try:
+                stderr = io.TextIOWrapper(process.stderr, encoding='utf-8', errors='replace')
+                for output in stderr:
+                    log.write(output)
+                    log.flush()
+                    if output_lines is not None:
+                        output_lines.append(output)
+                process.wait()
+                reader.join()
+                if feeder:
+                    feeder.join()
+            finally:
+                with self.process_lock:
+                    self.processes.discard(process)
+            self.metrics.record_ffmpeg(os.path.basename(cmd[-1]), time.perf_counter() - started, stats, duration)
+
+            self.check_cancelled()
+            if process.returncode != 0:
+                raise Exception(error_message)
+
+    def read_ffmpeg_progress(self, stdout, duration, stage, stats=None):
+        # 解析-progress输出的key=value，每个progress=行汇报一次；stats中保留最后一次的帧数、fps和speed
+        values = {}
+        for line in io.TextIOWrapper(stdout, encoding='utf-8', errors='replace'):
+            key, _, value = line.strip().partition('=')
+            if key != 'progress':
+                values[key] = value
+                continue
+            if stats is not None:
+                stats.update(parse_progress_stats(values))
+            if stage is None:
+                continue
+            try:
+                out_time = int(values.get('out_time_us') or values.get('out_time_ms') or 0) / 1000000
+            except ValueError:
+                out_time = 0.0
+            try:
+                fps = float(values.get('fps', 0))
+            except ValueError:
+                fps = 0.0
+            try:
+                speed = float(values.get('speed', '0').rstrip('x'))
+            except ValueError:
+                speed = 0.0
+            if duration:
+                out_time = min(max(out_time, 0.0), duration)
+            self.report_progress(stage, out_time if duration else None, duration, fps=fps, speed=speed)
+
+    def create_renderer(self):
+        workers = int(self.config['render_workers'] or 0) or None
+        if self.config['renderer_pool']:
+            # 常驻实例在同一进程的多次转换间复用；无法启动时退回每次单独启动
+            try:
+                return get_pooled_renderer(self.config['renderer'], _render_lock, workers,
+                                           int(self.config['renderer_pool_size'] or 0) or None,
+                                           int(self.config['renderer_max_documents']),
+                                           float(self.config['renderer_max_memory_mb']),
+                                           float(self.config['render_timeout']))
+            except Exception as e:
+                self.log(f"渲染器池不可用，改为单独启动：{str(e)}")
+        renderer = get_renderer(self.config['renderer'], _render_lock, workers)
+        renderer.timeout = float(self.config['render_timeout'])
+        return renderer
+
+    def render_slides(self, ppt_path, output_dir):
+        renderer = self.create_renderer()
+        self.renderer = renderer
+        if self.cancel_event.is_set():
+            renderer.cancel()
+        keys = None
+        self.metrics.annotate(renderer=renderer.name)
+        if self.config['render_cache']:
+            width, height = self.get_resolution()
+            keys = slide_cache_keys(ppt_path, f"{renderer.name}|{width}x{height}")
+        if keys is None:
+            self.convert_ppt_to_images(renderer, ppt_path, output_dir)
+            return
+
+        cache = FileCache(os.path.join(self.cache_dir, "slides"),
+                          int(float(self.config['cache_size_mb']) * 1024 * 1024))
+        missing = []
+        for i, key in enumerate(keys, 1):
+            if not cache.fetch(key, ".png", os.path.join(output_dir, f"slide_{i}.png")):
+                missing.append(i)
+        self.log(f"渲染缓存命中 {len(keys) - len(missing)}/{len(keys)} 页")
+        self.metrics.annotate(cache_hits=len(keys) - len(missing))
+
+        if missing:
+            self.convert_ppt_to_images(renderer, ppt_path, output_dir, missing)
+            for i in missing:
+                cache.put(keys[i - 1], os.path.join(output_dir, f"slide_{i}.png"), ".png")
+            cache.evict()
+
+    def convert_ppt_to_images(self, renderer, ppt_path, output_dir, slide_indices=None):
+        width, height = self.get_resolution()
+        self.report_progress("render", 0, len(slide_indices) if slide_indices else 0)
+        # 记录每一页完成时距渲染开始的秒数(LibreOffice先整体导出PDF，之后各页并行栅格化)
+        started = time.perf_counter()
+        slide_done_at = []
+
+        def on_progress(done, total):
+            slide_done_at.append(round(time.perf_counter() - started, 3))
+            self.report_progress("render", done, total)
+
+        try:
+            renderer.render(ppt_path, output_dir, slide_indices, width, height, on_progress)
+        except Exception as e:
+            self.check_cancelled()
+            raise Exception(f"转换PPT到图片失败：{str(e)}")
+        finally:
+            self.metrics.annotate(rendered=len(slide_done_at), slide_done_at=slide_done_at)
+
+    def extract_text_from_ppt(self, ppt_path):
+        # 直接解析压缩包中的幻灯片和备注XML，包括组合形状、表格和演讲者备注
+        output_file = self.text_file
+        try:
+            slides = extract_slides(ppt_path, int(self.config['extract_workers'] or 0) or None)
+            text_extracted = False
+            source = SOURCE_PREFIX + file_hash(ppt_path) + "\n"
+
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(source)
+                for i, slide in enumerate(slides, 1):
+                    f.write(f"=== 第{i}页 ===\n")
+                    content = slide_content(slide)
+                    if content:
+                        f.write(content + '\n')
+                        text_extracted = True
+                    if slide['notes']:
+                        f.write(NOTES_HEADER + '\n' + '\n'.join(slide['notes']) + '\n')
+                        text_extracted = True
+                    f.write('\n')
+
+            if not text_extracted:
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    f.write(source + "未检测到PPT中的文本内容\n")
+
+        except Exception as e:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(f"提取文本时发生错误: {str(e)}\n")
+
+    def get_max_slide_dimensions(self, temp_dir):
+        max_width = 0
+        max_height = 0
+        for file in os.listdir(temp_dir):
+            if file.startswith("slide_") and file.endswith(".png"):
+                with Image.open(os.path.join(temp_dir, file)) as img:
+                    width, height = img.size
+                    max_width = max(max_width, width)
+                    max_height = max(max_height, height)
+
+        # 确保尺寸为偶数
+        max_width = max_width + (max_width % 2)
+        max_height = max_height + (max_height % 2)
+
+        return max_width, max_height
+
+
+def deck_text_file(ppt_path, directory=None):
+    # 每个PPT使用各自的文案文件<PPT名>_content.txt
+    stem = os.path.splitext(os.path.basename(ppt_path))[0]
+    return os.path.join(directory or os.getcwd(), stem + "_content.txt")
+
+
+def _deck_converter(ppt_path, temp_dir, output_path=None, config=None, progress_callback=None, cache_dir=None):
+    # temp_dir为job_workspace分配的工作目录，由调用方负责删除
+    stem = os.path.splitext(os.path.basename(ppt_path))[0]
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(os.path.abspath(ppt_path)), stem + _output_suffix(config))
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    # 预览使用单独的日志和运行报告，不覆盖正式转换的；文案与正式转换共用
+    run_name = stem + ("_preview" if (config or {}).get('preview') else "")
+
+    # 每个PPT使用独立的日志和文案文件，避免并行任务互相覆盖
+    converter = PPTConverter(
+        config=config,
+        temp_dir=temp_dir,
+        log_file=os.path.join(output_dir, run_name + "_ffmpeg_log.txt"),
+        text_file=deck_text_file(ppt_path, output_dir),
+        progress_callback=progress_callback,
+        cache_dir=cache_dir,
+        report_file=os.path.join(output_dir, run_name + "_report.json")
+    )
+    return converter, output_path
+
+
+def job_workspace(ppt_path, config=None, work_dir=None):
+    # 每次转换使用独立的工作目录，同一个PPT同时转换也互不影响；开启内存盘且空间足够时放在/dev/shm
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    stem = os.path.splitext(os.path.basename(ppt_path))[0]
+    ram_root = None
+    required_bytes = None
+    if config['ram_workspace']:
+        ram_root = os.path.join(RAM_ROOT, "ppt2video")
+        width, height = 0, 0
+        if config['resolution'] != "自动":
+            width, height = map(int, config['resolution'].split('x'))
+        required_bytes = estimate_workspace_bytes(ppt_path, float(config['slide_duration']), width, height)
+    return Workspace(work_dir or os.path.join(os.getcwd(), "TEMP"), stem, ram_root, required_bytes)
+
+
+def convert_deck(ppt_path, bgm_path=None, output_path=None, config=None, work_dir=None, progress_callback=None,
+                 cache_dir=None):
+    with job_workspace(ppt_path, config, work_dir) as workspace:
+        converter, output_path = _deck_converter(ppt_path, workspace.path, output_path, config, progress_callback,
+                                                 cache_dir)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        return converter.convert(ppt_path, bgm_path, output_path)
+
+
+def plan_deck(ppt_path, bgm_path=None, output_path=None, config=None, work_dir=None):
+    # 与convert_deck分配相同的工作目录(包括是否放在内存盘上)，计划中的命令使用实际转换时的路径
+    with job_workspace(ppt_path, config, work_dir) as workspace:
+        converter, output_path = _deck_converter(ppt_path, workspace.path, output_path, config)
+        plan = converter.plan_job(ppt_path, bgm_path)
+    plan['output'] = output_path
+    return plan
+
+
+def collect_jobs(inputs, bgm_path=None):
+    # 支持PPT文件、目录以及清单文件(.txt每行一个路径，.json为路径或对象列表)
+    jobs = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                if name.lower().endswith(PPT_EXTENSIONS) and not name.startswith("~$"):
+                    jobs.append({'ppt': os.path.join(item, name), 'bgm': bgm_path})
+        elif item.lower().endswith('.json'):
+            base = os.path.dirname(os.path.abspath(item))
+            with open(item, 'r', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    if isinstance(entry, str):
+                        entry = {'ppt': entry}
+                    job = dict(entry)
+                    job['ppt'] = os.path.join(base, job['ppt'])
+                    if job.get('bgm'):
+                        job['bgm'] = os.path.join(base, job['bgm'])
+                    else:
+                        job['bgm'] = bgm_path
+                    jobs.append(job)
+        elif item.lower().endswith('.txt'):
+            base = os.path.dirname(os.path.abspath(item))
+            with open(item, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        jobs.append({'ppt': os.path.join(base, line), 'bgm': bgm_path})
+        else:
+            jobs.append({'ppt': item, 'bgm': bgm_path})
+    return jobs
+
+
+def _init_worker(render_lock):
+    global _render_lock
+    _render_lock = render_lock
+
+
+def _output_suffix(config):
+    return "_preview.mp4" if (config or {}).get('preview') else ".mp4"
+
+
+def _job_output_path(job, output_dir, config=None):
+    stem = os.path.splitext(os.path.basename(job['ppt']))[0]
+    return job.get('output') or os.path.join(output_dir, stem + _output_suffix(_job_config(job, config)))
+
+
+def _job_config(job, config):
+    job_config = dict(config or {})
+    job_config.update(job.get('config', {}))
+    return job_config
+
+
+def _run_job(job, output_dir, config, work_dir):
+    start = time.time()
+    output_path = _job_output_path(job, output_dir, config)
+    try:
+        convert_deck(job['ppt'], job.get('bgm'), output_path, _job_config(job, config), work_dir)
+        return {'ppt': job['ppt'], 'output': output_path, 'ok': True,
+                'error': None, 'seconds': time.time() - start}
+    except Exception as e:
+        return {'ppt': job['ppt'], 'output': output_path, 'ok': False,
+                'error': str(e), 'seconds': time.time() - start}
+
+
+def batch_convert(jobs, output_dir, config=None, workers=None, work_dir=None, on_result=None):
+    workers = workers or os.cpu_count() or 1
+    results = []
+    with multiprocessing.Manager() as manager:
+        render_lock = manager.Lock()
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(render_lock,)) as executor:
+            futures = [executor.submit(_run_job, job, output_dir, config, work_dir) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if on_result:
+                    on_result(result)
+    return results
+
+
+def plan_jobs(jobs, output_dir, config=None, work_dir=None):
+    # 只读取PPTX包生成每个任务的计划和成本估算，供调度器分配任务，不渲染也不编码
+    plans = []
+    for job in jobs:
+        try:
+            plans.append(plan_deck(job['ppt'], job.get('bgm'), _job_output_path(job, output_dir, config),
+                                   _job_config(job, config), work_dir))
+        except Exception as e:
+            plans.append({'ppt': job['ppt'], 'output': _job_output_path(job, output_dir, config), 'error': str(e)})
+    return plans
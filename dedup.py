@@ -0,0 +1,104 @@
+from PIL import Image
+
+from cache import file_hash
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# 默认只合并文件内容完全相同的相邻页(重复的章节页等)
+# 指定阈值时再用感知哈希找近似页：缩小为灰度图做二维DCT，取低频8x8系数与中值比较得到64位指纹；
+# 缩小后的指纹分辨不出文字，标题栏相同、正文不同的页距离也很小，所以近似页还要按原分辨率逐像素确认
+HASH_SAMPLE_SIZE = 32
+HASH_SIZE = 8
+
+# 灰度差超过PIXEL_TOLERANCE的像素视为不同(抗锯齿、压缩噪声以内的差异忽略)，
+# 不同的像素不超过MAX_CHANGED_PIXELS比例时才确认为近似页；改动一行小字的页也会超过该比例
+PIXEL_TOLERANCE = 16
+MAX_CHANGED_PIXELS = 0.0001
+
+
+def dct_matrix(size):
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def load_samples(image_paths):
+    samples = np.empty((len(image_paths), HASH_SAMPLE_SIZE, HASH_SAMPLE_SIZE), dtype=np.float32)
+    for i, image_path in enumerate(image_paths):
+        with Image.open(image_path) as img:
+            samples[i] = np.asarray(img.convert("L").resize((HASH_SAMPLE_SIZE, HASH_SAMPLE_SIZE),
+                                                            Image.LANCZOS), dtype=np.float32)
+    return samples
+
+
+def perceptual_hashes(image_paths):
+    # 返回(页数, 64)的布尔数组，所有页的DCT在一次矩阵乘法中完成
+    if not image_paths:
+        return np.zeros((0, HASH_SIZE * HASH_SIZE), dtype=bool)
+    dct = dct_matrix(HASH_SAMPLE_SIZE)
+    coefficients = dct @ load_samples(image_paths) @ dct.T
+    low = coefficients[:, :HASH_SIZE, :HASH_SIZE].reshape(len(image_paths), -1)
+    # 直流分量只反映整体亮度，不参与中值计算
+    median = np.median(low[:, 1:], axis=1)
+    return low > median[:, None]
+
+
+def neighbour_distances(hashes):
+    # 相邻两页指纹的汉明距离
+    return np.count_nonzero(hashes[1:] != hashes[:-1], axis=1)
+
+
+def changed_pixel_ratio(first_path, second_path):
+    # 原分辨率下灰度差超过容差的像素比例，尺寸不同时为1
+    with Image.open(first_path) as first, Image.open(second_path) as second:
+        if first.size != second.size:
+            return 1.0
+        first_pixels = np.asarray(first.convert("L"), dtype=np.int16)
+        second_pixels = np.asarray(second.convert("L"), dtype=np.int16)
+    return float(np.count_nonzero(np.abs(first_pixels - second_pixels) > PIXEL_TOLERANCE)) / first_pixels.size
+
+
+def duplicate_groups(image_paths, threshold=None, image_hashes=None):
+    # 返回连续重复页的分组[[页下标]]；image_hashes为各页的文件哈希，未提供时在此计算
+    # threshold为None时只合并文件内容完全相同的相邻页；指定时感知哈希距离不超过threshold、
+    # 且原分辨率下几乎没有像素不同的相邻页也并入前一组
+    if not image_paths:
+        return []
+    if image_hashes is None:
+        image_hashes = [file_hash(image_path) for image_path in image_paths]
+    distances = None
+    if threshold is not None:
+        if np is None:
+            raise Exception("未安装numpy，无法按感知哈希合并近似页")
+        distances = neighbour_distances(perceptual_hashes(image_paths))
+    groups = [[0]]
+    for i in range(1, len(image_paths)):
+        same = image_hashes[i] == image_hashes[i - 1]
+        if not same and distances is not None and distances[i - 1] <= threshold:
+            same = changed_pixel_ratio(image_paths[i - 1], image_paths[i]) <= MAX_CHANGED_PIXELS
+        if same:
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+    return groups
+
+
+def collapse_timeline(image_files, durations, effects, groups):
+    # 每组使用最后一页的画面(动画分步导出时内容最完整)，停留时间为组内各页之和
+    # 组内的转场去掉，组间保留原来的转场；总时长不变，配音和字幕的时间不受影响
+    collapsed_images = []
+    collapsed_durations = []
+    collapsed_effects = []
+    for group in groups:
+        collapsed_images.append(image_files[group[-1]])
+        collapsed_durations.append(sum(durations[i] for i in group))
+        last = group[-1]
+        if last < len(effects):
+            collapsed_effects.append(effects[last])
+    return collapsed_images, collapsed_durations, collapsed_effects
@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import hashlib
+import platform
+import subprocess
+
+from metrics import write_atomic
+
+
+# 视频编码器：每种编码器提供质量档位(CRF和预设)、线程与分片参数，以及流复制拼接所需的统一流参数
+# 预设按从快到慢排列，越慢压缩率越高
+QUALITY_TIERS = ("预览", "低质量", "中等质量", "高质量")
+
+# 编码速度测试使用的参考分辨率和帧数，测得的fps按像素数换算到实际分辨率
+PROFILE_WIDTH = 1280
+PROFILE_HEIGHT = 720
+PROFILE_FRAMES = 60
+# 单个预设的测试超过该时间时，更慢的预设不再测试(视为达不到任何速度目标)
+PROFILE_TIME_LIMIT = 20.0
+# 其他进程正在测试时最多等待的时间
+PROFILE_LOCK_TIMEOUT = 600
+
+# 静态画面几乎没有残差，编码速度远高于转场帧；plan.py的成本估算使用同一换算
+STILL_FRAME_SPEEDUP = 4.0
+
+
+def h264_level(width, height):
+    # 所有分段使用相同的profile和level，拼接时SPS才一致
+    return "4.1" if width * height <= 1920 * 1088 else "5.1"
+
+
+def log2_tiles(count):
+    # 分片数换算为2的幂次的tile列数参数
+    return max(0, (int(count) - 1).bit_length())
+
+
+class VideoEncoder:
+    name = ""
+    codec = ""
+    # 从快到慢的预设
+    presets = ()
+    # 质量档位 -> (CRF, 预设)
+    tiers = {}
+    # HLS主播放列表中的CODECS
+    hls_codec = ""
+    # MPEG-TS只能封装H.264和H.265，其他编码的HLS分片使用fMP4
+    hls_ts = False
+
+    def quality_args(self, crf, preset):
+        return ["-crf", str(crf), "-preset", preset]
+
+    def tier_args(self, tier, preset=None):
+        # preset不为None时替换档位中的预设(按速度目标选择)，CRF仍按档位
+        crf, tier_preset = self.tiers.get(tier, self.tiers["高质量"])
+        return self.quality_args(crf, preset or tier_preset)
+
+    def thread_args(self, threads=0, slices=0):
+        args = []
+        if threads:
+            args += ["-threads", str(threads)]
+        if slices:
+            args += ["-slices", str(slices)]
+        return args
+
+    def args(self, tier, preset=None, threads=0, slices=0):
+        return ["-c:v", self.codec] + self.tier_args(tier, preset) + self.thread_args(threads, slices)
+
+    def stream_args(self, width, height):
+        # 同一任务中所有需要流复制拼接的文件使用相同的流参数
+        return ["-pix_fmt", "yuv420p"]
+
+    def still_args(self):
+        # 编码静态画面时的额外参数
+        return []
+
+    def hls_codec_for(self, width, height):
+        # 按实际的流参数给出HLS主播放列表中的CODECS
+        return self.hls_codec
+
+    def rate_limit_args(self, index, maxrate, bufsize):
+        # 第index路输出的峰值码率限制
+        return [f"-maxrate:v:{index}", maxrate, f"-bufsize:v:{index}", bufsize]
+
+    def preset_of(self, args):
+        if "-preset" in args:
+            return args[args.index("-preset") + 1]
+        return ""
+
+
+class X264Encoder(VideoEncoder):
+    name = "libx264"
+    codec = "libx264"
+    presets = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+    tiers = {
+        "预览": (30, "ultrafast"),
+        "低质量": (28, "faster"),
+        "中等质量": (23, "medium"),
+        "高质量": (18, "slow")
+    }
+    hls_ts = True
+
+    def stream_args(self, width, height):
+        return ["-profile:v", "high", "-level", h264_level(width, height), "-pix_fmt", "yuv420p"]
+
+    def still_args(self):
+        return ["-tune", "stillimage"]
+
+    def hls_codec_for(self, width, height):
+        # avc1.PPCCLL：high profile(0x64)，level按编码时传入的值，如4.1为0x29
+        level = round(float(h264_level(width, height)) * 10)
+        return f"avc1.6400{level:02x}"
+
+
+class X265Encoder(VideoEncoder):
+    name = "libx265"
+    codec = "libx265"
+    presets = X264Encoder.presets
+    # 相同画质下x265的CRF比x264约高4-6
+    tiers = {
+        "预览": (34, "ultrafast"),
+        "低质量": (32, "faster"),
+        "中等质量": (28, "medium"),
+        "高质量": (23, "slow")
+    }
+    hls_codec = "hvc1.1.6.L120.90"
+    hls_ts = True
+
+    def thread_args(self, threads=0, slices=0):
+        # x265的线程池和分片只能通过-x265-params设置
+        params = []
+        if threads:
+            params.append(f"pools={threads}")
+        if slices:
+            params.append(f"slices={slices}")
+        params.append("log-level=error")
+        return ["-x265-params", ":".join(params)]
+
+    def stream_args(self, width, height):
+        # hvc1标签的MP4才能在Apple设备上播放
+        return ["-tag:v", "hvc1", "-pix_fmt", "yuv420p"]
+
+
+class SvtAv1Encoder(VideoEncoder):
+    name = "libsvtav1"
+    codec = "libsvtav1"
+    # SVT-AV1的预设为数字，越大越快
+    presets = ("12", "10", "8", "6", "4")
+    tiers = {
+        "预览": (45, "12"),
+        "低质量": (40, "10"),
+        "中等质量": (35, "8"),
+        "高质量": (30, "6")
+    }
+    hls_codec = "av01.0.08M.08"
+
+    def thread_args(self, threads=0, slices=0):
+        params = []
+        if threads:
+            params.append(f"lp={threads}")
+        if slices:
+            params.append(f"tile-columns={log2_tiles(slices)}")
+        return ["-svtav1-params", ":".join(params)] if params else []
+
+
+class Vp9Encoder(VideoEncoder):
+    name = "libvpx-vp9"
+    codec = "libvpx-vp9"
+    # 预设为deadline:cpu-used，realtime模式最快，good模式下cpu-used越小越慢
+    presets = ("realtime:8", "good:5", "good:4", "good:3", "good:2", "good:1")
+    tiers = {
+        "预览": (45, "realtime:8"),
+        "低质量": (40, "good:4"),
+        "中等质量": (36, "good:2"),
+        "高质量": (31, "good:1")
+    }
+    hls_codec = "vp09.00.40.08"
+
+    def quality_args(self, crf, preset):
+        # 恒定质量模式需要-b:v 0
+        deadline, cpu_used = preset.split(":")
+        return ["-crf", str(crf), "-b:v", "0", "-deadline", deadline, "-cpu-used", cpu_used]
+
+    def rate_limit_args(self, index, maxrate, bufsize):
+        # 限制峰值码率时需要设置目标码率(受限质量模式)，CRF仍然生效
+        return [f"-b:v:{index}", maxrate] + super().rate_limit_args(index, maxrate, bufsize)
+
+    def thread_args(self, threads=0, slices=0):
+        args = ["-row-mt", "1"]
+        if threads:
+            args += ["-threads", str(threads)]
+        if slices:
+            args += ["-tile-columns", str(log2_tiles(slices))]
+        return args
+
+    def preset_of(self, args):
+        if "-deadline" in args and "-cpu-used" in args:
+            return f"{args[args.index('-deadline') + 1]}:{args[args.index('-cpu-used') + 1]}"
+        return ""
+
+
+ENCODERS = {encoder.name: encoder for encoder in (X264Encoder(), X265Encoder(), SvtAv1Encoder(), Vp9Encoder())}
+
+# 自动选择时按压缩率从高到低尝试
+AUTO_ORDER = ("libsvtav1", "libx265", "libvpx-vp9", "libx264")
+
+ENCODER_NAMES = ["自动"] + list(ENCODERS)
+
+
+def get_encoder(name):
+    if name not in ENCODERS:
+        raise Exception(f"不支持的视频编码器：{name}，可选：{'、'.join(ENCODER_NAMES)}")
+    return ENCODERS[name]
+
+
+def encoder_for_args(args):
+    # 按参数中的-c:v找到编码器，没有时为libx264
+    if "-c:v" in args:
+        return ENCODERS.get(args[args.index("-c:v") + 1], ENCODERS["libx264"])
+    return ENCODERS["libx264"]
+
+
+def video_stream_args(args, width, height):
+    return encoder_for_args(args).stream_args(width, height)
+
+
+_available = None
+
+
+def available_encoders():
+    # 本机ffmpeg编译进的编码器
+    global _available
+    if _available is None:
+        result = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        output = result.stdout.decode('utf-8', errors='replace')
+        names = {line.split()[1] for line in output.splitlines() if len(line.split()) > 1}
+        _available = [name for name in ENCODERS if name in names]
+    return _available
+
+
+def machine_key():
+    # 速度测试结果按机器和ffmpeg版本区分
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    version = result.stdout.decode('utf-8', errors='replace').split("\n", 1)[0]
+    inputs = [platform.node(), platform.machine(), platform.processor(), str(os.cpu_count()), version]
+    return hashlib.sha256("|".join(inputs).encode('utf-8')).hexdigest()[:16]
+
+
+def available_share():
+    # 按系统负载估算本任务能用到的CPU比例，负载高时选择更快的预设
+    if not hasattr(os, "getloadavg"):
+        return 1.0
+    cpus = os.cpu_count() or 1
+    busy = min(os.getloadavg()[0], cpus)
+    return max(0.25, 1.0 - busy / cpus)
+
+
+class EncoderProfiler:
+    # 在本机测一次各编码器各预设的编码速度(参考分辨率下的fps)，结果缓存为JSON，之后直接读取
+    def __init__(self, cache_dir, log=None):
+        self.path = os.path.join(cache_dir, "encoders", machine_key() + ".json")
+        self.log = log or (lambda message: None)
+        self.profile = None
+
+    def load(self):
+        if self.profile is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.profile = json.load(f)
+            except (OSError, ValueError):
+                self.profile = {}
+        return self.profile
+
+    def save(self):
+        write_atomic(self.path, json.dumps(self.profile, indent=2))
+
+    def is_profiled(self, encoder):
+        return encoder.name in self.load()
+
+    def measure_preset(self, encoder, preset):
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size={PROFILE_WIDTH}x{PROFILE_HEIGHT}:rate=25",
+            "-frames:v", str(PROFILE_FRAMES)
+        ] + encoder.args("中等质量", preset) + encoder.stream_args(PROFILE_WIDTH, PROFILE_HEIGHT) + ["-f", "null", "-"]
+        started = time.perf_counter()
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        seconds = time.perf_counter() - started
+        if result.returncode != 0:
+            return None, seconds
+        return round(PROFILE_FRAMES / seconds, 2), seconds
+
+    def measure(self, encoder):
+        # 从最快的预设开始测，某个预设太慢时跳过更慢的
+        fps = {}
+        for preset in encoder.presets:
+            value, seconds = self.measure_preset(encoder, preset)
+            if value is None:
+                break
+            fps[preset] = value
+            if seconds > PROFILE_TIME_LIMIT:
+                break
+        return fps
+
+    def encoder_fps(self, encoder):
+        # 返回{预设: 参考分辨率下的fps}；同一台机器上只测一次，多个进程同时需要时由一个进程测试，其余等待
+        profile = self.load()
+        if encoder.name in profile:
+            return profile[encoder.name]
+        lock_path = f"{self.path}.{encoder.name}.lock"
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        deadline = time.time() + PROFILE_LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                break
+            except FileExistsError:
+                if time.time() > deadline:
+                    # 测试进程可能已被结束，锁文件过期后自己测试；其他等待的进程可能已先删除
+                    try:
+                        os.remove(lock_path)
+                    except FileNotFoundError:
+                        pass
+                    deadline = time.time() + PROFILE_LOCK_TIMEOUT
+                    continue
+                time.sleep(1)
+                self.profile = None
+                profile = self.load()
+                if encoder.name in profile:
+                    return profile[encoder.name]
+        try:
+            self.log(f"测试本机{encoder.name}编码速度...")
+            fps = self.measure(encoder)
+            self.profile = None
+            self.load()[encoder.name] = fps
+            self.save()
+            self.log(f"{encoder.name}编码速度(fps@{PROFILE_WIDTH}x{PROFILE_HEIGHT})：" +
+                     "，".join(f"{preset} {value:g}" for preset, value in fps.items()))
+            return fps
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+
+def weighted_frames(frames, still_frames):
+    # 按转场帧折算的编码帧数
+    return (frames - still_frames) + still_frames / STILL_FRAME_SPEEDUP
+
+
+def predict_seconds(fps, width, height, frames, still_frames, share=1.0):
+    # 按参考分辨率下的fps换算到实际像素数，并按可用CPU比例折算
+    pixels_ratio = width * height / (PROFILE_WIDTH * PROFILE_HEIGHT)
+    return weighted_frames(frames, still_frames) * pixels_ratio / (fps * share)
+
+
+def choose_preset(encoder, fps_profile, width, height, frames, still_frames, budget_seconds, share=1.0):
+    # 返回满足时间预算的最慢(压缩率最高)预设及预计耗时，都不满足时返回None
+    best = None
+    for preset in encoder.presets:
+        if preset not in fps_profile:
+            continue
+        seconds = predict_seconds(fps_profile[preset], width, height, frames, still_frames, share)
+        if seconds <= budget_seconds:
+            best = (preset, seconds)
+    return best
+
+
+def candidate_encoders(name):
+    # select_encoder可能用到速度测试结果的编码器
+    if name != "自动":
+        return [get_encoder(name)]
+    available = available_encoders()
+    return [ENCODERS[candidate] for candidate in AUTO_ORDER if candidate in available or candidate == "libx264"]
+
+
+def select_encoder(name, tier, profiler, width, height, frames, still_frames, budget_seconds, share=1.0):
+    # name为"自动"时按压缩率从高到低选择第一个能以不快于该档位的预设满足预算的编码器，
+    # 都不满足时使用libx264中满足预算的最慢预设，仍不满足时使用libx264最快的预设
+    # 返回(编码器, 预设, 预计耗时或None)
+    if name != "自动":
+        encoder = get_encoder(name)
+        choice = choose_preset(encoder, profiler.encoder_fps(encoder), width, height, frames, still_frames,
+                               budget_seconds, share)
+        if choice is None:
+            return encoder, encoder.presets[0], None
+        return encoder, choice[0], choice[1]
+
+    available = available_encoders()
+    for candidate in AUTO_ORDER:
+        if candidate not in available or candidate == "libx264":
+            continue
+        encoder = ENCODERS[candidate]
+        choice = choose_preset(encoder, profiler.encoder_fps(encoder), width, height, frames, still_frames,
+                               budget_seconds, share)
+        tier_preset = encoder.tiers.get(tier, encoder.tiers["高质量"])[1]
+        if choice and encoder.presets.index(choice[0]) >= encoder.presets.index(tier_preset):
+            return encoder, choice[0], choice[1]
+    encoder = ENCODERS["libx264"]
+    choice = choose_preset(encoder, profiler.encoder_fps(encoder), width, height, frames, still_frames,
+                           budget_seconds, share)
+    if choice is None:
+        return encoder, encoder.presets[0], None
+    return encoder, choice[0], choice[1]
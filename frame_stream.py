@@ -0,0 +1,102 @@
+import queue
+import threading
+
+from PIL import Image
+
+from segments import frame_counts
+from transitions import build_timeline, transition_frame
+
+
+class FrameStreamer:
+    # 每页只解码一次，缩放补边后作为rawvideo写入ffmpeg标准输入
+    # 解码线程与写入线程之间用有界队列衔接，页数再多内存占用也保持不变
+    # 转场帧在Python中合成，只有转场区间逐帧写入，静止段重复写同一帧
+    def __init__(self, image_paths, durations, width, height, fps, queue_size=4,
+                 effects=None, transition_duration=0.0):
+        self.image_paths = image_paths
+        self.durations = durations
+        self.effects = effects or []
+        self.transition_duration = transition_duration
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.queue_size = queue_size
+        self.error = None
+
+    def input_args(self):
+        return [
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{self.width}x{self.height}",
+            "-framerate", f"{self.fps:g}",
+            "-i", "pipe:0"
+        ]
+
+    def load_frame(self, image_path):
+        # 等同于scale=force_original_aspect_ratio=decrease加居中黑边
+        with Image.open(image_path) as img:
+            img = img.convert("RGB")
+            scale = min(self.width / img.width, self.height / img.height)
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            if size != img.size:
+                img = img.resize(size, Image.LANCZOS)
+            if size == (self.width, self.height):
+                return img
+            frame = Image.new("RGB", (self.width, self.height), "black")
+            frame.paste(img, ((self.width - size[0]) // 2, (self.height - size[1]) // 2))
+            return frame
+
+    def produce(self, frames):
+        try:
+            timeline = build_timeline(self.durations, self.effects, self.transition_duration)
+            counts = frame_counts([piece['duration'] for piece in timeline], self.fps)
+            # 同时最多保留相邻两页的解码结果
+            loaded = {}
+
+            def get_image(index):
+                if index not in loaded:
+                    for old in [k for k in loaded if k < index - 1]:
+                        del loaded[old]
+                    loaded[index] = self.load_frame(self.image_paths[index])
+                return loaded[index]
+
+            for piece, count in zip(timeline, counts):
+                if piece['type'] == 'hold':
+                    frames.put((get_image(piece['slide']).tobytes(), count))
+                    continue
+                first = get_image(piece['slide'])
+                second = get_image(piece['slide'] + 1)
+                for k in range(count):
+                    frame = transition_frame(first, second, piece['effect'], (k + 0.5) / count)
+                    frames.put((frame.tobytes(), 1))
+        except Exception as e:
+            self.error = e
+        finally:
+            frames.put(None)
+
+    def feed(self, stdin):
+        frames = queue.Queue(maxsize=self.queue_size)
+        producer = threading.Thread(target=self.produce, args=(frames,), daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                frame, count = item
+                for _ in range(count):
+                    stdin.write(frame)
+        except OSError:
+            # ffmpeg提前退出，错误由返回码体现
+            pass
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+            # 取空队列，避免解码线程阻塞在put上
+            while producer.is_alive():
+                try:
+                    frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
@@ -0,0 +1,316 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from converter import PPT_EXTENSIONS, convert_deck, _init_worker
+
+
+QUEUE_DIR = os.path.join(os.getcwd(), "QUEUE")
+
+# 失败后第n次重试前等待RETRY_BASE_SECONDS * 2^(n-1)秒，最多等待RETRY_MAX_SECONDS
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+# 收件箱中的文件在这段时间内没有变化才认为已经复制完成
+STABLE_SECONDS = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    ppt TEXT NOT NULL,
+    bgm TEXT,
+    output TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_run REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_run);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id INTEGER NOT NULL,
+    attempt INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS stages_job ON stages (job_id);
+"""
+
+
+def connect(db_path):
+    # 守护进程和各工作进程各自打开连接，WAL模式下读写互不阻塞
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class JobQueue:
+    # 基于SQLite的持久化任务队列，状态为queued/running/done/failed
+    def __init__(self, queue_dir=QUEUE_DIR):
+        self.queue_dir = queue_dir
+        self.db_path = os.path.join(queue_dir, "queue.db")
+        os.makedirs(queue_dir, exist_ok=True)
+        self.conn = connect(self.db_path)
+        self.conn.executescript(SCHEMA)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.queue_dir, "jobs", str(job_id))
+
+    def staging_dir(self):
+        return os.path.join(self.queue_dir, "incoming")
+
+    def enqueue(self, source_path, output_dir, bgm_path=None):
+        # 源文件先移入临时目录，在同一个事务中插入任务并改名为任务目录，收件箱中同名文件再次出现时作为新任务
+        # 任何一步失败时源文件放回原处并抛出异常，不会留下没有文件的任务
+        name = os.path.basename(source_path)
+        staging_dir = os.path.join(self.staging_dir(), uuid.uuid4().hex)
+        os.makedirs(staging_dir)
+        staged_path = os.path.join(staging_dir, name)
+        try:
+            shutil.move(source_path, staged_path)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        output_path = os.path.join(output_dir, os.path.splitext(name)[0] + ".mp4")
+        ppt_path = None
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (name, ppt, bgm, output, created) VALUES (?, '', ?, ?, ?)",
+                (name, bgm_path, output_path, time.time()))
+            job_id = cursor.lastrowid
+            job_dir = self.job_dir(job_id)
+            os.makedirs(os.path.dirname(job_dir), exist_ok=True)
+            os.rename(staging_dir, job_dir)
+            ppt_path = os.path.join(job_dir, name)
+            self.conn.execute("UPDATE jobs SET ppt = ? WHERE id = ?", (ppt_path, job_id))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            shutil.move(ppt_path or staged_path, source_path)
+            shutil.rmtree(os.path.dirname(ppt_path) if ppt_path else staging_dir, ignore_errors=True)
+            raise
+        return job_id
+
+    def unstage(self, inbox):
+        # 上次入队时异常退出留在临时目录中的源文件放回收件箱，返回放回的文件数
+        restored = 0
+        staging_root = self.staging_dir()
+        if not os.path.isdir(staging_root):
+            return restored
+        for staging_name in os.listdir(staging_root):
+            staging_dir = os.path.join(staging_root, staging_name)
+            for name in os.listdir(staging_dir):
+                if not os.path.exists(os.path.join(inbox, name)):
+                    shutil.move(os.path.join(staging_dir, name), os.path.join(inbox, name))
+                    restored += 1
+            if not os.listdir(staging_dir):
+                os.rmdir(staging_dir)
+        return restored
+
+    def recover(self):
+        # 上次异常退出时仍在运行的任务重新排队；渲染缓存和分段缓存保留了已完成的阶段，重跑时直接复用
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'queued', stage = NULL, next_run = 0 WHERE status = 'running'")
+        return cursor.rowcount
+
+    def claim(self):
+        # 取出一个到期的任务并标记为运行中
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND next_run <= ? ORDER BY next_run, id LIMIT 1",
+            (now,)).fetchone()
+        if row is None:
+            return None
+        self.conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, started = ?, error = NULL "
+            "WHERE id = ?", (now, row['id']))
+        return dict(row, attempts=row['attempts'] + 1)
+
+    def complete(self, job_id):
+        self.conn.execute("UPDATE jobs SET status = 'done', stage = NULL, finished = ? WHERE id = ?",
+                          (time.time(), job_id))
+
+    def fail(self, job_id, attempts, error, max_attempts=MAX_ATTEMPTS):
+        # 未达到重试次数时按指数退避重新排队，返回是否还会重试
+        if attempts < max_attempts:
+            delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = NULL, error = ?, next_run = ? WHERE id = ?",
+                (error, time.time() + delay, job_id))
+            return True
+        self.conn.execute("UPDATE jobs SET status = 'failed', stage = NULL, error = ?, finished = ? WHERE id = ?",
+                          (error, time.time(), job_id))
+        return False
+
+    def status(self, window=3600):
+        # 队列深度、最近window秒内的吞吐量和各阶段耗时
+        counts = {row['status']: row['count'] for row in self.conn.execute(
+            "SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")}
+        since = time.time() - window
+        finished = self.conn.execute(
+            "SELECT COUNT(*) AS count, AVG(finished - started) AS seconds FROM jobs "
+            "WHERE status = 'done' AND finished >= ?", (since,)).fetchone()
+        stages = [dict(row) for row in self.conn.execute(
+            "SELECT stage, COUNT(*) AS count, AVG(finished - started) AS avg_seconds, "
+            "MAX(finished - started) AS max_seconds FROM stages "
+            "WHERE finished IS NOT NULL AND finished >= ? GROUP BY stage ORDER BY MIN(started)", (since,))]
+        running = [dict(row) for row in self.conn.execute(
+            "SELECT id, name, stage, attempts, started FROM jobs WHERE status = 'running' ORDER BY started")]
+        return {
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'window_seconds': window,
+            'finished_in_window': finished['count'],
+            'jobs_per_hour': finished['count'] * 3600 / window,
+            'avg_job_seconds': finished['seconds'],
+            'stages': stages,
+            'running_jobs': running
+        }
+
+
+class StageRecorder:
+    # 作为转换的进度回调，阶段切换时写入stages表；回调可能来自ffmpeg读取线程，需要加锁
+    def __init__(self, db_path, job_id, attempt):
+        self.conn = connect(db_path)
+        self.job_id = job_id
+        self.attempt = attempt
+        self.stage = None
+        self.lock = threading.Lock()
+
+    def __call__(self, stage, current, total, info):
+        with self.lock:
+            if stage == self.stage:
+                return
+            self.finish()
+            self.stage = stage
+            self.conn.execute("INSERT INTO stages (job_id, attempt, stage, started) VALUES (?, ?, ?, ?)",
+                              (self.job_id, self.attempt, stage, time.time()))
+            self.conn.execute("UPDATE jobs SET stage = ? WHERE id = ?", (stage, self.job_id))
+
+    def finish(self):
+        if self.stage is not None:
+            self.conn.execute(
+                "UPDATE stages SET finished = ? WHERE job_id = ? AND attempt = ? AND stage = ? AND finished IS NULL",
+                (time.time(), self.job_id, self.attempt, self.stage))
+
+    def close(self):
+        with self.lock:
+            self.finish()
+            self.conn.close()
+
+
+def _run_queue_job(job, db_path, config):
+    recorder = StageRecorder(db_path, job['id'], job['attempts'])
+    try:
+        convert_deck(job['ppt'], job['bgm'], job['output'], config,
+                     os.path.join(os.path.dirname(job['ppt']), "TEMP"), recorder)
+    finally:
+        recorder.close()
+    return job['id']
+
+
+def scan_inbox(inbox, seen):
+    # 返回已经稳定(大小和修改时间在STABLE_SECONDS内未变)的PPT文件，seen记录上次看到的状态
+    ready = []
+    now = time.time()
+    for name in sorted(os.listdir(inbox)):
+        path = os.path.join(inbox, name)
+        if not name.lower().endswith(PPT_EXTENSIONS) or name.startswith("~$") or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        state = (stat.st_size, stat.st_mtime)
+        if seen.get(path) == state and now - stat.st_mtime >= STABLE_SECONDS:
+            ready.append(path)
+            seen.pop(path)
+        else:
+            seen[path] = state
+    return ready
+
+
+def run_daemon(inbox, outbox, config=None, bgm_path=None, workers=None, queue_dir=QUEUE_DIR,
+               poll_interval=2.0, max_attempts=MAX_ATTEMPTS, log=print, stop_event=None):
+    # 监视收件箱，新PPT入队后由有界进程池转换，结果写入发件箱；stop_event置位时等待运行中的任务结束后退出
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(inbox, exist_ok=True)
+    os.makedirs(outbox, exist_ok=True)
+    queue = JobQueue(queue_dir)
+    recovered = queue.recover()
+    if recovered:
+        log(f"恢复{recovered}个未完成的任务")
+    restored = queue.unstage(inbox)
+    if restored:
+        log(f"{restored}个入队时中断的文件放回收件箱")
+    stop_event = stop_event or threading.Event()
+    seen = {}
+    running = {}
+
+    with multiprocessing.Manager() as manager:
+        render_lock = manager.Lock()
+
+        def create_executor():
+            return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(render_lock,))
+
+        executor = create_executor()
+        try:
+            while not stop_event.is_set() or running:
+                if not stop_event.is_set():
+                    for path in scan_inbox(inbox, seen):
+                        # 文件仍被占用等原因入队失败时留在收件箱，下次扫描时重试
+                        try:
+                            job_id = queue.enqueue(path, outbox, bgm_path)
+                        except Exception as e:
+                            log(f"[入队失败] {os.path.basename(path)}：{e}")
+                            continue
+                        log(f"[入队] #{job_id} {os.path.basename(path)}")
+
+                    while len(running) < workers:
+                        job = queue.claim()
+                        if job is None:
+                            break
+                        log(f"[开始] #{job['id']} {job['name']}(第{job['attempts']}次)")
+                        running[executor.submit(_run_queue_job, job, queue.db_path, config)] = job
+
+                if not running:
+                    stop_event.wait(poll_interval)
+                    continue
+
+                done, _ = wait(list(running), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        future.result()
+                        queue.complete(job['id'])
+                        log(f"[完成] #{job['id']} {job['name']} -> {job['output']}")
+                    except Exception as e:
+                        # 工作进程崩溃时进程池不可再用，其余运行中的任务同样按失败重试
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        error = "工作进程异常退出" if isinstance(e, BrokenProcessPool) else str(e)
+                        if queue.fail(job['id'], job['attempts'], error, max_attempts):
+                            log(f"[重试] #{job['id']} {job['name']}：{error}")
+                        else:
+                            log(f"[失败] #{job['id']} {job['name']}：{error}")
+                if broken:
+                    executor.shutdown(wait=False)
+                    executor = create_executor()
+        finally:
+            executor.shutdown(wait=True)
+    return 0
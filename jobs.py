@@ -0,0 +1,95 @@
+import queue
+import threading
+import time
+
+from converter import ConvertCancelled
+
+
+STAGE_NAMES = {
+    "extract": "正在提取文本...",
+    "narration": "正在合成配音...",
+    "render": "正在转换PPT为图片...",
+    "dedup": "正在合并重复页...",
+    "encode": "正在转换视频...",
+    "concat": "正在拼接分段...",
+    "audio": "正在合成音频..."
+}
+
+
+class ConvertJob:
+    # 在后台线程中运行转换，进度事件放入线程安全的队列，界面线程通过after()定时取出
+    # 事件为字典，type为progress/done/error/cancelled
+    def __init__(self, converter, ppt_path, bgm_path=None, output_path=None):
+        self.converter = converter
+        self.ppt_path = ppt_path
+        self.bgm_path = bgm_path
+        self.output_path = output_path
+        self.events = queue.Queue()
+        self.stage = None
+        self.stage_started = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.converter.progress_callback = self.on_progress
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.converter.cancel()
+
+    def is_running(self):
+        return self.thread.is_alive()
+
+    def on_progress(self, stage, current, total, info):
+        now = time.time()
+        if stage != self.stage:
+            self.stage = stage
+            self.stage_started = now
+
+        percent = None
+        eta = None
+        if current is not None and total:
+            percent = min(100.0, current / total * 100)
+            remaining = max(0.0, total - current)
+            if info.get('speed'):
+                # ffmpeg的speed为每秒实际时间处理的视频秒数
+                eta = remaining / info['speed']
+            elif current > 0:
+                eta = (now - self.stage_started) / current * remaining
+
+        self.events.put({
+            'type': 'progress',
+            'stage': stage,
+            'current': current,
+            'total': total,
+            'percent': percent,
+            'fps': info.get('fps'),
+            'speed': info.get('speed'),
+            'eta': eta
+        })
+
+    def run(self):
+        try:
+            result = self.converter.convert(self.ppt_path, self.bgm_path, self.output_path)
+            self.events.put({'type': 'done', 'output': result})
+        except ConvertCancelled:
+            self.events.put({'type': 'cancelled'})
+        except Exception as e:
+            self.events.put({'type': 'error', 'message': str(e)})
+
+    def poll(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
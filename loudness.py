@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+
+from cache import file_hash
+from metrics import write_atomic
+
+
+# EBU R128响度归一化：第一遍测量整段音频的响度，第二遍按测量值线性调整
+# 测量结果按音频文件哈希缓存，同一首背景音乐用于多个任务时不再重复分析
+TRUE_PEAK = -1.5
+LOUDNESS_RANGE = 11
+
+MEASUREMENT_FIELDS = ("input_i", "input_tp", "input_lra", "input_thresh", "target_offset")
+
+
+def loudnorm_params(target):
+    return f"I={target:g}:TP={TRUE_PEAK:g}:LRA={LOUDNESS_RANGE:g}"
+
+
+def parse_measurement(lines):
+    # loudnorm在日志末尾输出JSON格式的测量结果
+    text = "".join(lines)
+    start = text.rfind("{")
+    end = text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not all(field in data for field in MEASUREMENT_FIELDS):
+        return None
+    return {field: data[field] for field in MEASUREMENT_FIELDS}
+
+
+def loudnorm_filter(target, measurement):
+    # 静音或过短的音频测量值为-inf，此时不做归一化
+    if measurement is None or "inf" in measurement['input_i']:
+        return ""
+    return (f"loudnorm={loudnorm_params(target)}:"
+            f"measured_I={measurement['input_i']}:measured_TP={measurement['input_tp']}:"
+            f"measured_LRA={measurement['input_lra']}:measured_thresh={measurement['input_thresh']}:"
+            f"offset={measurement['target_offset']}:linear=true")
+
+
+class LoudnessAnalyzer:
+    def __init__(self, converter, cache_dir):
+        self.converter = converter
+        self.cache_dir = cache_dir
+
+    def cache_path(self, audio_path, target):
+        key = hashlib.sha256(f"{file_hash(audio_path)}|{loudnorm_params(target)}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def measure(self, audio_path, target):
+        path = self.cache_path(audio_path, target)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    measurement = json.load(f)
+                self.converter.log(f"使用已缓存的响度测量：{audio_path}")
+                return measurement
+            except (OSError, ValueError):
+                pass
+
+        lines = []
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", audio_path,
+            "-vn",
+            "-af", f"loudnorm={loudnorm_params(target)}:print_format=json",
+            "-f", "null", "-"
+        ]
+        self.converter.run_ffmpeg(cmd, "响度测量失败", progress=False, output_lines=lines)
+        measurement = parse_measurement(lines)
+        if measurement is None:
+            self.converter.log(f"未能解析响度测量结果，不做归一化：{audio_path}")
+            return None
+
+        write_atomic(path, json.dumps(measurement))
+        return measurement
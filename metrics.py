@@ -0,0 +1,218 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# 记录一次转换中各阶段的耗时和资源占用，结束时写出JSON报告，可选写出Prometheus文本格式
+# (node_exporter的textfile collector读取的格式)，用于查看时间花在哪里
+METRIC_PREFIX = "ppt2video"
+
+
+def cpu_seconds():
+    # 本进程及已结束的子进程(ffmpeg、渲染器)的CPU时间；Windows上不包括子进程
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss_mb():
+    # 返回(本进程, 子进程中最大)的峰值常驻内存(MB)，无法获取时为None
+    if resource is not None:
+        # Linux上单位为KB，macOS上为字节
+        unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+        return round(own, 1), round(children, 1)
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 1024 / 1024, 1), None
+    return None, None
+
+
+class RunMetrics:
+    def __init__(self):
+        self.started = time.time()
+        self.stages = []
+        self.ffmpeg = []
+        # 当前所在阶段的记录，各阶段中运行的ffmpeg按此归类
+        self.current = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **info):
+        # with metrics.stage("render") as info: 阶段内可以向info中补充数据；同名阶段可以出现多次
+        record = {'stage': name}
+        record.update(info)
+        previous, self.current = self.current, record
+        wall = time.perf_counter()
+        cpu = cpu_seconds()
+        try:
+            yield record
+        finally:
+            self.current = previous
+            record['seconds'] = round(time.perf_counter() - wall, 3)
+            record['cpu_seconds'] = round(cpu_seconds() - cpu, 3)
+            record['peak_rss_mb'], record['children_peak_rss_mb'] = peak_rss_mb()
+            with self.lock:
+                self.stages.append(record)
+
+    def annotate(self, **info):
+        # 向当前阶段的记录中补充数据，不在任何阶段中时忽略
+        record = self.current
+        if record is not None:
+            record.update(info)
+
+    def record_ffmpeg(self, target, seconds, stats, media_seconds=None):
+        # 每次运行ffmpeg的耗时，以及-progress输出中最后汇报的帧数、fps和speed；target为输出文件名
+        record = {'stage': self.current['stage'] if self.current else None, 'target': target,
+                  'seconds': round(seconds, 3)}
+        for key in ('frames', 'fps', 'speed'):
+            if stats.get(key) is not None:
+                record[key] = stats[key]
+        if media_seconds:
+            record['media_seconds'] = round(media_seconds, 3)
+        with self.lock:
+            self.ffmpeg.append(record)
+
+    def report(self, **summary):
+        with self.lock:
+            stages = list(self.stages)
+            ffmpeg = list(self.ffmpeg)
+        totals = {}
+        for record in stages:
+            total = totals.setdefault(record['stage'], {'stage': record['stage'], 'count': 0,
+                                                        'seconds': 0.0, 'cpu_seconds': 0.0})
+            total['count'] += 1
+            total['seconds'] = round(total['seconds'] + record['seconds'], 3)
+            total['cpu_seconds'] = round(total['cpu_seconds'] + record['cpu_seconds'], 3)
+        own, children = peak_rss_mb()
+        report = {
+            'started': self.started,
+            'seconds': round(time.time() - self.started, 3),
+            'cpu_seconds': round(sum(total['cpu_seconds'] for total in totals.values()), 3),
+            'peak_rss_mb': own,
+            'children_peak_rss_mb': children,
+            'stage_totals': list(totals.values()),
+            'stages': stages,
+            'ffmpeg': ffmpeg
+        }
+        report.update(summary)
+        return report
+
+
+@contextmanager
+def atomic_path(path):
+    # 先写临时文件再改名，读取方(如node_exporter)不会读到写了一半的文件；临时文件名唯一，多个进程同时写入也互不影响
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_atomic(path, text):
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return path
+
+
+def copy_atomic(src_path, path):
+    with atomic_path(path) as tmp_path:
+        shutil.copyfile(src_path, tmp_path)
+    return path
+
+
+def write_json_report(path, report):
+    return write_atomic(path, json.dumps(report, indent=2, ensure_ascii=False))
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(report, labels=None):
+    # 各阶段合计耗时和CPU时间按stage标签输出，编码阶段另外输出ffmpeg汇报的平均fps和speed
+    base = {'deck': report.get('deck', '')}
+    base.update(labels or {})
+
+    def series(name, value, **extra):
+        merged = dict(base, **extra)
+        label_text = ",".join(f'{re.sub(r"[^a-zA-Z0-9_]", "_", k)}="{label_value(v)}"'
+                              for k, v in merged.items())
+        return f"{METRIC_PREFIX}_{name}{{{label_text}}} {round(value, 3)!r}"
+
+    lines = [
+        f"# HELP {METRIC_PREFIX}_run_seconds Wall time of the last conversion.",
+        f"# TYPE {METRIC_PREFIX}_run_seconds gauge",
+        series("run_seconds", report['seconds']),
+        f"# HELP {METRIC_PREFIX}_run_success Whether the last conversion succeeded.",
+        f"# TYPE {METRIC_PREFIX}_run_success gauge",
+        series("run_success", 1 if report.get('ok') else 0),
+        f"# HELP {METRIC_PREFIX}_run_finished_timestamp_seconds When the last conversion finished.",
+        f"# TYPE {METRIC_PREFIX}_run_finished_timestamp_seconds gauge",
+        series("run_finished_timestamp_seconds", report['started'] + report['seconds']),
+        f"# HELP {METRIC_PREFIX}_stage_seconds Wall time spent in each stage.",
+        f"# TYPE {METRIC_PREFIX}_stage_seconds gauge"
+    ]
+    lines += [series("stage_seconds", total['seconds'], stage=total['stage']) for total in report['stage_totals']]
+    lines += [
+        f"# HELP {METRIC_PREFIX}_stage_cpu_seconds CPU time (including child processes) spent in each stage.",
+        f"# TYPE {METRIC_PREFIX}_stage_cpu_seconds gauge"
+    ]
+    lines += [series("stage_cpu_seconds", total['cpu_seconds'], stage=total['stage'])
+              for total in report['stage_totals']]
+    if report.get('peak_rss_mb') is not None:
+        lines += [
+            f"# HELP {METRIC_PREFIX}_peak_rss_bytes Peak resident memory of the converter and its child processes.",
+            f"# TYPE {METRIC_PREFIX}_peak_rss_bytes gauge",
+            series("peak_rss_bytes", report['peak_rss_mb'] * 1024 * 1024, process="converter")
+        ]
+        if report.get('children_peak_rss_mb') is not None:
+            lines.append(series("peak_rss_bytes", report['children_peak_rss_mb'] * 1024 * 1024, process="children"))
+
+    encodes = {}
+    for record in report['ffmpeg']:
+        if record.get('fps') is None:
+            continue
+        encodes.setdefault(record['stage'] or "", []).append(record)
+    if encodes:
+        lines += [
+            f"# HELP {METRIC_PREFIX}_ffmpeg_fps Average frames per second reported by ffmpeg.",
+            f"# TYPE {METRIC_PREFIX}_ffmpeg_fps gauge"
+        ]
+        lines += [series("ffmpeg_fps", sum(r['fps'] for r in records) / len(records), stage=stage)
+                  for stage, records in encodes.items()]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_ffmpeg_speed Average realtime factor reported by ffmpeg.",
+            f"# TYPE {METRIC_PREFIX}_ffmpeg_speed gauge"
+        ]
+        lines += [series("ffmpeg_speed", sum(r.get('speed', 0.0) for r in records) / len(records), stage=stage)
+                  for stage, records in encodes.items()]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path, report, labels=None):
+    return write_atomic(path, prometheus_text(report, labels))
@@ -0,0 +1,171 @@
+import os
+import re
+import wave
+import shutil
+import hashlib
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import FileCache
+from slide_text import NOTES_HEADER, SOURCE_PREFIX
+
+
+# 配音片段统一转换为该格式，拼接配音轨时可以直接按PCM帧拼接
+NARRATION_SAMPLE_RATE = 24000
+
+TTS_ENGINES = ["pyttsx3", "espeak"]
+
+SLIDE_HEADER = re.compile(r"^=== 第(\d+)页 ===$")
+
+
+def slide_script_text(text):
+    # 有演讲者备注时配音和字幕使用备注，否则使用页面文字
+    content, _, notes = text.partition(NOTES_HEADER)
+    return notes.strip() or content.strip()
+
+
+def read_text_source(text_file):
+    # 返回文案提取自的PPT的哈希，文件不存在或没有记录时为None
+    if not text_file or not os.path.exists(text_file):
+        return None
+    with open(text_file, 'r', encoding='utf-8') as f:
+        line = f.readline().strip()
+    if line.startswith(SOURCE_PREFIX):
+        return line[len(SOURCE_PREFIX):].strip()
+    return None
+
+
+def read_slide_texts(text_file):
+    # 读取<PPT名>_content.txt(可能经过人工修改)，返回{页码: 文本}
+    texts = {}
+    if not text_file or not os.path.exists(text_file):
+        return texts
+    current = None
+    lines = []
+    with open(text_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            match = SLIDE_HEADER.match(line.strip())
+            if match:
+                if current is not None:
+                    texts[current] = slide_script_text('\n'.join(lines))
+                current = int(match.group(1))
+                lines = []
+            elif current is not None:
+                lines.append(line)
+    if current is not None:
+        texts[current] = slide_script_text('\n'.join(lines))
+    return texts
+
+
+def synthesize_clip(engine, voice, rate, text, output_path):
+    # 在子进程中执行：离线语音合成后统一转换为单声道PCM WAV
+    with tempfile.TemporaryDirectory(prefix="ppt2video_tts_") as tmp_dir:
+        raw_path = os.path.join(tmp_dir, "raw.wav")
+        if engine == "espeak":
+            espeak = shutil.which("espeak-ng") or shutil.which("espeak") or "espeak-ng"
+            cmd = [espeak, "-w", raw_path]
+            if voice:
+                cmd += ["-v", voice]
+            if rate:
+                cmd += ["-s", str(rate)]
+            result = subprocess.run(cmd + ["--", text], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if result.returncode != 0:
+                raise Exception(f"espeak合成失败：{result.stderr.decode('utf-8', 'replace').strip()}")
+        else:
+            import pyttsx3
+
+            tts = pyttsx3.init()
+            if voice:
+                tts.setProperty('voice', voice)
+            if rate:
+                tts.setProperty('rate', int(rate))
+            tts.save_to_file(text, raw_path)
+            tts.runAndWait()
+            tts.stop()
+
+        result = subprocess.run([
+            "ffmpeg", "-y", "-i", raw_path,
+            "-ar", str(NARRATION_SAMPLE_RATE), "-ac", "1", "-c:a", "pcm_s16le",
+            output_path
+        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise Exception("配音格式转换失败")
+    return output_path
+
+
+def wav_duration(path):
+    with wave.open(path, 'rb') as f:
+        return f.getnframes() / f.getframerate()
+
+
+class Narrator:
+    # 每页文案合成一段配音，按文案和音色的哈希缓存，修改一段文案只重新合成这一段
+    def __init__(self, engine, voice, rate, cache_dir, cache_size, workers=None):
+        self.engine = engine
+        self.voice = voice
+        self.rate = rate
+        self.cache = FileCache(cache_dir, cache_size)
+        self.workers = workers or os.cpu_count() or 1
+
+    def clip_key(self, text):
+        signature = f"{self.engine}|{self.voice}|{self.rate}|{NARRATION_SAMPLE_RATE}|{text}"
+        return hashlib.sha256(signature.encode('utf-8')).hexdigest()
+
+    def synthesize(self, texts, count, output_dir, log=None):
+        # 返回每页的配音文件路径，没有文案的页为None
+        clips = [None] * count
+        pending = []
+        for i in range(count):
+            text = texts.get(i + 1, "").strip()
+            if not text:
+                continue
+            key = self.clip_key(text)
+            clip_path = os.path.join(output_dir, f"narration_{i + 1}.wav")
+            if not self.cache.fetch(key, ".wav", clip_path):
+                pending.append((i, key, text, clip_path))
+            clips[i] = clip_path
+        if log:
+            log(f"配音共{sum(1 for clip in clips if clip)}段，需要合成{len(pending)}段")
+
+        if pending:
+            # 语音引擎通常不是线程安全的，每个进程创建自己的引擎
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as executor:
+                futures = [(key, executor.submit(synthesize_clip, self.engine, self.voice, self.rate,
+                                                  text, clip_path))
+                           for _, key, text, clip_path in pending]
+                for key, future in futures:
+                    self.cache.put(key, future.result(), ".wav")
+            self.cache.evict()
+        return clips
+
+
+def narration_durations(clips, default_duration, padding):
+    # 有配音的页按配音长度加留白停留，没有配音的页使用默认停留时间
+    return [wav_duration(clip) + padding if clip else default_duration for clip in clips]
+
+
+def build_narration_track(clips, durations, output_path):
+    # 按每页的开始时间直接拼接PCM数据，不需要经过ffmpeg
+    with wave.open(output_path, 'wb') as track:
+        track.setnchannels(1)
+        track.setsampwidth(2)
+        track.setframerate(NARRATION_SAMPLE_RATE)
+        written = 0
+        elapsed = 0.0
+        for clip, duration in zip(clips, durations):
+            start = round(elapsed * NARRATION_SAMPLE_RATE)
+            if start > written:
+                track.writeframes(b"\x00\x00" * (start - written))
+                written = start
+            if clip:
+                with wave.open(clip, 'rb') as f:
+                    frames = f.readframes(f.getnframes())
+                track.writeframes(frames)
+                written += len(frames) // 2
+            elapsed += duration
+        end = round(elapsed * NARRATION_SAMPLE_RATE)
+        if end > written:
+            track.writeframes(b"\x00\x00" * (end - written))
+    return output_path
@@ -0,0 +1,92 @@
+import zipfile
+
+from pptx_package import EMU_PER_PIXEL, slide_size
+from slide_text import extract_slides, slide_script
+from encoders import X264Encoder, encoder_for_args, weighted_frames
+
+
+# 成本估算使用的经验值，用于调度器在多台机器间分配任务，不要求精确
+# 渲染：(启动耗时秒, 每页耗时秒)
+RENDER_COST = {
+    "powerpoint": (3.0, 0.4),
+    "libreoffice": (4.0, 0.25)
+}
+
+# libx264各预设每秒可编码的百万像素帧数(单线程)
+ENCODE_MEGAPIXELS_PER_SECOND = {
+    "ultrafast": 120.0,
+    "superfast": 90.0,
+    "veryfast": 60.0,
+    "faster": 40.0,
+    "fast": 30.0,
+    "medium": 22.0,
+    "slow": 12.0,
+    "slower": 6.0,
+    "veryslow": 3.0
+}
+
+# 其他编码器相对libx264的耗时倍数；其预设按在各自预设列表中的位置对应到libx264的预设
+CODEC_SLOWDOWN = {
+    "libx264": 1.0,
+    "libx265": 4.0,
+    "libsvtav1": 3.0,
+    "libvpx-vp9": 5.0
+}
+
+# 估算配音时长时的语速(字/秒)
+NARRATION_CHARS_PER_SECOND = 4.0
+
+
+def read_deck(ppt_path, workers=None):
+    # 只读取presentation.xml和幻灯片、备注XML，返回尺寸和每页的隐藏状态、配音文本
+    # 旧版.ppt等非压缩包格式返回None，需要渲染后才能确定
+    try:
+        with zipfile.ZipFile(ppt_path) as zf:
+            size = slide_size(zf)
+    except (zipfile.BadZipFile, OSError):
+        return None
+    slides = [{'hidden': slide['hidden'], 'text': slide_script(slide)}
+              for slide in extract_slides(ppt_path, workers)]
+    return {'slide_size': size, 'slides': slides}
+
+
+def planned_dimensions(size):
+    # 与渲染器按96DPI导出的图片尺寸一致，并保证为偶数
+    width = round(size[0] / EMU_PER_PIXEL)
+    height = round(size[1] / EMU_PER_PIXEL)
+    return width + width % 2, height + height % 2
+
+
+def estimate_narration_durations(texts, count, default_duration, padding):
+    durations = []
+    for i in range(count):
+        text = "".join(texts.get(i + 1, "").split())
+        durations.append(len(text) / NARRATION_CHARS_PER_SECOND + padding if text else default_duration)
+    return durations
+
+
+def quality_preset(quality_params):
+    # 换算为对应的libx264预设
+    encoder = encoder_for_args(quality_params)
+    preset = encoder.preset_of(quality_params)
+    if preset not in encoder.presets:
+        return "medium"
+    position = encoder.presets.index(preset) / max(1, len(encoder.presets) - 1)
+    return X264Encoder.presets[round(position * (len(X264Encoder.presets) - 1))]
+
+
+def estimate_cost(renderer_name, render_slides, width, height, frames, still_frames, quality_params, workers):
+    # 返回按秒估算的渲染、编码耗时，编码按可用的并行数摊分
+    startup, per_slide = RENDER_COST.get(renderer_name, (4.0, 0.4))
+    render_seconds = startup + per_slide * render_slides if render_slides else 0.0
+    megapixels = width * height / 1000000
+    speed = ENCODE_MEGAPIXELS_PER_SECOND.get(quality_preset(quality_params), 22.0)
+    speed /= CODEC_SLOWDOWN.get(encoder_for_args(quality_params).name, 1.0)
+    encode_seconds = weighted_frames(frames, still_frames) * megapixels / speed / max(1, workers)
+    return {
+        'render_seconds': round(render_seconds, 1),
+        'encode_seconds': round(encode_seconds, 1),
+        'total_seconds': round(render_seconds + encode_seconds, 1),
+        'frames': frames,
+        'megapixels': round(megapixels, 2)
+    }
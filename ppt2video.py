@@ -1,14 +1,32 @@
-import tkinter as tk
-from tkinter import ttk
-from tkinter import filedialog, messagebox
-from pptx import Presentation
 import os
+import sys
+import codecs
 import subprocess
-from PIL import Image
 import json
-import time
-import comtypes.client
-import shutil
+import argparse
+
+try:
+    import tkinter as tk
+    from tkinter import ttk
+    from tkinter import filedialog, messagebox
+except ImportError:
+    # 服务器上可能没有安装Tk，无界面模式不需要
+    tk = None
+
+from converter import (PPTConverter, TRANSITION_EFFECTS, QUALITY_SETTINGS, SUBTITLE_MODES,
+                       load_config_file, collect_jobs, batch_convert, plan_jobs, job_workspace, preview_config,
+                       deck_text_file)
+from workspace import Workspace, handoff
+from renderers import RENDERER_NAMES
+from jobs import ConvertJob, STAGE_NAMES, format_eta
+from renditions import parse_list
+from encoders import (ENCODERS, ENCODER_NAMES, PROFILE_WIDTH, PROFILE_HEIGHT, EncoderProfiler, available_encoders,
+                      available_share)
+from cache import CACHE_DIR
+from benchmark import (BENCH_RESOLUTIONS, BENCH_QUALITIES, BENCH_TRANSITIONS, run_benchmark, save_results,
+                       load_results, compare_results, baseline_mismatches)
+from narration import TTS_ENGINES
+from job_queue import QUEUE_DIR, JobQueue, run_daemon
 
 
 class PPTToVideo:
@@ -33,30 +51,30 @@ class PPTToVideo:
         self.bgm_volume = tk.StringVar(value="1.0")
         self.auto_next = tk.BooleanVar(value=True)
         self.save_text = tk.BooleanVar(value=True)
+        self.narration = tk.BooleanVar(value=False)
+        self.subtitles = tk.StringVar(value="软字幕")
         self.resolution = tk.StringVar(value="自动")
+        self.preview_start = tk.StringVar(value="1")
 
         self.transition_effect = tk.StringVar(value="无")
-        self.transition_effects = {
-            "无": "",
-            "淡入淡出": "fade",
-            "向左滑动": "slideleft",
-            "向右滑动": "slideright",
-            "向上滑动": "slideup",
-            "向下滑动": "slidedown",
-            "随机效果": "random"
-        }
+        self.transition_effects = TRANSITION_EFFECTS
 
         # 日志相关
         self.log_file = "ffmpeg_log.txt"
         self.log_window = None
 
+        # 后台转换任务
+        self.job = None
+        self.job_is_preview = False
+        self.progress_window = None
+
         # 配置文件路径
         self.config_path = "config.json"
         self.load_config()
 
-        # 确保temp目录存在
-        self.temp_dir = os.path.join(os.getcwd(), "TEMP")
-        os.makedirs(self.temp_dir, exist_ok=True)
+        # 每次转换使用新的工作目录，保留到下一次转换或退出程序，期间可以另存视频和更新字幕
+        self.workspace = None
+        self.temp_dir = None
 
         self.create_widgets()
 
@@ -171,15 +189,31 @@ class PPTToVideo:
                      state='readonly',
                      width=10).grid(row=2, column=3, sticky='w')
 
+        # 第四行参数
+        ttk.Label(params_frame, text="字幕：").grid(row=3, column=0, sticky='e', pady=5)
+        ttk.Combobox(params_frame,
+                     textvariable=self.subtitles,
+                     values=list(SUBTITLE_MODES.keys()),
+                     state='readonly',
+                     width=10).grid(row=3, column=1, sticky='w')
+
+        ttk.Label(params_frame, text="预览起始页：").grid(row=3, column=2, sticky='e')
+        ttk.Entry(params_frame,
+                  textvariable=self.preview_start,
+                  width=10).grid(row=3, column=3, sticky='w')
+
         # 选项区域
         options_frame = ttk.Frame(params_frame)
-        options_frame.grid(row=3, column=0, columnspan=4, pady=10)
+        options_frame.grid(row=4, column=0, columnspan=4, pady=10)
         ttk.Checkbutton(options_frame,
                         text="自动翻页",
                         variable=self.auto_next).pack(side='left', padx=20)
         ttk.Checkbutton(options_frame,
                         text="保存提取文本",
                         variable=self.save_text).pack(side='left', padx=20)
+        ttk.Checkbutton(options_frame,
+                        text="生成配音",
+                        variable=self.narration).pack(side='left', padx=20)
 
         # 3. 操作按钮区域
         button_frame = ttk.Frame(main_frame)
@@ -188,7 +222,9 @@ class PPTToVideo:
         buttons = [
             ("保存设置", self.save_config),
             ("编辑文案", self.edit_text),
+            ("更新字幕", self.update_subtitles),
             ("查看日志", self.show_log),
+            ("快速预览", self.preview),
             ("开始转换", self.convert),
             ("另存视频", self.save_video_as)
         ]
@@ -199,234 +235,93 @@ class PPTToVideo:
                        command=command,
                        style="Orange.TButton").pack(side='left', padx=10)
 
-    def convert_ppt_to_images(self, ppt_path, output_dir):
-        try:
-            powerpoint = comtypes.client.CreateObject("Powerpoint.Application")
-            powerpoint.Visible = 1
-
-            ppt = powerpoint.Presentations.Open(ppt_path)
-            total_slides = ppt.Slides.Count
-
-            self.show_progress_window(total_slides)
-
-            if self.resolution.get() == "自动":
-                width, height = 0, 0
-            else:
-                width, height = map(int, self.resolution.get().split('x'))
-
-            for i in range(1, total_slides + 1):
-                slide = ppt.Slides(i)
-                image_path = os.path.join(output_dir, f"slide_{i}.png")
-
-                if width and height:
-                    slide.Export(image_path, "PNG", width, height)
-                else:
-                    slide.Export(image_path, "PNG")
-
-                while not os.path.exists(image_path):
-                    time.sleep(0.1)
-
-                with Image.open(image_path) as img:
-                    img.save(image_path, "PNG", optimize=True)
-
-                self.update_progress(i, total_slides)
-
-            ppt.Close()
-            powerpoint.Quit()
-            self.progress_window.destroy()
-            return True
+    def get_config(self):
+        return {
+            'slide_duration': self.slide_duration.get(),
+            'transition_duration': self.transition_duration.get(),
+            'video_quality': self.video_quality.get(),
+            'bgm_volume': self.bgm_volume.get(),
+            'resolution': self.resolution.get(),
+            'auto_next': self.auto_next.get(),
+            'save_text': self.save_text.get(),
+            'narration': self.narration.get(),
+            'subtitles': self.subtitles.get(),
+            'transition_effect': self.transition_effect.get()
+        }
 
-        except Exception as e:
-            if hasattr(self, 'progress_window'):
-                self.progress_window.destroy()
-            messagebox.showerror("错误", f"转换PPT到图片失败：{str(e)}")
-            return False
-        finally:
-            try:
-                powerpoint.Quit()
-            except:
-                pass
+    def preview(self):
+        # 低分辨率、低帧率快速生成，从指定页开始，用于检查某一部分的效果
+        try:
+            start = int(self.preview_start.get() or 1)
+        except ValueError:
+            messagebox.showerror("错误", "预览起始页必须是整数")
+            return
+        self.convert(preview_config(self.get_config(), start))
 
-    def convert(self):
+    def convert(self, config=None):
         if not self.ppt_path.get() or not self.bgm_path.get():
             messagebox.showerror("错误", "请选择PPT文件和背景音乐！")
             return
+        if self.job is not None and self.job.is_running():
+            messagebox.showwarning("警告", "已有转换任务正在进行")
+            return
 
-        try:
-            # 清空并创建临时目录
-            if os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
-            os.makedirs(self.temp_dir)
-
-            # 清空日志文件
-            with open(self.log_file, 'w') as f:
-                f.write("")
-
-            # 提取文本并保存
-            if self.save_text.get():
-                self.extract_text_from_ppt(self.ppt_path.get())
-
-            # 转换PPT到图片
-            if not self.convert_ppt_to_images(
-                    os.path.abspath(self.ppt_path.get()),
-                    self.temp_dir
-            ):
-                raise Exception("PPT转图片失败")
-
-            # 获取尺寸信息
-            if self.resolution.get() == "自动":
-                width, height = self.get_max_slide_dimensions(self.temp_dir)
-            else:
-                width, height = map(int, self.resolution.get().split('x'))
-
-            # 准备转场效果
-            transition_name = self.transition_effects[self.transition_effect.get()]
-            if transition_name == "random":
-                import random
-                effects = list(self.transition_effects.values())[1:-1]  # 排除"无"和"随机"
-                transition_name = random.choice(effects)
-
-            # 创建图片列表文件
-            image_files = [f for f in os.listdir(self.temp_dir) if f.endswith('.png')]
-            image_files.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
-            total_duration = len(image_files) * float(self.slide_duration.get())
-
-            with open(os.path.join(self.temp_dir, "input.txt"), "w", encoding="utf-8") as f:
-                for i, image_file in enumerate(image_files):
-                    image_path = os.path.abspath(os.path.join(self.temp_dir, image_file))
-                    image_path = image_path.replace('\\', '/').encode('utf-8').decode('utf-8')
-                    f.write(f"file '{image_path}'\n")
-                    if i < len(image_files) - 1:
-                        f.write(f"duration {self.slide_duration.get()}\n")
-                    else:
-                        f.write("duration 1\n")  # 最后一帧持续1秒
-
-            # 构建filter_complex
-            def build_filter_complex():
-                filters = []
-                base_filter = f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black"
-
-                if transition_name:
-                    filters.append(f"[0:v]{base_filter},split[v1][v2];")
-                    filters.append(
-                        f"[v1][v2]xfade=transition={transition_name}:duration={self.transition_duration.get()}[vout]")
+        if self.workspace is not None:
+            self.workspace.cleanup()
+        config = config or self.get_config()
+        self.workspace = job_workspace(self.ppt_path.get(), config)
+        self.temp_dir = self.workspace.path
+        converter = PPTConverter(config=config,
+                                 temp_dir=self.temp_dir,
+                                 log_file=self.log_file,
+                                 text_file=deck_text_file(self.ppt_path.get()))
+        self.job = ConvertJob(converter, self.ppt_path.get(), self.bgm_path.get())
+        self.job_is_preview = bool(config.get('preview'))
+        self.show_progress_window()
+        self.job.start()
+        self.poll_job()
+
+    def poll_job(self):
+        # 转换在后台线程中进行，界面线程定时取出进度事件刷新显示
+        for event in self.job.poll():
+            if event['type'] == 'progress':
+                self.update_progress(event)
+                continue
+
+            self.close_progress_window()
+            if event['type'] == 'done':
+                if self.job_is_preview:
+                    messagebox.showinfo("成功", "预览已生成！请使用'另存视频'功能保存后查看。")
                 else:
-                    filters.append(f"[0:v]{base_filter}[vout]")
-
-                # 音频处理
-                filters.append(f"[1:a]volume={self.bgm_volume.get()},afade=t=out:st={total_duration - 3}:d=3[aout]")
-
-                return ";".join(filters)
-
-            # 构建FFmpeg命令
-            cmd = [
-                      "ffmpeg", "-y",
-                      "-f", "concat",
-                      "-safe", "0",
-                      "-i", os.path.join(self.temp_dir, "input.txt"),
-                      "-i", self.bgm_path.get(),
-                      "-filter_complex", build_filter_complex(),
-                      "-map", "[vout]",
-                      "-map", "[aout]",
-                      "-c:v", "libx264"
-                  ] + self.get_ffmpeg_quality_params() + [
-                      "-pix_fmt", "yuv420p",
-                      "-shortest",
-                      os.path.join(self.temp_dir, "output.mp4")
-                  ]
-
-            # 显示进度窗口
-            progress_window = tk.Toplevel(self.window)
-            progress_window.title("转换进度")
-            progress_window.geometry("300x150")
-            progress_window.transient(self.window)
-            progress_window.grab_set()
-
-            progress_label = ttk.Label(progress_window, text="正在转换视频...")
-            progress_label.pack(pady=20)
-
-            progress_bar = ttk.Progressbar(progress_window, mode='indeterminate')
-            progress_bar.pack(pady=20)
-            progress_bar.start()
-
-            print(cmd)
-
-            # 运行FFmpeg并记录日志
-            with open(self.log_file, 'a', encoding='utf-8') as log:
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True,
-                    encoding='utf-8'
-                )
-
-                while True:
-                    output = process.stderr.readline()
-                    if output == '' and process.poll() is not None:
-                        break
-                    if output:
-                        log.write(output)
-                        log.flush()
-                    progress_window.update()
-
-                progress_bar.stop()
-                progress_window.destroy()
-
-                if process.returncode != 0:
-                    raise Exception("FFmpeg转换失败")
-
-            messagebox.showinfo("成功", "转换完成！请使用'另存视频'功能保存到指定位置。")
-
-        except Exception as e:
-            if 'progress_window' in locals():
-                progress_window.destroy()
-            messagebox.showerror("错误", f"转换失败：{str(e)}")
-            # 记录详细错误信息到日志
-            with open(self.log_file, 'a', encoding='utf-8') as log:
-                log.write(f"\nError occurred: {str(e)}\n")
-        finally:
-            # 确保进度窗口被关闭
-            if 'progress_window' in locals():
-                try:
-                    progress_window.destroy()
-                except:
-                    pass
-
-    def extract_text_from_ppt(self, ppt_path):
-        output_file = "ppt_content.txt"
-        try:
-            prs = Presentation(ppt_path)
-            text_extracted = False
-
-            with open(output_file, 'w', encoding='utf-8') as f:
-                for i, slide in enumerate(prs.slides, 1):
-                    slide_text = []
-                    f.write(f"=== 第{i}页 ===\n")
-
-                    for shape in slide.shapes:
-                        if hasattr(shape, "text") and shape.text.strip():
-                            slide_text.append(shape.text.strip())
-                            text_extracted = True
-
-                    if slide_text:
-                        f.write('\n'.join(slide_text) + '\n')
-                    f.write('\n')
+                    messagebox.showinfo("成功", "转换完成！请使用'另存视频'功能保存到指定位置。")
+            elif event['type'] == 'cancelled':
+                messagebox.showinfo("提示", "转换已取消")
+            else:
+                messagebox.showerror("错误", f"转换失败：{event['message']}")
+            return
+        self.window.after(100, self.poll_job)
 
-            if not text_extracted:
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write("未检测到PPT中的文本内容\n")
+    def cancel_convert(self):
+        if self.job is not None and self.job.is_running():
+            self.progress_label.config(text="正在取消...")
+            self.cancel_button.config(state='disabled')
+            self.job.cancel()
 
-        except Exception as e:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(f"提取文本时发生错误: {str(e)}\n")
+    def close_progress_window(self):
+        if getattr(self, 'progress_window', None) is not None:
+            try:
+                self.progress_window.destroy()
+            except:
+                pass
+            self.progress_window = None
 
-    def show_progress_window(self, total_slides):
+    def show_progress_window(self):
         self.progress_window = tk.Toplevel(self.window)
         self.progress_window.title("转换进度")
-        self.progress_window.geometry("300x150")
+        self.progress_window.geometry("360x200")
         self.progress_window.transient(self.window)
         self.progress_window.grab_set()
+        self.progress_window.protocol("WM_DELETE_WINDOW", self.cancel_convert)
 
         # 居中显示
         self.progress_window.update_idletasks()
@@ -437,49 +332,53 @@ class PPTToVideo:
         self.progress_window.geometry(f'{width}x{height}+{x}+{y}')
 
         # 进度显示组件
-        self.progress_label = ttk.Label(self.progress_window, text="正在转换PPT为图片...")
+        self.progress_label = ttk.Label(self.progress_window, text="正在准备...")
         self.progress_label.pack(pady=10)
 
-        self.progress_bar = ttk.Progressbar(self.progress_window, length=200, mode='determinate')
-        self.progress_bar.pack(pady=10)
-
-        self.slide_count_label = ttk.Label(self.progress_window, text=f"0/{total_slides} 页")
-        self.slide_count_label.pack(pady=10)
+        self.progress_bar = ttk.Progressbar(self.progress_window, length=260, mode='determinate')
+        self.progress_bar.pack(pady=5)
 
-        self.progress_window.update()
+        self.slide_count_label = ttk.Label(self.progress_window, text="")
+        self.slide_count_label.pack(pady=5)
 
-    def update_progress(self, current, total):
-        progress = (current / total) * 100
-        self.progress_bar['value'] = progress
-        self.slide_count_label.config(text=f"{current}/{total} 页")
-        self.progress_window.update()
+        self.cancel_button = ttk.Button(self.progress_window,
+                                        text="取消",
+                                        command=self.cancel_convert,
+                                        style="Orange.TButton")
+        self.cancel_button.pack(pady=10)
 
-    def get_max_slide_dimensions(self, temp_dir):
-        max_width = 0
-        max_height = 0
-        for file in os.listdir(temp_dir):
-            if file.startswith("slide_") and file.endswith(".png"):
-                with Image.open(os.path.join(temp_dir, file)) as img:
-                    width, height = img.size
-                    max_width = max(max_width, width)
-                    max_height = max(max_height, height)
+    def update_progress(self, event):
+        if self.progress_window is None:
+            return
+        if str(self.cancel_button['state']) != 'disabled':
+            self.progress_label.config(text=STAGE_NAMES.get(event['stage'], "正在转换..."))
 
-        # 确保尺寸为偶数
-        max_width = max_width + (max_width % 2)
-        max_height = max_height + (max_height % 2)
+        if event['percent'] is None:
+            self.progress_bar['value'] = 0
+            self.slide_count_label.config(text="")
+            return
 
-        return max_width, max_height
+        self.progress_bar['value'] = event['percent']
+        if event['stage'] == "render":
+            detail = f"{event['current']}/{event['total']} 页"
+        elif event['fps'] is not None:
+            detail = f"{event['percent']:.0f}%  {event['fps']:.1f} fps  {event['speed']:.2f}x"
+        else:
+            detail = f"{event['current']}/{event['total']}"
+        self.slide_count_label.config(text=f"{detail}  剩余 {format_eta(event['eta'])}")
 
     def edit_text(self):
-        if not os.path.exists("ppt_content.txt"):
+        # 打开当前所选PPT的文案
+        text_file = deck_text_file(self.ppt_path.get()) if self.ppt_path.get() else ""
+        if not text_file or not os.path.exists(text_file):
             messagebox.showerror("错误", "未找到文本文件，请先转换PPT")
             return
 
         # 使用系统默认编辑器打开文本文件
         if os.name == 'nt':  # Windows
-            os.startfile("ppt_content.txt")
+            os.startfile(text_file)
         else:  # Linux/Mac
-            subprocess.call(('xdg-open', "ppt_content.txt"))
+            subprocess.call(('xdg-open', text_file))
 
     def show_log(self):
         if self.log_window is None or not self.log_window.winfo_exists():
@@ -494,22 +393,60 @@ class PPTToVideo:
             scrollbar.pack(side='right', fill='y')
             text_widget.configure(yscrollcommand=scrollbar.set)
 
+            # 只读取上次之后新增的字节追加到末尾；日志被清空(开始新的转换)时从头读取
+            state = {'offset': 0, 'decoder': codecs.getincrementaldecoder('utf-8')(errors='replace')}
+
             def update_log():
-                if os.path.exists(self.log_file):
+                if not self.log_window.winfo_exists():
+                    return
+                try:
+                    size = os.path.getsize(self.log_file)
+                except OSError:
+                    size = None
+                if size is not None:
                     try:
-                        with open(self.log_file, 'r', encoding='utf-8') as f:
+                        if size < state['offset']:
                             text_widget.delete(1.0, tk.END)
-                            text_widget.insert(tk.END, f.read())
+                            state['offset'] = 0
+                            state['decoder'].reset()
+                        if size > state['offset']:
+                            with open(self.log_file, 'rb') as f:
+                                f.seek(state['offset'])
+                                data = f.read(size - state['offset'])
+                            state['offset'] += len(data)
+                            # 已滚动到底部时跟随新内容，否则保持查看位置
+                            at_end = text_widget.yview()[1] >= 1.0
+                            text_widget.insert(tk.END, state['decoder'].decode(data))
+                            if at_end:
+                                text_widget.see(tk.END)
                     except Exception as e:
-                        text_widget.delete(1.0, tk.END)
-                        text_widget.insert(tk.END, f"读取日志出错: {str(e)}")
+                        text_widget.insert(tk.END, f"\n读取日志出错: {str(e)}\n")
                 self.log_window.after(1000, update_log)
 
             update_log()
 
+    def update_subtitles(self):
+        # 修改文案后只替换视频中的字幕轨，不重新转换
+        output_video = os.path.join(self.temp_dir or "", "output.mp4")
+        if not self.ppt_path.get() or not self.temp_dir or not os.path.exists(output_video):
+            messagebox.showerror("错误", "未找到转换后的视频文件")
+            return
+        if self.job is not None and self.job.is_running():
+            messagebox.showwarning("警告", "已有转换任务正在进行")
+            return
+        try:
+            converter = PPTConverter(config=self.get_config(),
+                                     temp_dir=self.temp_dir,
+                                     log_file=self.log_file,
+                                     text_file=deck_text_file(self.ppt_path.get()))
+            converter.update_subtitles(self.ppt_path.get(), output_video)
+            messagebox.showinfo("成功", "字幕已更新")
+        except Exception as e:
+            messagebox.showerror("错误", f"更新字幕失败：{str(e)}")
+
     def save_video_as(self):
-        output_video = os.path.join(self.temp_dir, "output.mp4")
-        if not os.path.exists(output_video):
+        output_video = os.path.join(self.temp_dir or "", "output.mp4")
+        if not self.temp_dir or not os.path.exists(output_video):
             messagebox.showerror("错误", "未找到转换后的视频文件")
             return
 
@@ -519,7 +456,8 @@ class PPTToVideo:
         )
         if filename:
             try:
-                shutil.copy2(output_video, filename)
+                # 同一磁盘上用硬链接，支持的文件系统上用reflink，都不行时才复制
+                handoff(output_video, filename, keep_source=True)
                 messagebox.showinfo("成功", "视频已保存")
             except Exception as e:
                 messagebox.showerror("错误", f"保存视频失败：{str(e)}")
@@ -536,36 +474,21 @@ class PPTToVideo:
                     self.resolution.set(config.get('resolution', '自动'))
                     self.auto_next.set(config.get('auto_next', True))
                     self.save_text.set(config.get('save_text', True))
+                    self.narration.set(config.get('narration', False))
+                    self.subtitles.set(config.get('subtitles', '软字幕'))
                     self.transition_effect.set(config.get('transition_effect', '无'))
         except Exception as e:
             messagebox.showwarning("警告", f"加载配置文件失败：{str(e)}")
 
     def save_config(self):
         try:
-            config = {
-                'slide_duration': self.slide_duration.get(),
-                'transition_duration': self.transition_duration.get(),
-                'video_quality': self.video_quality.get(),
-                'bgm_volume': self.bgm_volume.get(),
-                'resolution': self.resolution.get(),
-                'auto_next': self.auto_next.get(),
-                'save_text': self.save_text.get(),
-                'transition_effect': self.transition_effect.get()
-            }
+            config = self.get_config()
             with open(self.config_path, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=4, ensure_ascii=False)
             messagebox.showinfo("成功", "配置已保存")
         except Exception as e:
             messagebox.showerror("错误", f"保存配置失败：{str(e)}")
 
-    def get_ffmpeg_quality_params(self):
-        quality_settings = {
-            "低质量": ["-crf", "28", "-preset", "faster"],
-            "中等质量": ["-crf", "23", "-preset", "medium"],
-            "高质量": ["-crf", "18", "-preset", "slow"]
-        }
-        return quality_settings.get(self.video_quality.get(), quality_settings["高质量"])
-
     def select_ppt(self):
         filename = filedialog.askopenfilename(
             title="选择PPT文件",
@@ -586,6 +509,329 @@ class PPTToVideo:
         self.window.mainloop()
 
 
+def run_bench(args, config):
+    overrides = {'encode_mode': args.encode_mode, 'renderer': args.renderer}
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    results = run_benchmark(args.work_dir, parse_list(args.resolutions), parse_list(args.qualities),
+                            parse_list(args.transitions), args.slides, args.images, args.words,
+                            args.slide_duration, args.repeat, config, args.cold_render)
+    save_results(args.output, results)
+    failed = [case for case in results['cases'] if not case['ok']]
+    print(f"共{len(results['cases'])}项，失败{len(failed)}项，结果：{args.output}")
+    if not args.baseline:
+        return 1 if failed else 0
+    if args.update_baseline or not os.path.exists(args.baseline):
+        save_results(args.baseline, results)
+        print(f"已写入基准结果：{args.baseline}")
+        return 1 if failed else 0
+
+    baseline = load_results(args.baseline)
+    mismatches = baseline_mismatches(baseline, results)
+    if mismatches:
+        print(f"警告：与基准结果的{'、'.join(mismatches)}不同，结果可能不可比", file=sys.stderr)
+    regressions = compare_results(baseline, results, args.threshold)
+    for item in regressions:
+        if item['field'] == 'ok':
+            print(f"[回退] {item['id']}：基准中成功，本次失败")
+        else:
+            print(f"[回退] {item['id']} {item['field']}：{item['baseline']} -> {item['current']} "
+                  f"(+{item['change'] * 100:.0f}%)")
+    print(f"与基准相比{len(regressions)}项回退(阈值{args.threshold * 100:g}%)")
+    return 1 if regressions or failed else 0
+
+
+def show_encoders(args):
+    profiler = EncoderProfiler(args.cache_dir, print)
+    available = available_encoders()
+    for name, encoder in ENCODERS.items():
+        if name not in available:
+            print(f"{name}：当前FFmpeg不支持")
+            continue
+        fps = profiler.encoder_fps(encoder) if args.profile else profiler.load().get(name)
+        if not fps:
+            print(f"{name}：未测试，使用--profile测试编码速度")
+            continue
+        print(f"{name}(fps@{PROFILE_WIDTH}x{PROFILE_HEIGHT})：" +
+              "，".join(f"{preset} {value:g}" for preset, value in fps.items()))
+    print(f"当前可用CPU约{available_share():.0%}，速度测试结果：{profiler.path}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ppt2video", description="PPT转视频工具，不带参数时启动图形界面")
+    subparsers = parser.add_subparsers(dest="command")
+
+    convert_parser = subparsers.add_parser("convert", help="无界面转换，支持目录和清单批量转换")
+    convert_parser.add_argument("inputs", nargs="+", help="PPT文件、目录或清单文件(.txt/.json)")
+    convert_parser.add_argument("-o", "--output-dir", default="output", help="视频输出目录")
+    convert_parser.add_argument("--bgm", help="背景音乐文件")
+    convert_parser.add_argument("--config", default="config.json", help="配置文件路径")
+    convert_parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="并行进程数")
+    convert_parser.add_argument("--work-dir", help="临时文件目录，默认为当前目录下的TEMP，每个任务在其中使用独立的子目录")
+    convert_parser.add_argument("--ram-workspace", action="store_true",
+                                help="空间足够时把任务的工作目录放在内存盘(/dev/shm)上")
+    convert_parser.add_argument("--dry-run", action="store_true",
+                                help="只读取PPT生成转换计划并估算渲染、编码耗时，以JSON输出，不实际转换")
+    convert_parser.add_argument("--slide-duration", help="每页停留时间(秒)")
+    convert_parser.add_argument("--transition-duration", help="转场时间(秒)")
+    convert_parser.add_argument("--quality", choices=list(QUALITY_SETTINGS.keys()), help="视频质量")
+    convert_parser.add_argument("--resolution", help="分辨率，如1920x1080，默认自动")
+    convert_parser.add_argument("--codec", choices=ENCODER_NAMES,
+                                help="视频编码器，默认libx264；自动时按速度目标选择压缩率最高的可用编码器，"
+                                     "未设置速度目标时为libx264")
+    convert_parser.add_argument("--encoder-threads", help="编码器线程数，默认由编码器决定")
+    convert_parser.add_argument("--encoder-slices", help="编码器分片数(x265为slices，AV1和VP9为tile列数)")
+    convert_parser.add_argument("--deadline", help="编码耗时上限(秒)，按本机测得的编码速度和当前负载选择能按时完成的最慢预设")
+    convert_parser.add_argument("--realtime-factor",
+                                help="编码速度目标，为视频时长的倍数，如2表示每秒视频的编码时间不超过0.5秒")
+    convert_parser.add_argument("--bgm-volume", help="背景音量(0-1)")
+    convert_parser.add_argument("--transition", choices=list(TRANSITION_EFFECTS.keys()), help="转场效果")
+    convert_parser.add_argument("--no-text", action="store_true", help="不保存提取文本")
+    convert_parser.add_argument("--no-cache", action="store_true", help="不使用幻灯片渲染缓存")
+    convert_parser.add_argument("--cache-size-mb", help="渲染缓存容量上限(MB)")
+    convert_parser.add_argument("--renderer", choices=RENDERER_NAMES,
+                                help="幻灯片渲染方式，自动模式下Windows用PowerPoint，其他系统用LibreOffice")
+    convert_parser.add_argument("--render-workers", help="LibreOffice栅格化并行数，默认为CPU核数")
+    convert_parser.add_argument("--renderer-pool", action="store_true",
+                                help="保持常驻的PowerPoint或LibreOffice实例，批量转换时每个PPT只需打开和导出")
+    convert_parser.add_argument("--renderer-pool-size", help="每个进程的常驻LibreOffice实例数，默认2；PowerPoint是单实例程序，固定为1个且各进程轮流使用")
+    convert_parser.add_argument("--renderer-max-documents", help="常驻实例处理多少个文档后重启")
+    convert_parser.add_argument("--renderer-max-memory-mb", help="常驻实例内存超过该值(MB)后重启")
+    convert_parser.add_argument("--render-timeout", help="单个PPT渲染超时(秒)，超时后结束渲染进程")
+    convert_parser.add_argument("--encode-mode", choices=["concat", "pipe", "segment"],
+                                help="concat为图片列表输入，pipe为解码后直接以rawvideo写入ffmpeg，"
+                                     "segment为每页单独低帧率编码后流复制拼接")
+    convert_parser.add_argument("--fps", help="输出帧率")
+    convert_parser.add_argument("--hold-fps", help="分段编码模式下停留画面的帧率")
+    convert_parser.add_argument("--encode-workers", help="分段编码并行数，默认为CPU核数")
+    convert_parser.add_argument("--no-segment-cache", action="store_true",
+                                help="分段编码模式下不复用已编码的分段，全部重新编码")
+    convert_parser.add_argument("--intro", help="片头视频，按输出参数转码一次后缓存，之后各任务流复制拼接")
+    convert_parser.add_argument("--outro", help="片尾视频")
+    convert_parser.add_argument("--background-video", help="循环播放的背景视频，显示在幻灯片四周的补边处")
+    convert_parser.add_argument("--collapse-duplicates", action="store_true",
+                                help="渲染后合并内容完全相同的连续页(如重复的章节页)，减少编码量")
+    convert_parser.add_argument("--duplicate-threshold",
+                                help="同时合并近似页的感知哈希距离阈值(0-64)，如4；近似页还需按原分辨率逐像素确认。"
+                                     "默认只合并内容完全相同的页")
+    convert_parser.add_argument("--narration", action="store_true",
+                                help="按提取的文案逐页合成配音，每页停留时间跟随配音长度")
+    convert_parser.add_argument("--tts-engine", choices=TTS_ENGINES, help="离线语音合成引擎")
+    convert_parser.add_argument("--tts-voice", help="配音音色")
+    convert_parser.add_argument("--tts-rate", help="配音语速")
+    convert_parser.add_argument("--tts-workers", help="配音合成并行进程数，默认为CPU核数")
+    convert_parser.add_argument("--narration-padding", help="每段配音后的留白(秒)")
+    convert_parser.add_argument("--no-duck", action="store_true", help="配音时不压低背景音乐")
+    convert_parser.add_argument("--bgm-loudness",
+                                help="背景音乐响度归一化目标(LUFS)，默认-20，为空时不归一化；测量结果按文件缓存")
+    convert_parser.add_argument("--subtitles", choices=list(SUBTITLE_MODES.keys()),
+                                help="按每页文案生成字幕，软字幕可随时替换，烧录字幕直接画在画面上")
+    convert_parser.add_argument("--renditions",
+                                help="输出规格，逗号分隔，如1080p,720p,480p；第一个规格为主输出，画面只解码一次")
+    convert_parser.add_argument("--stream-formats", help="多规格的输出格式，逗号分隔，可选mp4,hls,dash")
+    convert_parser.add_argument("--hls-segment-seconds", help="HLS/DASH分片时长(秒)，各规格的关键帧按此对齐")
+    convert_parser.add_argument("--preview", action="store_true",
+                                help="快速预览：复用转换计划和渲染缓存，缩小到约360p，以低帧率和最快的预设编码，"
+                                     "输出<PPT名>_preview.mp4")
+    convert_parser.add_argument("--start-slide", type=int, help="预览的起始页(从1开始)")
+    convert_parser.add_argument("--no-report", action="store_true",
+                                help="不写出<PPT名>_report.json运行报告(各阶段耗时、CPU时间、内存峰值和ffmpeg速度)")
+    convert_parser.add_argument("--metrics-textfile",
+                                help="同时以Prometheus文本格式写出最近一次转换的指标，供node_exporter的textfile collector读取")
+
+    subtitles_parser = subparsers.add_parser("subtitles", help="修改文案后替换已生成视频的字幕轨，不重新编码")
+    subtitles_parser.add_argument("ppt", help="生成该视频的PPT文件")
+    subtitles_parser.add_argument("video", help="要更新字幕的视频文件")
+    subtitles_parser.add_argument("--text", help="文案文件，默认为输出目录下的<PPT名>_content.txt")
+    subtitles_parser.add_argument("--config", default="config.json", help="配置文件路径")
+
+    daemon_parser = subparsers.add_parser("daemon", help="常驻服务：监视收件箱目录，新PPT进入持久化队列后并行转换")
+    daemon_parser.add_argument("inbox", help="收件箱目录，放入的PPT会被移入队列目录")
+    daemon_parser.add_argument("outbox", help="发件箱目录，存放生成的视频、字幕、文案和日志")
+    daemon_parser.add_argument("--bgm", help="背景音乐文件")
+    daemon_parser.add_argument("--config", default="config.json", help="配置文件路径")
+    daemon_parser.add_argument("--queue-dir", default=QUEUE_DIR, help="队列数据库和任务文件目录")
+    daemon_parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="并行进程数")
+    daemon_parser.add_argument("--poll-interval", type=float, default=2.0, help="扫描收件箱的间隔(秒)")
+    daemon_parser.add_argument("--max-attempts", type=int, default=3, help="失败后最多尝试次数")
+    daemon_parser.add_argument("--renderer-pool", action="store_true",
+                               help="每个工作进程保持常驻的渲染实例，在多个任务间复用")
+    daemon_parser.add_argument("--ram-workspace", action="store_true",
+                               help="空间足够时把任务的工作目录放在内存盘(/dev/shm)上")
+    daemon_parser.add_argument("--metrics-textfile",
+                               help="以Prometheus文本格式写出最近一次转换的指标，供node_exporter的textfile collector读取")
+
+    bench_parser = subparsers.add_parser("bench", help="生成合成PPT，按分辨率、质量和转场效果逐项转换并记录耗时，"
+                                                       "可与基准结果对比检查性能回退")
+    bench_parser.add_argument("-o", "--output", default="bench_results.json", help="结果JSON文件")
+    bench_parser.add_argument("--work-dir", default="BENCH", help="合成PPT、背景音乐、缓存和输出视频所在目录")
+    bench_parser.add_argument("--config", default="config.json", help="配置文件路径，矩阵以外的参数按此设置")
+    bench_parser.add_argument("--slides", type=int, default=10, help="合成PPT的页数")
+    bench_parser.add_argument("--images", type=int, default=1, help="每页的图片数")
+    bench_parser.add_argument("--words", type=int, default=60, help="每页正文的词数")
+    bench_parser.add_argument("--slide-duration", type=float, default=3.0, help="每页停留时间(秒)")
+    bench_parser.add_argument("--resolutions", default=",".join(BENCH_RESOLUTIONS), help="分辨率，逗号分隔")
+    bench_parser.add_argument("--qualities", default=",".join(BENCH_QUALITIES), help="视频质量，逗号分隔")
+    bench_parser.add_argument("--transitions", default=",".join(BENCH_TRANSITIONS), help="转场效果，逗号分隔")
+    bench_parser.add_argument("--repeat", type=int, default=1, help="每项重复次数，结果取中位数")
+    bench_parser.add_argument("--encode-mode", choices=["concat", "pipe", "segment"], help="编码模式")
+    bench_parser.add_argument("--renderer", choices=RENDERER_NAMES, help="幻灯片渲染方式")
+    bench_parser.add_argument("--cold-render", action="store_true",
+                              help="每项都重新渲染；默认同一分辨率只渲染一次，之后使用渲染缓存")
+    bench_parser.add_argument("--baseline", help="基准结果JSON，比较后有回退时返回码为1")
+    bench_parser.add_argument("--threshold", type=float, default=0.1,
+                              help="耗时、CPU时间或内存峰值超过基准的比例，默认0.1")
+    bench_parser.add_argument("--update-baseline", action="store_true", help="把本次结果写入--baseline指定的文件")
+
+    encoders_parser = subparsers.add_parser("encoders", help="查看可用的视频编码器和本机测得的各预设编码速度")
+    encoders_parser.add_argument("--profile", action="store_true", help="测试尚未测过的编码器的速度并缓存结果")
+    encoders_parser.add_argument("--cache-dir", default=CACHE_DIR, help="缓存目录")
+
+    status_parser = subparsers.add_parser("status", help="查看队列深度、吞吐量和各阶段耗时")
+    status_parser.add_argument("--queue-dir", default=QUEUE_DIR, help="队列数据库和任务文件目录")
+    status_parser.add_argument("--window", type=float, default=3600, help="统计最近多少秒")
+    status_parser.add_argument("--json", action="store_true", help="以JSON输出")
+
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        if tk is None:
+            parser.error("未安装tkinter，无法启动图形界面，请使用convert子命令")
+        app = PPTToVideo()
+        app.run()
+        return 0
+
+    if args.command == "status":
+        status = JobQueue(args.queue_dir).status(args.window)
+        if args.json:
+            print(json.dumps(status, indent=2, ensure_ascii=False))
+            return 0
+        print(f"排队{status['queued']}个，运行中{status['running']}个，"
+              f"已完成{status['done']}个，失败{status['failed']}个")
+        avg_job = f"，平均每个{status['avg_job_seconds']:.1f}秒" if status['avg_job_seconds'] else ""
+        print(f"最近{status['window_seconds'] / 60:g}分钟完成{status['finished_in_window']}个"
+              f"({status['jobs_per_hour']:.1f}个/小时){avg_job}")
+        for stage in status['stages']:
+            print(f"  {stage['stage']}：{stage['count']}次，平均{stage['avg_seconds']:.1f}秒，"
+                  f"最长{stage['max_seconds']:.1f}秒")
+        for job in status['running_jobs']:
+            print(f"  #{job['id']} {job['name']} 阶段：{job['stage'] or '-'} 第{job['attempts']}次")
+        return 0
+
+    if args.command == "encoders":
+        return show_encoders(args)
+
+    config = load_config_file(args.config)
+    if args.command == "bench":
+        return run_bench(args, config)
+
+    if args.command == "daemon":
+        if args.renderer_pool:
+            config['renderer_pool'] = True
+        if args.ram_workspace:
+            config['ram_workspace'] = True
+        if args.metrics_textfile:
+            config['metrics_textfile'] = args.metrics_textfile
+        try:
+            return run_daemon(args.inbox, args.outbox, config, args.bgm, args.workers, args.queue_dir,
+                              args.poll_interval, args.max_attempts)
+        except KeyboardInterrupt:
+            print("已停止，未完成的任务下次启动时继续")
+            return 0
+
+    if args.command == "subtitles":
+        stem = os.path.splitext(os.path.basename(args.ppt))[0]
+        text_file = args.text or os.path.join(os.path.dirname(os.path.abspath(args.video)), f"{stem}_content.txt")
+        with Workspace(os.path.join(os.getcwd(), "TEMP"), "subtitles") as workspace:
+            converter = PPTConverter(config=config, temp_dir=workspace.path,
+                                     log_file=os.devnull, text_file=text_file)
+            subtitle_path = converter.update_subtitles(args.ppt, args.video)
+        print(f"[完成] {args.video}，字幕文件：{subtitle_path}")
+        return 0
+
+    overrides = {
+        'slide_duration': args.slide_duration,
+        'transition_duration': args.transition_duration,
+        'video_quality': args.quality,
+        'resolution': args.resolution,
+        'video_codec': args.codec,
+        'encoder_threads': args.encoder_threads,
+        'encoder_slices': args.encoder_slices,
+        'encode_deadline': args.deadline,
+        'realtime_factor': args.realtime_factor,
+        'bgm_volume': args.bgm_volume,
+        'transition_effect': args.transition,
+        'cache_size_mb': args.cache_size_mb,
+        'renderer': args.renderer,
+        'render_workers': args.render_workers,
+        'renderer_pool_size': args.renderer_pool_size,
+        'renderer_max_documents': args.renderer_max_documents,
+        'renderer_max_memory_mb': args.renderer_max_memory_mb,
+        'render_timeout': args.render_timeout,
+        'encode_mode': args.encode_mode,
+        'fps': args.fps,
+        'hold_fps': args.hold_fps,
+        'encode_workers': args.encode_workers,
+        'tts_engine': args.tts_engine,
+        'tts_voice': args.tts_voice,
+        'tts_rate': args.tts_rate,
+        'tts_workers': args.tts_workers,
+        'narration_padding': args.narration_padding,
+        'subtitles': args.subtitles,
+        'bgm_loudness': args.bgm_loudness,
+        'renditions': args.renditions,
+        'stream_formats': args.stream_formats,
+        'hls_segment_seconds': args.hls_segment_seconds,
+        'duplicate_threshold': args.duplicate_threshold,
+        'intro_video': args.intro,
+        'outro_video': args.outro,
+        'background_video': args.background_video,
+        'metrics_textfile': args.metrics_textfile
+    }
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    if args.no_text:
+        config['save_text'] = False
+    if args.no_cache:
+        config['render_cache'] = False
+    if args.renderer_pool:
+        config['renderer_pool'] = True
+    if args.no_segment_cache:
+        config['segment_cache'] = False
+    if args.narration:
+        config['narration'] = True
+    if args.no_duck:
+        config['bgm_duck'] = False
+    if args.collapse_duplicates:
+        config['collapse_duplicates'] = True
+    if args.ram_workspace:
+        config['ram_workspace'] = True
+    if args.no_report:
+        config['run_report'] = False
+    if args.start_slide is not None and not args.preview:
+        parser.error("--start-slide需要与--preview一起使用")
+    if args.preview:
+        config = preview_config(config, args.start_slide)
+
+    jobs = collect_jobs(args.inputs, args.bgm)
+    if not jobs:
+        print("未找到需要转换的PPT文件", file=sys.stderr)
+        return 1
+
+    if args.dry_run:
+        print(json.dumps(plan_jobs(jobs, args.output_dir, config, args.work_dir), indent=2, ensure_ascii=False))
+        return 0
+
+    def on_result(result):
+        if result['ok']:
+            print(f"[完成] {result['ppt']} -> {result['output']} ({result['seconds']:.1f}秒)")
+        else:
+            print(f"[失败] {result['ppt']}：{result['error']}", file=sys.stderr)
+
+    results = batch_convert(jobs, args.output_dir, config, args.workers, args.work_dir, on_result)
+    failed = [r for r in results if not r['ok']]
+    print(f"共{len(results)}个，成功{len(results) - len(failed)}个，失败{len(failed)}个")
+    return 1 if failed else 0
+
+
 if __name__ == "__main__":
-    app = PPTToVideo()
-    app.run()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
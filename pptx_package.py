@@ -0,0 +1,65 @@
+import posixpath
+import xml.etree.ElementTree as ET
+
+
+# 直接读取PPTX压缩包中的部件，不加载python-pptx对象
+NS = {
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships'
+}
+
+PRESENTATION_PART = "ppt/presentation.xml"
+
+# 每英寸914400 EMU，PowerPoint按96DPI导出图片
+EMU_PER_PIXEL = 9525
+
+
+def rels_part_name(part_name):
+    directory, name = posixpath.split(part_name)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+def resolve_target(part_name, target):
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part_name), target))
+
+
+def read_rels(zf, part_name):
+    # 返回[(rId, 关系类型, 目标部件)]，忽略外部链接
+    try:
+        data = zf.read(rels_part_name(part_name))
+    except KeyError:
+        return []
+    rels = []
+    for rel in ET.fromstring(data).findall('rel:Relationship', NS):
+        if rel.get('TargetMode') == 'External':
+            continue
+        rel_type = rel.get('Type', '').rsplit('/', 1)[-1]
+        rels.append((rel.get('Id'), rel_type, resolve_target(part_name, rel.get('Target'))))
+    return rels
+
+
+def slide_part_names(zf):
+    # 按presentation.xml中的顺序返回幻灯片部件，文件名编号不一定等于放映顺序
+    root = ET.fromstring(zf.read(PRESENTATION_PART))
+    targets = {rid: target for rid, _, target in read_rels(zf, PRESENTATION_PART)}
+    slides = []
+    sld_id_list = root.find('p:sldIdLst', NS)
+    if sld_id_list is not None:
+        for sld_id in sld_id_list.findall('p:sldId', NS):
+            rid = sld_id.get(f"{{{NS['r']}}}id")
+            if rid in targets:
+                slides.append(targets[rid])
+    return slides
+
+
+def slide_size(zf):
+    # 返回幻灯片尺寸(EMU)，默认为16:9
+    root = ET.fromstring(zf.read(PRESENTATION_PART))
+    size = root.find('p:sldSz', NS)
+    if size is None:
+        return 12192000, 6858000
+    return int(size.get('cx')), int(size.get('cy'))
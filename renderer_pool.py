@@ -0,0 +1,484 @@
+import os
+import queue
+import shutil
+import signal
+import socket
+import atexit
+import tempfile
+import threading
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from renderers import (SlideRenderer, PowerPointRenderer, LibreOfficeRenderer, RENDER_TIMEOUT,
+                       resolve_renderer_name)
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# 常驻渲染实例：每个文档只需打开和导出，不再为每个PPT启动一次PowerPoint或LibreOffice
+DEFAULT_MAX_DOCUMENTS = 50
+DEFAULT_MAX_MEMORY_MB = 1500
+STARTUP_TIMEOUT = 60
+HEALTH_CHECK_TIMEOUT = 10
+
+
+def process_tree_rss(pid):
+    # 返回进程及其子进程占用的物理内存(字节)，无法获取时返回None
+    # LibreOffice的soffice启动器会再拉起soffice.bin，内存主要在子进程中
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+        except psutil.Error:
+            return None
+    if not os.path.isdir("/proc"):
+        return None
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat", 'r') as f:
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    tree = {pid}
+    changed = True
+    while changed:
+        children = {child for child, parent in parents.items() if parent in tree} - tree
+        changed = bool(children)
+        tree |= children
+    total = 0
+    for member in tree:
+        try:
+            with open(f"/proc/{member}/status", 'r') as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+def kill_process_tree(pid):
+    try:
+        if os.name == 'nt':
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def uno_properties(**values):
+    properties = []
+    for name, value in values.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        properties.append(prop)
+    return tuple(properties)
+
+
+class LibreOfficeInstance:
+    # 无界面的LibreOffice监听本地端口，通过UNO打开文档并导出PDF，进程在多个文档间复用
+    name = LibreOfficeRenderer.name
+
+    def __init__(self, soffice=None, startup_timeout=STARTUP_TIMEOUT):
+        if uno is None:
+            raise Exception("未找到LibreOffice的Python UNO模块(python3-uno)，无法使用渲染器池")
+        soffice = soffice or shutil.which("soffice") or shutil.which("libreoffice") or "soffice"
+        self.documents = 0
+        self.profile_dir = tempfile.mkdtemp(prefix="ppt2video_lo_")
+        self.port = free_port()
+        self.process = subprocess.Popen([
+            soffice, "--headless", "--invisible", "--norestore", "--nolockcheck", "--nodefault", "--nologo",
+            f"-env:UserInstallation={Path(self.profile_dir).resolve().as_uri()}",
+            f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=(os.name != 'nt'))
+        self.pid = self.process.pid
+        try:
+            self.desktop = self.connect(startup_timeout)
+        except Exception:
+            self.close()
+            raise
+
+    def connect(self, timeout):
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context)
+        deadline = time.time() + timeout
+        while True:
+            if self.process.poll() is not None:
+                raise Exception("LibreOffice启动失败")
+            try:
+                context = resolver.resolve(
+                    f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext")
+                return context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+            except Exception:
+                if time.time() > deadline:
+                    raise Exception("连接LibreOffice超时")
+                time.sleep(0.5)
+
+    def is_healthy(self):
+        if self.process.poll() is not None:
+            return False
+        try:
+            self.desktop.getComponents()
+            return True
+        except Exception:
+            return False
+
+    def export_pdf(self, ppt_path, pdf_path):
+        document = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(ppt_path)), "_blank", 0,
+            uno_properties(Hidden=True, ReadOnly=True))
+        if document is None:
+            raise Exception(f"LibreOffice无法打开文件：{os.path.basename(ppt_path)}")
+        try:
+            # 与命令行转换相同，导出隐藏页保证PDF页码与幻灯片编号一致
+            filter_data = uno.Any("[]com.sun.star.beans.PropertyValue", uno_properties(ExportHiddenSlides=True))
+            uno.invoke(document, "storeToURL", (
+                uno.systemPathToFileUrl(os.path.abspath(pdf_path)),
+                uno_properties(FilterName="impress_pdf_Export", FilterData=filter_data)))
+        finally:
+            document.close(True)
+
+    def render(self, renderer, ppt_path, output_dir, slide_indices, width, height, progress):
+        with tempfile.TemporaryDirectory(prefix="ppt2video_") as pdf_dir:
+            pdf_path = os.path.join(pdf_dir, "slides.pdf")
+            self.export_pdf(ppt_path, pdf_path)
+            renderer.rasterizer.rasterize_pdf(pdf_path, output_dir, slide_indices, width, height, progress)
+
+    def memory(self):
+        return process_tree_rss(self.pid)
+
+    def kill(self):
+        kill_process_tree(self.pid)
+
+    def close(self):
+        try:
+            self.desktop.terminate()
+            self.process.wait(timeout=10)
+        except Exception:
+            self.kill()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class PowerPointInstance:
+    # COM对象只能在创建它的线程中使用，每个实例有自己的线程，导出任务通过队列交给该线程执行
+    # PowerPoint是单实例程序，同一用户下各进程的实例都连接到同一个PowerPoint进程，关闭(Quit)或结束(kill)
+    # 会影响所有进程，因此每个进程的池中只有一个实例，导出、关闭和结束都在跨进程渲染锁内进行(见RendererPool)
+    name = PowerPointRenderer.name
+
+    def __init__(self, startup_timeout=STARTUP_TIMEOUT):
+        self.documents = 0
+        self.pid = None
+        self.tasks = queue.Queue()
+        self.ready = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+        if not self.ready.wait(startup_timeout):
+            raise Exception("启动PowerPoint超时")
+        if self.error:
+            raise self.error
+
+    def loop(self):
+        powerpoint = None
+        com_initialized = False
+        try:
+            try:
+                import comtypes
+                import comtypes.client
+
+                comtypes.CoInitialize()
+                com_initialized = True
+                powerpoint = comtypes.client.CreateObject("Powerpoint.Application")
+                self.pid = self.window_pid(powerpoint)
+            except Exception as e:
+                self.error = Exception(f"启动PowerPoint失败：{str(e)}")
+                return
+            finally:
+                self.ready.set()
+
+            while True:
+                task = self.tasks.get()
+                if task is None:
+                    break
+                func, args, done = task
+                try:
+                    done['result'] = func(powerpoint, *args)
+                except Exception as e:
+                    done['error'] = e
+                done['event'].set()
+        finally:
+            try:
+                powerpoint.Quit()
+            except:
+                pass
+            powerpoint = None
+            if com_initialized:
+                comtypes.CoUninitialize()
+
+    def window_pid(self, powerpoint):
+        import ctypes
+        from ctypes import wintypes
+
+        pid = wintypes.DWORD()
+        ctypes.windll.user32.GetWindowThreadProcessId(powerpoint.HWND, ctypes.byref(pid))
+        return pid.value
+
+    def call(self, func, *args, timeout=None):
+        if not self.thread.is_alive():
+            raise Exception("PowerPoint实例已退出")
+        done = {'event': threading.Event()}
+        self.tasks.put((func, args, done))
+        if not done['event'].wait(timeout):
+            raise Exception("PowerPoint无响应")
+        if 'error' in done:
+            raise done['error']
+        return done.get('result')
+
+    def is_healthy(self):
+        try:
+            self.call(lambda powerpoint: powerpoint.Version, timeout=HEALTH_CHECK_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    def render(self, renderer, ppt_path, output_dir, slide_indices, width, height, progress):
+        def export(powerpoint):
+            # 只读、无窗口打开，不需要让PowerPoint可见
+            ppt = powerpoint.Presentations.Open(os.path.abspath(ppt_path), True, False, False)
+            try:
+                renderer.exporter.export_slides(ppt, output_dir, slide_indices, width, height, progress)
+            finally:
+                ppt.Close()
+                ppt = None
+
+        # 正常情况下由渲染器的超时结束实例，这里只防止实例线程本身卡死
+        self.call(export, timeout=renderer.pool.timeout + HEALTH_CHECK_TIMEOUT)
+
+    def memory(self):
+        return process_tree_rss(self.pid) if self.pid else None
+
+    def kill(self):
+        if self.pid:
+            kill_process_tree(self.pid)
+
+    def close(self):
+        self.tasks.put(None)
+        self.thread.join(timeout=30)
+        if self.thread.is_alive():
+            self.kill()
+
+
+INSTANCE_TYPES = {
+    LibreOfficeInstance.name: LibreOfficeInstance,
+    PowerPointInstance.name: PowerPointInstance
+}
+
+
+class RendererPool:
+    # 保持size个常驻实例并出借给转换任务；归还时按文档数和内存上限回收，出借前做健康检查
+    # render_lock为跨进程渲染锁(PowerPoint)：租用期间和关闭实例时持有，其他进程不会在导出过程中被退出或结束实例
+    # 没有渲染锁时(单进程转换)仅保证本进程内串行，不要同时运行多个使用PowerPoint常驻实例的转换程序
+    def __init__(self, name, size=None, max_documents=DEFAULT_MAX_DOCUMENTS,
+                 max_memory_mb=DEFAULT_MAX_MEMORY_MB, timeout=RENDER_TIMEOUT, render_lock=None):
+        self.name = name
+        self.factory = INSTANCE_TYPES[name]
+        self.size = 1 if name == PowerPointInstance.name else (size or 2)
+        self.render_lock = render_lock
+        self.max_documents = max_documents
+        self.max_memory = max_memory_mb * 1024 * 1024 if max_memory_mb else 0
+        self.timeout = timeout
+        self.idle = queue.Queue()
+        self.count = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def warm(self):
+        # 预先启动全部实例，第一个任务不必等待启动
+        while True:
+            with self.lock:
+                if self.count >= self.size:
+                    return
+                self.count += 1
+            try:
+                self.idle.put(self.factory())
+            except Exception:
+                with self.lock:
+                    self.count -= 1
+                raise
+
+    def acquire(self):
+        while True:
+            try:
+                instance = self.idle.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    can_create = self.count < self.size
+                    if can_create:
+                        self.count += 1
+                if can_create:
+                    try:
+                        return self.factory()
+                    except Exception:
+                        with self.lock:
+                            self.count -= 1
+                        raise
+                instance = self.idle.get()
+            if instance.is_healthy():
+                return instance
+            self.discard(instance)
+
+    def release(self, instance, broken=False):
+        instance.documents += 1
+        memory = instance.memory() if self.max_memory else None
+        if (broken or self.closed or instance.documents >= self.max_documents
+                or (memory is not None and memory > self.max_memory)):
+            self.discard(instance)
+        else:
+            self.idle.put(instance)
+
+    def discard(self, instance):
+        with self.lock:
+            self.count -= 1
+        try:
+            instance.close()
+        except Exception:
+            instance.kill()
+        if not self.closed:
+            # 在后台补足实例数，下一个任务不必等待启动
+            threading.Thread(target=self.replenish, daemon=True).start()
+
+    def replenish(self):
+        try:
+            self.warm()
+        except Exception:
+            pass
+
+    @contextmanager
+    def locked(self):
+        if self.render_lock is None:
+            yield
+            return
+        self.render_lock.acquire()
+        try:
+            yield
+        finally:
+            self.render_lock.release()
+
+    @contextmanager
+    def lease(self):
+        # 健康检查、导出以及归还时的回收都在渲染锁内进行
+        with self.locked():
+            instance = self.acquire()
+            broken = False
+            try:
+                yield instance
+            except Exception:
+                broken = True
+                raise
+            finally:
+                self.release(instance, broken)
+
+    def close(self):
+        self.closed = True
+        with self.locked():
+            while True:
+                try:
+                    self.discard(self.idle.get_nowait())
+                except queue.Empty:
+                    return
+
+
+class PooledRenderer(SlideRenderer):
+    # 从渲染器池租用常驻实例导出；超时未完成时结束该实例，池会用新实例替换
+    # 需要跨进程串行时由池在租用期间持有渲染锁，超时和取消时结束实例也在锁内
+    def __init__(self, pool, workers=None):
+        super().__init__()
+        self.name = pool.name
+        self.pool = pool
+        self.instance = None
+        # 栅格化和逐页导出沿用普通渲染器的实现，取消时一并结束其子进程
+        self.rasterizer = LibreOfficeRenderer(workers=workers)
+        self.exporter = PowerPointRenderer()
+        self.rasterizer.cancel_event = self.exporter.cancel_event = self.cancel_event
+
+    def cancel(self):
+        super().cancel()
+        self.rasterizer.cancel()
+        instance = self.instance
+        if instance is not None:
+            instance.kill()
+
+    def render(self, ppt_path, output_dir, slide_indices, width=0, height=0, progress=None):
+        with self.pool.lease() as instance:
+            self.instance = instance
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                instance.kill()
+
+            watchdog = threading.Timer(self.pool.timeout, on_timeout)
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                instance.render(self, ppt_path, output_dir, slide_indices, width, height, progress)
+            except Exception:
+                if timed_out.is_set():
+                    raise Exception(f"渲染超时，已结束{self.name}实例")
+                raise
+            finally:
+                watchdog.cancel()
+                self.instance = None
+        self.check_cancelled()
+
+
+# 每个进程各自持有渲染器池，批量转换和常驻服务的工作进程在多个任务间复用
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pooled_renderer(name="自动", lock=None, workers=None, size=None, max_documents=DEFAULT_MAX_DOCUMENTS,
+                        max_memory_mb=DEFAULT_MAX_MEMORY_MB, timeout=RENDER_TIMEOUT):
+    name = resolve_renderer_name(name)
+    if name not in INSTANCE_TYPES:
+        raise Exception(f"不支持的渲染方式：{name}")
+    # 与get_renderer一致，只有PowerPoint需要跨进程串行；LibreOffice的常驻实例各自独立，多个任务可以同时渲染
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = RendererPool(name, size, max_documents, max_memory_mb, timeout,
+                                lock if name == PowerPointRenderer.name else None)
+            pool.warm()
+            _pools[name] = pool
+    return PooledRenderer(pool, workers)
+
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,217 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# LibreOffice默认不导出隐藏页，打开该选项保证PDF页码与幻灯片编号一致
+LIBREOFFICE_PDF_FILTER = 'pdf:impress_pdf_Export:{"ExportHiddenSlides":{"type":"boolean","value":"true"}}'
+
+# PowerPoint默认按96DPI导出，LibreOffice栅格化时保持相同尺寸
+DEFAULT_DPI = 96
+
+RENDER_TIMEOUT = 600
+
+
+def wait_for_file(path, timeout=30):
+    deadline = time.time() + timeout
+    while not os.path.exists(path):
+        if time.time() > deadline:
+            raise Exception(f"等待导出文件超时：{path}")
+        time.sleep(0.1)
+
+
+class SlideRenderer:
+    name = ""
+
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.processes = set()
+        self.process_lock = threading.Lock()
+
+    def cancel(self):
+        # 可以在其他线程调用：结束正在运行的子进程，渲染循环在下一页之前退出
+        self.cancel_event.set()
+        with self.process_lock:
+            for process in list(self.processes):
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise Exception("渲染已取消")
+
+    def run_process(self, cmd, timeout):
+        self.check_cancelled()
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with self.process_lock:
+            self.processes.add(process)
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise Exception(f"渲染超时：{os.path.basename(cmd[0])}")
+        finally:
+            with self.process_lock:
+                self.processes.discard(process)
+        self.check_cancelled()
+        return process.returncode, stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace')
+
+    def render(self, ppt_path, output_dir, slide_indices, width=0, height=0, progress=None):
+        # 将指定页(从1开始编号)导出为output_dir/slide_{i}.png
+        # slide_indices为None时导出全部页；width/height为0时使用幻灯片原始尺寸
+        raise NotImplementedError
+
+
+class PowerPointRenderer(SlideRenderer):
+    name = "powerpoint"
+
+    def __init__(self, lock=None):
+        super().__init__()
+        # 多进程批量转换时，PowerPoint只能单实例运行，需要用锁串行
+        self.lock = lock
+
+    def export_slides(self, ppt, output_dir, slide_indices, width=0, height=0, progress=None):
+        if slide_indices is None:
+            slide_indices = range(1, ppt.Slides.Count + 1)
+        total_slides = len(slide_indices)
+
+        for done, i in enumerate(slide_indices, 1):
+            self.check_cancelled()
+            slide = ppt.Slides(i)
+            image_path = os.path.join(output_dir, f"slide_{i}.png")
+
+            if width and height:
+                slide.Export(image_path, "PNG", width, height)
+            else:
+                slide.Export(image_path, "PNG")
+            slide = None
+
+            # Export是同步调用，这里只防止文件系统延迟，不再无限等待
+            wait_for_file(image_path)
+
+            if progress:
+                progress(done, total_slides)
+
+    def render(self, ppt_path, output_dir, slide_indices, width=0, height=0, progress=None):
+        powerpoint = None
+        ppt = None
+        com_initialized = False
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            import comtypes
+            import comtypes.client
+
+            # 可能在后台线程中调用，需要初始化该线程的COM
+            comtypes.CoInitialize()
+            com_initialized = True
+            powerpoint = comtypes.client.CreateObject("Powerpoint.Application")
+            powerpoint.Visible = 1
+
+            ppt = powerpoint.Presentations.Open(ppt_path)
+            self.export_slides(ppt, output_dir, slide_indices, width, height, progress)
+            ppt.Close()
+
+        finally:
+            try:
+                powerpoint.Quit()
+            except:
+                pass
+            # 释放COM对象后才能反初始化
+            ppt = None
+            powerpoint = None
+            if com_initialized:
+                comtypes.CoUninitialize()
+            if self.lock is not None:
+                self.lock.release()
+
+
+class LibreOfficeRenderer(SlideRenderer):
+    name = "libreoffice"
+
+    def __init__(self, soffice=None, workers=None, timeout=RENDER_TIMEOUT):
+        super().__init__()
+        self.soffice = soffice or shutil.which("soffice") or shutil.which("libreoffice") or "soffice"
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+
+    def convert_to_pdf(self, ppt_path, pdf_dir):
+        # 每次转换使用独立的用户配置目录，多个LibreOffice进程可以同时运行
+        profile_uri = Path(pdf_dir, "profile").resolve().as_uri()
+        cmd = [
+            self.soffice, "--headless", "--norestore", "--nolockcheck",
+            f"-env:UserInstallation={profile_uri}",
+            "--convert-to", LIBREOFFICE_PDF_FILTER,
+            "--outdir", pdf_dir,
+            ppt_path
+        ]
+        returncode, _, stderr = self.run_process(cmd, self.timeout)
+        pdf_path = os.path.join(pdf_dir, os.path.splitext(os.path.basename(ppt_path))[0] + ".pdf")
+        if returncode != 0 or not os.path.exists(pdf_path):
+            raise Exception(f"LibreOffice转换PDF失败：{stderr.strip()}")
+        return pdf_path
+
+    def rasterize_page(self, pdf_path, index, output_dir, width, height):
+        prefix = os.path.join(output_dir, f"slide_{index}")
+        cmd = ["pdftoppm", "-png", "-singlefile", "-f", str(index), "-l", str(index)]
+        if width and height:
+            cmd += ["-scale-to-x", str(width), "-scale-to-y", str(height)]
+        else:
+            cmd += ["-r", str(DEFAULT_DPI)]
+        cmd += [pdf_path, prefix]
+        returncode, _, stderr = self.run_process(cmd, self.timeout)
+        if returncode != 0:
+            raise Exception(f"第{index}页栅格化失败：{stderr.strip()}")
+
+    def count_pages(self, pdf_path):
+        _, stdout, _ = self.run_process(["pdfinfo", pdf_path], self.timeout)
+        for line in stdout.splitlines():
+            if line.startswith("Pages:"):
+                return int(line.split(':', 1)[1])
+        raise Exception("无法读取PDF页数")
+
+    def rasterize_pdf(self, pdf_path, output_dir, slide_indices, width=0, height=0, progress=None):
+        if slide_indices is None:
+            slide_indices = range(1, self.count_pages(pdf_path) + 1)
+        total_slides = len(slide_indices)
+
+        # 每页由独立的pdftoppm进程栅格化，渲染时间随核数而不是页数线性增长
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.rasterize_page, pdf_path, i, output_dir, width, height)
+                       for i in slide_indices]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                if progress:
+                    progress(done, total_slides)
+
+    def render(self, ppt_path, output_dir, slide_indices, width=0, height=0, progress=None):
+        with tempfile.TemporaryDirectory(prefix="ppt2video_") as pdf_dir:
+            pdf_path = self.convert_to_pdf(ppt_path, pdf_dir)
+            self.rasterize_pdf(pdf_path, output_dir, slide_indices, width, height, progress)
+
+
+RENDERER_NAMES = ["自动", PowerPointRenderer.name, LibreOfficeRenderer.name]
+
+
+def resolve_renderer_name(name):
+    # 自动模式下Windows使用PowerPoint，其他系统使用LibreOffice
+    if name in ("自动", "auto", "", None):
+        return PowerPointRenderer.name if os.name == 'nt' else LibreOfficeRenderer.name
+    return name
+
+
+def get_renderer(name="自动", lock=None, workers=None):
+    name = resolve_renderer_name(name)
+    if name == PowerPointRenderer.name:
+        return PowerPointRenderer(lock)
+    if name == LibreOfficeRenderer.name:
+        return LibreOfficeRenderer(workers=workers)
+    raise Exception(f"不支持的渲染方式：{name}")
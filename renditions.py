@@ -0,0 +1,173 @@
+import os
+
+from encoders import encoder_for_args
+
+
+# 多规格输出：合成后的画面只解码一次，split后按各规格缩放，在同一个ffmpeg进程中分别编码
+# 高度 -> (最大码率, 缓冲区)；宽度按画面比例计算，流媒体播放需要限制峰值码率
+RENDITION_PRESETS = {
+    "2160p": (2160, "16000k", "32000k"),
+    "1440p": (1440, "10000k", "20000k"),
+    "1080p": (1080, "6000k", "12000k"),
+    "720p": (720, "3000k", "6000k"),
+    "480p": (480, "1200k", "2400k"),
+    "360p": (360, "800k", "1600k")
+}
+
+STREAM_FORMATS = ("mp4", "hls", "dash")
+
+AUDIO_BITRATE = "128k"
+
+
+def parse_list(value):
+    if isinstance(value, (list, tuple)):
+        return [item.strip() for item in value if item.strip()]
+    return [item.strip() for item in str(value or "").split(",") if item.strip()]
+
+
+def tee_quote(value):
+    # tee的从输出选项要经过两层解析，引号本身也需要转义
+    return "\\'" + value.replace('\\', '/') + "\\'"
+
+
+def bitrate_kbps(value):
+    return int(value.rstrip("kK"))
+
+
+class RenditionLadder:
+    # names中第一个规格写入output_video作为主输出，其余写在同目录下：
+    # <主输出名>_<规格>.mp4、<主输出名>_hls/master.m3u8、<主输出名>_dash/manifest.mpd
+    def __init__(self, names, formats, width, height, encoder_args, fps, segment_seconds, output_video):
+        for name in names:
+            if name not in RENDITION_PRESETS:
+                raise Exception(f"不支持的输出规格：{name}，可选：{'、'.join(RENDITION_PRESETS)}")
+        for stream_format in formats:
+            if stream_format not in STREAM_FORMATS:
+                raise Exception(f"不支持的输出格式：{stream_format}，可选：{'、'.join(STREAM_FORMATS)}")
+        self.names = names
+        self.formats = formats
+        self.encoder_args = encoder_args
+        self.encoder = encoder_for_args(encoder_args)
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.output_video = output_video
+        self.base = os.path.splitext(output_video)[0]
+        self.sizes = [self.scaled_size(width, height, RENDITION_PRESETS[name][0]) for name in names]
+
+    def scaled_size(self, width, height, target_height):
+        # 保持合成画面的比例，宽高取偶数
+        scaled_width = round(width * target_height / height / 2) * 2
+        return scaled_width, target_height
+
+    def largest_size(self):
+        # 各规格共用一组流参数，level按最大的规格
+        return max(self.sizes, key=lambda size: size[0] * size[1])
+
+    def pixels(self):
+        return sum(width * height for width, height in self.sizes)
+
+    def mp4_path(self, index):
+        if index == 0:
+            return self.output_video
+        return f"{self.base}_{self.names[index]}.mp4"
+
+    def mp4_paths(self):
+        count = len(self.names) if "mp4" in self.formats else 1
+        return [self.mp4_path(i) for i in range(count)]
+
+    def hls_dir(self):
+        return self.base + "_hls"
+
+    def dash_dir(self):
+        return self.base + "_dash"
+
+    def extra_outputs(self):
+        # 主输出以外的文件和目录，相对主输出的后缀
+        suffixes = [f"_{name}.mp4" for name in self.names[1:]] if "mp4" in self.formats else []
+        if "hls" in self.formats:
+            suffixes.append("_hls")
+        if "dash" in self.formats:
+            suffixes.append("_dash")
+        return suffixes
+
+    def video_filter(self, input_label):
+        # 输出标签为[r0]、[r1]...
+        filters = []
+        if len(self.sizes) == 1:
+            sources = [input_label]
+        else:
+            sources = [f"rs{i}" for i in range(len(self.sizes))]
+            filters.append(f"[{input_label}]split={len(self.sizes)}" + "".join(f"[{s}]" for s in sources))
+        for i, (source, (width, height)) in enumerate(zip(sources, self.sizes)):
+            filters.append(f"[{source}]scale={width}:{height}:flags=lanczos,setsar=1[r{i}]")
+        return ";".join(filters)
+
+    def output_args(self, audio_map=None, duration=None):
+        # 每个规格只编码一次，由tee复用到MP4、HLS和DASH；关键帧按分片时长对齐，各规格可以无缝切换
+        # audio_map为已编码好的音轨，直接复制到所有输出
+        args = []
+        for i in range(len(self.sizes)):
+            args += ["-map", f"[r{i}]"]
+        if audio_map:
+            args += ["-map", audio_map]
+        gop = str(max(1, round(self.fps * self.segment_seconds)))
+        args += self.encoder_args + self.encoder.stream_args(*self.largest_size()) + [
+            "-g", gop, "-keyint_min", gop, "-sc_threshold", "0",
+            "-force_key_frames", f"expr:gte(t,n_forced*{self.segment_seconds:g})"
+        ]
+        for i, name in enumerate(self.names):
+            _, maxrate, bufsize = RENDITION_PRESETS[name]
+            args += self.encoder.rate_limit_args(i, maxrate, bufsize)
+        if audio_map:
+            args += ["-c:a", "copy"]
+        if duration:
+            args += ["-t", f"{duration:g}"]
+        return args + ["-f", "tee", self.tee_outputs(bool(audio_map))]
+
+    def tee_outputs(self, has_audio):
+        slaves = []
+        audio = ",a" if has_audio else ""
+        for i, path in enumerate(self.mp4_paths()):
+            slaves.append(f"[f=mp4:movflags=+faststart:select={tee_quote(f'v:{i}{audio}')}]"
+                          f"{path.replace(chr(92), '/')}")
+        if "hls" in self.formats:
+            for i, name in enumerate(self.names):
+                variant_dir = os.path.join(self.hls_dir(), name)
+                # MPEG-TS不能封装的编码(AV1、VP9)使用fMP4分片
+                segment_type = "" if self.encoder.hls_ts else "hls_segment_type=fmp4:"
+                segment_path = os.path.join(variant_dir, "seg_%05d.ts" if self.encoder.hls_ts else "seg_%05d.m4s")
+                slaves.append(f"[f=hls:hls_time={self.segment_seconds:g}:hls_playlist_type=vod:{segment_type}"
+                              f"hls_segment_filename={tee_quote(segment_path)}:"
+                              f"select={tee_quote(f'v:{i}{audio}')}]"
+                              f"{os.path.join(variant_dir, 'index.m3u8').replace(chr(92), '/')}")
+        if "dash" in self.formats:
+            adaptation_sets = "id=0,streams=v id=1,streams=a" if has_audio else "id=0,streams=v"
+            slaves.append(f"[f=dash:seg_duration={self.segment_seconds:g}:"
+                          f"adaptation_sets={tee_quote(adaptation_sets)}]"
+                          f"{os.path.join(self.dash_dir(), 'manifest.mpd').replace(chr(92), '/')}")
+        return "|".join(slaves)
+
+    def prepare(self):
+        # hls和dash的输出目录需要预先创建
+        if "hls" in self.formats:
+            for name in self.names:
+                os.makedirs(os.path.join(self.hls_dir(), name), exist_ok=True)
+        if "dash" in self.formats:
+            os.makedirs(self.dash_dir(), exist_ok=True)
+
+    def write_master_playlist(self, has_audio):
+        # 各规格的媒体播放列表由ffmpeg生成，主播放列表按规格的峰值码率写出
+        if "hls" not in self.formats:
+            return None
+        path = os.path.join(self.hls_dir(), "master.m3u8")
+        audio_bitrate = bitrate_kbps(AUDIO_BITRATE) if has_audio else 0
+        codecs = self.encoder.hls_codec_for(*self.largest_size()) + (",mp4a.40.2" if has_audio else "")
+        # fMP4分片需要版本7
+        version = 3 if self.encoder.hls_ts else 7
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"#EXTM3U\n#EXT-X-VERSION:{version}\n")
+            for name, (width, height) in zip(self.names, self.sizes):
+                bandwidth = (bitrate_kbps(RENDITION_PRESETS[name][1]) + audio_bitrate) * 1000
+                f.write(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={width}x{height},"
+                        f"CODECS=\"{codecs}\"\n{name}/index.m3u8\n")
+        return path
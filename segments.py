@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import file_hash
+from transitions import build_timeline
+from subtitles import clip_cues, write_ass, subtitles_filter
+from encoders import encoder_for_args, video_stream_args
+from metrics import write_atomic
+
+
+# 分段文件统一的时间基，保证流复制拼接后时间戳连续
+TRACK_TIMESCALE = "90000"
+
+
+def video_codec_args(encoder_args, width, height):
+    # 分段、片头片尾以及需要和它们流复制拼接的输出使用相同的编码参数
+    # encoder_args为编码器及其质量、线程参数(见encoders.py)，流参数(profile、level等)由编码器决定
+    return encoder_args + video_stream_args(encoder_args, width, height) + [
+        "-video_track_timescale", TRACK_TIMESCALE
+    ]
+
+
+def timeline_frames(pieces):
+    # pieces为[(时长, 帧率)]，每段按已生成的实际时长修正取整，误差不会累积
+    counts = []
+    nominal = 0.0
+    actual = 0.0
+    for duration, rate in pieces:
+        nominal += duration
+        count = max(1, round((nominal - actual) * rate))
+        counts.append(count)
+        actual += count / rate
+    return counts
+
+
+def frame_counts(durations, fps):
+    return timeline_frames([(duration, fps) for duration in durations])
+
+
+# 日志中说明分段变化原因时使用的名称
+INPUT_FIELD_NAMES = {
+    'image': "图片",
+    'frames': "时长",
+    'transition': "转场",
+    'subtitles': "字幕",
+    'encoder': "编码参数"
+}
+
+
+def inputs_key(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    # 记录每个分段由哪些输入生成，重新生成时用于判断并说明哪些分段发生了变化
+    def __init__(self, path):
+        self.path = path
+        self.segments = {}
+        self.previous = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.previous = json.load(f).get('segments', {})
+            except (OSError, ValueError):
+                self.previous = {}
+
+    def changes(self, name, inputs):
+        old = self.previous.get(name)
+        if old is None:
+            return ["新增"]
+        old_inputs = old.get('inputs', {})
+        return [INPUT_FIELD_NAMES.get(field, field) for field in sorted(set(inputs) | set(old_inputs))
+                if inputs.get(field) != old_inputs.get(field)]
+
+    def record(self, name, key, inputs):
+        self.segments[name] = {'key': key, 'inputs': inputs}
+
+    def save(self):
+        if not self.path:
+            return
+        write_atomic(self.path, json.dumps({'updated': time.time(), 'segments': self.segments},
+                                           indent=2, ensure_ascii=False))
+
+
+def write_segment_list(path, segment_paths):
+    with open(path, "w", encoding="utf-8") as f:
+        for segment_path in segment_paths:
+            segment_path = os.path.abspath(segment_path).replace('\\', '/')
+            f.write(f"file '{segment_path}'\n")
+    return path
+
+
+class SegmentEncoder:
+    # 每页的停留画面单独以低帧率、静态图像调优编码，分段并行，最后流复制拼接
+    # 转场只渲染重叠的短片段，按正常帧率编码；分段按输入哈希存入缓存，只重新编码变化的分段
+    def __init__(self, converter, width, height, encoder_args, hold_fps, fps, segment_dir,
+                 workers=None, cache=None, manifest=None):
+        self.converter = converter
+        self.width = width
+        self.height = height
+        self.encoder_args = encoder_args
+        self.hold_fps = hold_fps
+        self.fps = fps
+        self.segment_dir = segment_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self.cache = cache
+        self.manifest = manifest or BuildManifest(None)
+        self.segments = []
+        os.makedirs(self.segment_dir, exist_ok=True)
+
+    def signature(self):
+        # 影响编码结果的参数，线程数不影响画面所以不计入
+        return {
+            'size': f"{self.width}x{self.height}",
+            'quality': self.encoder_args,
+            'hold_fps': self.hold_fps,
+            'fps': self.fps,
+            'stream': video_stream_args(self.encoder_args, self.width, self.height)
+        }
+
+    def base_filter(self):
+        return (f"scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,"
+                f"pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2:black")
+
+    def video_codec_args(self):
+        return video_codec_args(self.encoder_args, self.width, self.height) + [
+            "-threads", str(self.threads),
+            "-an"
+        ]
+
+    def encode_hold(self, image_path, frames, subtitle_path, output_path):
+        video_filter = self.base_filter()
+        if subtitle_path:
+            video_filter += "," + subtitles_filter(subtitle_path)
+        cmd = [
+            "ffmpeg", "-y",
+            "-loop", "1", "-framerate", f"{self.hold_fps:g}", "-i", image_path,
+            "-vf", video_filter,
+            "-frames:v", str(frames),
+            "-r", f"{self.hold_fps:g}"
+        ] + encoder_for_args(self.encoder_args).still_args() + self.video_codec_args() + [output_path]
+        self.converter.run_ffmpeg(cmd, f"分段编码失败：{os.path.basename(image_path)}", progress=False)
+        return output_path
+
+    def add_segment(self, name, inputs, func, args):
+        # func(*args, output_path)负责生成该分段
+        inputs = dict(inputs, encoder=self.signature())
+        path = os.path.join(self.segment_dir, name + ".mp4")
+        self.segments.append((name, inputs_key(inputs), inputs, func, args, path))
+        return path
+
+    def encode_transition(self, first_image, second_image, effect, frames, subtitle_path, output_path):
+        duration = frames / self.fps
+        subtitle_filter = "," + subtitles_filter(subtitle_path) if subtitle_path else ""
+        cmd = [
+            "ffmpeg", "-y",
+            "-loop", "1", "-framerate", f"{self.fps:g}", "-i", first_image,
+            "-loop", "1", "-framerate", f"{self.fps:g}", "-i", second_image,
+            "-filter_complex",
+            f"[0:v]{self.base_filter()},setsar=1[a];[1:v]{self.base_filter()},setsar=1[b];"
+            f"[a][b]xfade=transition={effect}:duration={duration:g}:offset=0{subtitle_filter},format=yuv420p[v]",
+            "-map", "[v]",
+            "-frames:v", str(frames),
+            "-r", f"{self.fps:g}"
+        ] + self.video_codec_args() + [output_path]
+        self.converter.run_ffmpeg(cmd, f"转场编码失败：{os.path.basename(first_image)}", progress=False)
+        return output_path
+
+    def segment_subtitles(self, name, cues, start, end):
+        # 烧录字幕时每个分段只带自己时间范围内的字幕，字幕内容计入分段输入
+        clipped = clip_cues(cues or [], start, end)
+        if not clipped:
+            return [], None
+        path = os.path.join(self.segment_dir, name + ".ass")
+        write_ass(clipped, path, self.width, self.height)
+        return [list(cue) for cue in clipped], path
+
+    def add_slides(self, image_files, durations, effects=None, transition_duration=0.0, cues=None):
+        timeline = build_timeline(durations, effects or [], transition_duration)
+        counts = timeline_frames([(piece['duration'], self.hold_fps if piece['type'] == 'hold' else self.fps)
+                                  for piece in timeline])
+        image_hashes = [file_hash(image_path) for image_path in image_files]
+        start = 0.0
+        for piece, frames in zip(timeline, counts):
+            i = piece['slide']
+            end = start + piece['duration']
+            if piece['type'] == 'hold':
+                name = f"hold_{i + 1:04d}"
+                clipped, subtitle_path = self.segment_subtitles(name, cues, start, end)
+                inputs = {'image': image_hashes[i], 'frames': frames}
+                if clipped:
+                    inputs['subtitles'] = clipped
+                self.add_segment(name, inputs, self.encode_hold, (image_files[i], frames, subtitle_path))
+            else:
+                name = f"transition_{i + 1:04d}"
+                clipped, subtitle_path = self.segment_subtitles(name, cues, start, end)
+                inputs = {'image': [image_hashes[i], image_hashes[i + 1]],
+                          'transition': piece['effect'], 'frames': frames}
+                if clipped:
+                    inputs['subtitles'] = clipped
+                self.add_segment(name, inputs, self.encode_transition,
+                                 (image_files[i], image_files[i + 1], piece['effect'], frames, subtitle_path))
+            start = end
+
+    def build(self):
+        tasks = []
+        new_segments = []
+        # 同一次生成中输入完全相同的分段(如重复出现的章节页)只编码一次，其余复制已编码的文件
+        scheduled = {}
+        repeats = []
+        for name, key, inputs, func, args, path in self.segments:
+            if key in scheduled:
+                repeats.append((scheduled[key], path))
+            elif self.cache is None or not self.cache.fetch(key, ".mp4", path):
+                tasks.append((func, args + (path,)))
+                new_segments.append((key, path))
+                scheduled[key] = path
+                self.converter.log(f"重新编码{name}：{'、'.join(self.manifest.changes(name, inputs))}")
+            else:
+                scheduled[key] = path
+            self.manifest.record(name, key, inputs)
+        self.converter.log(f"分段共{len(self.segments)}个，重新编码{len(tasks)}个，"
+                           f"复用{len(self.segments) - len(tasks)}个")
+
+        encode_seconds = self.encode_all(tasks)
+
+        if repeats:
+            for source_path, path in repeats:
+                shutil.copyfile(source_path, path)
+            saved = sum(encode_seconds.get(source_path, 0.0) for source_path, _ in repeats)
+            self.converter.log(f"重复分段{len(repeats)}个直接复用，节省编码约{saved:.1f}秒")
+
+        if self.cache is not None:
+            for key, path in new_segments:
+                self.cache.put(key, path, ".mp4")
+            self.cache.evict()
+        self.manifest.save()
+        return [path for _, _, _, _, _, path in self.segments]
+
+    def encode_all(self, tasks):
+        # tasks为[(函数, 参数元组)]，在线程池中并行执行，主线程汇报进度
+        # 返回{输出路径: 编码耗时秒}
+        total = len(tasks)
+        encode_seconds = {}
+        self.converter.report_progress("encode", 0, total)
+
+        def timed(func, args):
+            started = time.time()
+            path = func(*args)
+            encode_seconds[path] = time.time() - started
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(timed, func, args) for func, args in tasks]
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    future.result()
+                    self.converter.report_progress("encode", done, total)
+            except Exception:
+                # 一个分段失败或被取消时，不再启动尚未开始的分段
+                for future in futures:
+                    future.cancel()
+                raise
+        return encode_seconds
+
+    def concat(self, segment_paths, output_path, duration=None):
+        list_path = write_segment_list(output_path + ".txt", segment_paths)
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy",
+            output_path
+        ]
+        self.converter.run_ffmpeg(cmd, "分段拼接失败", duration=duration, stage="concat")
+        return output_path
@@ -0,0 +1,145 @@
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from pptx_package import NS, read_rels, slide_part_names
+
+
+# 直接从PPTX压缩包中增量解析幻灯片和备注XML，不加载python-pptx对象和媒体文件
+P = f"{{{NS['p']}}}"
+A = f"{{{NS['a']}}}"
+
+TITLE_PLACEHOLDERS = ("title", "ctrTitle")
+# 页眉页脚、页码、备注页中的幻灯片缩略图等不属于正文
+SKIP_PLACEHOLDERS = ("dt", "ftr", "hdr", "sldNum", "sldImg")
+
+# 页数较少时进程池的启动开销大于解析本身
+PARALLEL_MIN_SLIDES = 200
+
+NOTES_HEADER = "--- 备注 ---"
+# 文案文件第一行记录提取时PPT的哈希，文案只能用于同一个PPT
+SOURCE_PREFIX = "# 源文件哈希："
+
+
+def paragraph_text(paragraph):
+    parts = []
+    for child in paragraph:
+        if child.tag in (A + "r", A + "fld"):
+            text = child.find(A + "t")
+            if text is not None and text.text:
+                parts.append(text.text)
+        elif child.tag == A + "br":
+            parts.append("\n")
+    return "".join(parts).strip()
+
+
+def parse_part(stream):
+    # 返回{'title': [...], 'body': [...], 'tables': [[[单元格]]], 'hidden': bool}，组合形状中的文本按出现顺序收集
+    result = {'title': [], 'body': [], 'tables': [], 'hidden': False}
+    root = None
+    shape_kind = None
+    shape_paragraphs = []
+    table = None
+    row = None
+    cell = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if root is None:
+                # 隐藏页的show属性在根元素上
+                root = elem
+                result['hidden'] = elem.get("show") == "0"
+            elif tag == P + "sp":
+                shape_kind = "body"
+                shape_paragraphs = []
+            elif tag == P + "ph" and shape_kind is not None:
+                ph_type = elem.get("type", "body")
+                if ph_type in TITLE_PLACEHOLDERS:
+                    shape_kind = "title"
+                elif ph_type in SKIP_PLACEHOLDERS:
+                    shape_kind = "skip"
+            elif tag == A + "tbl":
+                table = []
+            elif tag == A + "tr" and table is not None:
+                row = []
+            elif tag == A + "tc" and row is not None:
+                cell = []
+            continue
+
+        if tag == A + "p":
+            text = paragraph_text(elem)
+            if text:
+                if cell is not None:
+                    cell.append(text)
+                elif shape_kind is not None:
+                    shape_paragraphs.append(text)
+            elem.clear()
+        elif tag == A + "tc" and cell is not None:
+            row.append("\n".join(cell))
+            cell = None
+        elif tag == A + "tr" and row is not None:
+            table.append(row)
+            row = None
+        elif tag == A + "tbl" and table is not None:
+            if any(any(cells) for cells in table):
+                result['tables'].append(table)
+            table = None
+        elif tag == P + "sp":
+            if shape_kind in ("title", "body"):
+                result[shape_kind].extend(shape_paragraphs)
+            shape_kind = None
+            elem.clear()
+        elif tag in (P + "graphicFrame", P + "pic"):
+            elem.clear()
+    return result
+
+
+def extract_parts(ppt_path, part_names):
+    # 在子进程中执行，每个进程只打开一次压缩包
+    slides = []
+    with zipfile.ZipFile(ppt_path) as zf:
+        for part_name in part_names:
+            with zf.open(part_name) as stream:
+                slide = parse_part(stream)
+            slide['notes'] = []
+            for _, rel_type, target in read_rels(zf, part_name):
+                if rel_type == "notesSlide":
+                    with zf.open(target) as stream:
+                        notes = parse_part(stream)
+                    slide['notes'] = notes['title'] + notes['body']
+            slides.append(slide)
+    return slides
+
+
+def extract_slides(ppt_path, workers=None):
+    # 返回按放映顺序排列的每页结构化文本：title/body为段落列表，tables为表格列表，notes为备注段落
+    with zipfile.ZipFile(ppt_path) as zf:
+        part_names = slide_part_names(zf)
+    workers = min(workers or os.cpu_count() or 1, len(part_names))
+    if workers <= 1 or len(part_names) < PARALLEL_MIN_SLIDES:
+        return extract_parts(ppt_path, part_names)
+
+    # 按连续区间分块，结果按顺序拼接
+    size = -(-len(part_names) // workers)
+    chunks = [part_names[i:i + size] for i in range(0, len(part_names), size)]
+    slides = []
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        for chunk_slides in executor.map(extract_parts, [ppt_path] * len(chunks), chunks):
+            slides.extend(chunk_slides)
+    return slides
+
+
+def slide_content(slide):
+    lines = slide['title'] + slide['body']
+    for table in slide['tables']:
+        for row in table:
+            lines.append(" | ".join(cell.replace("\n", " ") for cell in row))
+    return "\n".join(lines)
+
+
+def slide_script(slide):
+    # 配音和字幕优先使用演讲者备注，没有备注时使用页面文字
+    if slide['notes']:
+        return "\n".join(slide['notes'])
+    return slide_content(slide)
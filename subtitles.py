@@ -0,0 +1,121 @@
+import re
+
+
+SUBTITLE_MODES = {
+    "无": "",
+    "软字幕": "soft",
+    "烧录字幕": "burn"
+}
+
+# 单条字幕的最大字数，超过时按句子拆分，在该页停留时间内按字数分配显示时间
+MAX_CUE_CHARS = 40
+
+SENTENCE_END = re.compile(r"(?<=[。！？；!?;])|\n")
+
+
+def split_sentences(text):
+    sentences = []
+    for part in SENTENCE_END.split(text):
+        part = " ".join(part.split())
+        while len(part) > MAX_CUE_CHARS:
+            sentences.append(part[:MAX_CUE_CHARS])
+            part = part[MAX_CUE_CHARS:]
+        if part:
+            sentences.append(part)
+    return sentences
+
+
+def chunk_text(text):
+    # 相邻的短句合并为一条，每条不超过MAX_CUE_CHARS
+    chunks = []
+    for sentence in split_sentences(text):
+        if chunks and len(chunks[-1]) + len(sentence) + 1 <= MAX_CUE_CHARS:
+            chunks[-1] = f"{chunks[-1]} {sentence}"
+        else:
+            chunks.append(sentence)
+    return chunks
+
+
+def build_cues(texts, durations):
+    # texts为{页码: 文本}，按每页的开始时间和停留时间生成[(开始, 结束, 文本)]
+    cues = []
+    start = 0.0
+    for i, duration in enumerate(durations):
+        chunks = chunk_text(texts.get(i + 1, ""))
+        total_chars = sum(len(chunk) for chunk in chunks)
+        elapsed = start
+        for chunk in chunks:
+            length = duration * len(chunk) / total_chars
+            cues.append((round(elapsed, 3), round(elapsed + length, 3), chunk))
+            elapsed += length
+        start += duration
+    return cues
+
+
+def clip_cues(cues, start, end):
+    # 截取[start, end)内的字幕，时间改为相对start，用于分段烧录
+    clipped = []
+    for cue_start, cue_end, text in cues:
+        if cue_end <= start or cue_start >= end:
+            continue
+        clipped.append((round(max(cue_start, start) - start, 3), round(min(cue_end, end) - start, 3), text))
+    return clipped
+
+
+def offset_cues(cues, offset):
+    # 视频前拼接了片头时，字幕整体后移
+    if not offset:
+        return cues
+    return [(round(start + offset, 3), round(end + offset, 3), text) for start, end, text in cues]
+
+
+def trim_cues(cues, start_time):
+    # 预览从中间开始时，去掉之前的字幕，其余前移
+    return [(round(max(0.0, start - start_time), 3), round(end - start_time, 3), text)
+            for start, end, text in cues if end > start_time]
+
+
+def format_srt_time(seconds):
+    millis = round(seconds * 1000)
+    return f"{millis // 3600000:02d}:{millis // 60000 % 60:02d}:{millis // 1000 % 60:02d},{millis % 1000:03d}"
+
+
+def format_ass_time(seconds):
+    centis = round(seconds * 100)
+    return f"{centis // 360000}:{centis // 6000 % 60:02d}:{centis // 100 % 60:02d}.{centis % 100:02d}"
+
+
+def write_srt(cues, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for index, (start, end, text) in enumerate(cues, 1):
+            f.write(f"{index}\n{format_srt_time(start)} --> {format_srt_time(end)}\n{text}\n\n")
+    return path
+
+
+def write_ass(cues, path, width, height):
+    # 字号和边距按视频高度计算，不同分辨率下字幕占画面的比例相同
+    font_size = max(12, round(height * 0.05))
+    margin = round(height * 0.05)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("[Script Info]\n"
+                "ScriptType: v4.00+\n"
+                f"PlayResX: {width}\n"
+                f"PlayResY: {height}\n"
+                "WrapStyle: 0\n\n"
+                "[V4+ Styles]\n"
+                "Format: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BackColour, Bold, "
+                "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV\n"
+                f"Style: Default,Microsoft YaHei,{font_size},&H00FFFFFF,&H00000000,&H80000000,0,"
+                f"1,{max(1, font_size // 12)},0,2,{margin},{margin},{margin}\n\n"
+                "[Events]\n"
+                "Format: Layer, Start, End, Style, Text\n")
+        for start, end, text in cues:
+            text = text.replace("{", "｛").replace("}", "｝").replace("\n", "\\N")
+            f.write(f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,{text}\n")
+    return path
+
+
+def subtitles_filter(path):
+    # filter参数中的路径需要转义冒号和引号，Windows路径统一改为正斜杠
+    path = path.replace('\\', '/').replace(':', '\\:').replace("'", "\\'")
+    return f"subtitles='{path}'"
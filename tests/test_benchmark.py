@@ -0,0 +1,22 @@
+from benchmark import MIN_DELTA_SECONDS, compare_results
+
+
+def case(case_id, ok=True, **fields):
+    return dict({'id': case_id, 'ok': ok}, **fields)
+
+
+def test_regression_needs_ratio_and_noise_floor():
+    baseline = {'cases': [case("a", seconds=10.0), case("b", seconds=1.0), case("c", peak_rss_mb=100.0)]}
+    results = {'cases': [case("a", seconds=12.0), case("b", seconds=1.0 + MIN_DELTA_SECONDS * 0.9),
+                         case("c", peak_rss_mb=105.0)]}
+    regressions = compare_results(baseline, results, threshold=0.1)
+    assert [(item['id'], item['field']) for item in regressions] == [("a", "seconds")]
+    assert regressions[0]['change'] == 0.2
+    assert compare_results(baseline, results, threshold=0.25) == []
+
+
+def test_failed_case_is_a_regression():
+    baseline = {'cases': [case("a", seconds=10.0), case("b", ok=False)]}
+    results = {'cases': [case("a", ok=False), case("b", ok=False), case("new", seconds=99.0)]}
+    assert compare_results(baseline, results) == [
+        {'id': "a", 'field': 'ok', 'baseline': True, 'current': False}]
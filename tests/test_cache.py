@@ -0,0 +1,55 @@
+from pptx import Presentation
+from pptx.util import Inches
+
+import os
+
+from cache import FileCache, slide_cache_keys
+
+
+def make_deck(path, texts):
+    prs = Presentation()
+    for text in texts:
+        slide = prs.slides.add_slide(prs.slide_layouts[6])
+        slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)).text_frame.text = text
+    prs.save(path)
+    return str(path)
+
+
+def test_keys_are_stable(tmp_path):
+    first = make_deck(tmp_path / "a.pptx", ["一", "二", "三"])
+    second = make_deck(tmp_path / "b.pptx", ["一", "二", "三"])
+    keys = slide_cache_keys(first)
+    assert len(keys) == 3 and len(set(keys)) == 3
+    assert slide_cache_keys(first) == keys
+    # 文件名和保存时间不影响缓存键
+    assert slide_cache_keys(second) == keys
+
+
+def test_only_edited_slide_is_invalidated(tmp_path):
+    keys = slide_cache_keys(make_deck(tmp_path / "a.pptx", ["一", "二", "三"]))
+    edited = slide_cache_keys(make_deck(tmp_path / "b.pptx", ["一", "改", "三"]))
+    assert [old == new for old, new in zip(keys, edited)] == [True, False, True]
+
+
+def test_render_parameters_invalidate_all_slides(tmp_path):
+    path = make_deck(tmp_path / "a.pptx", ["一", "二"])
+    keys = slide_cache_keys(path, extra="1920x1080")
+    assert not set(keys) & set(slide_cache_keys(path, extra="1280x720"))
+
+
+def test_non_zip_file_has_no_keys(tmp_path):
+    path = tmp_path / "old.ppt"
+    path.write_bytes(b"\xd0\xcf\x11\xe0")
+    assert slide_cache_keys(str(path)) is None
+
+
+def test_put_replaces_entry_without_temp_files(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), 1024 * 1024)
+    src = tmp_path / "a.png"
+    for data in (b"first", b"second"):
+        src.write_bytes(data)
+        path = cache.put("abcdef", str(src), ".png")
+    assert cache.get("abcdef", ".png") == path
+    with open(path, 'rb') as f:
+        assert f.read() == b"second"
+    assert os.listdir(os.path.dirname(path)) == ["abcdef.png"]
@@ -0,0 +1,57 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from dedup import duplicate_groups, collapse_timeline, perceptual_hashes, neighbour_distances, np
+
+
+def text_slide(path, lines):
+    # 标题栏相同，正文不同的1280x720幻灯片
+    img = Image.new("RGB", (1280, 720), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 1280, 120), fill=(30, 60, 140))
+    draw.text((60, 40), "Quarterly Review", fill="white")
+    for i, line in enumerate(lines):
+        draw.text((80, 180 + i * 40), line, fill="black")
+    img.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def slides(tmp_path):
+    first = text_slide(tmp_path / "slide_1.png", ["Revenue grew 12% year over year", "Churn fell to 3%"])
+    second = text_slide(tmp_path / "slide_2.png", ["Hiring plan for next quarter", "Open roles: 14 engineers"])
+    copy = tmp_path / "slide_3.png"
+    copy.write_bytes((tmp_path / "slide_2.png").read_bytes())
+    return [first, second, str(copy)]
+
+
+def test_exact_duplicates_merge_by_default(slides):
+    assert duplicate_groups(slides) == [[0], [1, 2]]
+
+
+@pytest.mark.skipif(np is None, reason="需要numpy")
+def test_distinct_text_slides_are_not_merged(slides):
+    # 缩小后的指纹几乎相同，必须由逐像素比较拒绝
+    distance = neighbour_distances(perceptual_hashes(slides[:2]))[0]
+    assert duplicate_groups(slides[:2], threshold=max(4, int(distance))) == [[0], [1]]
+
+
+@pytest.mark.skipif(np is None, reason="需要numpy")
+def test_near_duplicates_merge_with_threshold(tmp_path):
+    first = text_slide(tmp_path / "a.png", ["Agenda"])
+    # 一个像素的差异，文件哈希不同但画面近似
+    with Image.open(first) as img:
+        img.putpixel((1000, 600), (0, 0, 0))
+        img.save(tmp_path / "b.png")
+    paths = [first, str(tmp_path / "b.png")]
+    assert duplicate_groups(paths) == [[0], [1]]
+    assert duplicate_groups(paths, threshold=4) == [[0, 1]]
+
+
+def test_collapse_timeline_keeps_total_duration():
+    images = ["1.png", "2.png", "3.png", "4.png"]
+    durations = [2.0, 3.0, 1.0, 4.0]
+    effects = ["fade", "wipeleft", "dissolve"]
+    collapsed = collapse_timeline(images, durations, effects, [[0], [1, 2], [3]])
+    assert collapsed == (["1.png", "3.png", "4.png"], [2.0, 4.0, 4.0], ["fade", "dissolve"])
+    assert sum(collapsed[1]) == sum(durations)
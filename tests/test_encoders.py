@@ -0,0 +1,44 @@
+import encoders
+from encoders import ENCODERS, EncoderProfiler, PROFILE_HEIGHT, PROFILE_WIDTH, STILL_FRAME_SPEEDUP, choose_preset
+
+X264 = ENCODERS["libx264"]
+PROFILE = {'ultrafast': 400.0, 'veryfast': 200.0, 'medium': 50.0, 'slow': 20.0}
+
+
+def test_slowest_preset_within_budget():
+    # 参考分辨率下1000帧：medium需要20秒，slow需要50秒
+    assert choose_preset(X264, PROFILE, PROFILE_WIDTH, PROFILE_HEIGHT, 1000, 0, 30) == ('medium', 20.0)
+    assert choose_preset(X264, PROFILE, PROFILE_WIDTH, PROFILE_HEIGHT, 1000, 0, 60) == ('slow', 50.0)
+
+
+def test_budget_scales_with_pixels_share_and_still_frames():
+    # 分辨率加倍(4倍像素)时只有ultrafast满足
+    assert choose_preset(X264, PROFILE, PROFILE_WIDTH * 2, PROFILE_HEIGHT * 2, 1000, 0, 15)[0] == 'ultrafast'
+    # 只能使用一半CPU时耗时加倍
+    assert choose_preset(X264, PROFILE, PROFILE_WIDTH, PROFILE_HEIGHT, 1000, 0, 30, share=0.5)[0] == 'veryfast'
+    # 静止帧按STILL_FRAME_SPEEDUP折算
+    preset, seconds = choose_preset(X264, PROFILE, PROFILE_WIDTH, PROFILE_HEIGHT, 1000, 1000, 60)
+    assert preset == 'slow' and seconds == 1000 / STILL_FRAME_SPEEDUP / 20.0
+
+
+def test_no_preset_within_budget():
+    assert choose_preset(X264, PROFILE, PROFILE_WIDTH, PROFILE_HEIGHT, 1000, 0, 1) is None
+    assert choose_preset(X264, {}, PROFILE_WIDTH, PROFILE_HEIGHT, 1000, 0, 1000) is None
+
+
+def test_planning_does_not_measure(tmp_path, monkeypatch):
+    from converter import PPTConverter
+
+    def measure(self, encoder):
+        raise AssertionError("生成计划时不应测试编码速度")
+
+    monkeypatch.setattr(EncoderProfiler, "measure", measure)
+    monkeypatch.setattr(encoders, "machine_key", lambda: "test")
+    converter = PPTConverter(config={'realtime_factor': '2'}, temp_dir=str(tmp_path / "temp"),
+                             cache_dir=str(tmp_path / "cache"))
+    try:
+        plan = converter.select_encoder([2.0, 2.0], [""], 0.0, 1280, 720, measure=False)
+    finally:
+        converter.close()
+    assert plan['unprofiled'] == ["libx264"]
+    assert plan['codec'] == "libx264" and "-preset" in plan['args']
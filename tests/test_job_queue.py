@@ -0,0 +1,100 @@
+import os
+import time
+
+import pytest
+
+from job_queue import JobQueue, RETRY_BASE_SECONDS
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue"))
+    yield queue
+    queue.conn.close()
+
+
+def enqueue_deck(queue, tmp_path, name="deck.pptx"):
+    source = tmp_path / name
+    source.write_bytes(b"pptx")
+    return queue.enqueue(str(source), str(tmp_path / "out"))
+
+
+def next_run(queue, job_id):
+    return queue.conn.execute("SELECT next_run FROM jobs WHERE id = ?", (job_id,)).fetchone()['next_run']
+
+
+def test_enqueue_moves_source_into_job_dir(queue, tmp_path):
+    job_id = enqueue_deck(queue, tmp_path)
+    job = queue.claim()
+    assert job['id'] == job_id and job['attempts'] == 1
+    assert job['ppt'] == os.path.join(queue.job_dir(job_id), "deck.pptx")
+    assert job['output'] == os.path.join(str(tmp_path / "out"), "deck.mp4")
+    assert os.path.exists(job['ppt']) and not (tmp_path / "deck.pptx").exists()
+    assert queue.claim() is None
+
+
+def job_count(queue):
+    return queue.conn.execute("SELECT COUNT(*) AS count FROM jobs").fetchone()['count']
+
+
+def test_failed_move_leaves_no_job(queue, tmp_path):
+    with pytest.raises(OSError):
+        queue.enqueue(str(tmp_path / "missing.pptx"), str(tmp_path / "out"))
+    assert job_count(queue) == 0
+    assert os.listdir(queue.staging_dir()) == []
+
+
+def test_failed_insert_returns_source(queue, tmp_path, monkeypatch):
+    def fail_rename(src, dst):
+        raise OSError("磁盘错误")
+
+    monkeypatch.setattr(os, "rename", fail_rename)
+    with pytest.raises(OSError):
+        enqueue_deck(queue, tmp_path)
+    monkeypatch.undo()
+    assert job_count(queue) == 0
+    assert (tmp_path / "deck.pptx").read_bytes() == b"pptx"
+    assert os.listdir(queue.staging_dir()) == []
+
+
+def test_unstage_returns_interrupted_files(queue, tmp_path):
+    staged = os.path.join(queue.staging_dir(), "abc")
+    os.makedirs(staged)
+    with open(os.path.join(staged, "deck.pptx"), 'wb') as f:
+        f.write(b"pptx")
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    assert queue.unstage(str(inbox)) == 1
+    assert (inbox / "deck.pptx").exists()
+    assert os.listdir(queue.staging_dir()) == []
+
+
+def test_fail_backs_off_exponentially(queue, tmp_path):
+    job_id = enqueue_deck(queue, tmp_path)
+    for attempts in (1, 2):
+        job = queue.claim()
+        assert job['attempts'] == attempts
+        before = time.time()
+        assert queue.fail(job_id, job['attempts'], "错误", max_attempts=3)
+        delay = next_run(queue, job_id) - before
+        assert RETRY_BASE_SECONDS * 2 ** (attempts - 1) <= delay < RETRY_BASE_SECONDS * 2 ** (attempts - 1) + 5
+        # 未到重试时间时不会被取出
+        assert queue.claim() is None
+        queue.conn.execute("UPDATE jobs SET next_run = 0 WHERE id = ?", (job_id,))
+
+    job = queue.claim()
+    assert not queue.fail(job_id, job['attempts'], "错误", max_attempts=3)
+    assert queue.status()['failed'] == 1
+    assert queue.claim() is None
+
+
+def test_recover_requeues_running_jobs(queue, tmp_path):
+    first = enqueue_deck(queue, tmp_path, "a.pptx")
+    second = enqueue_deck(queue, tmp_path, "b.pptx")
+    assert queue.claim()['id'] == first
+    queue.complete(first)
+    assert queue.claim()['id'] == second
+    assert queue.recover() == 1
+    job = queue.claim()
+    assert job['id'] == second and job['attempts'] == 2
+    assert queue.status()['done'] == 1
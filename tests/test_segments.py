@@ -0,0 +1,20 @@
+import pytest
+
+from segments import timeline_frames, frame_counts
+
+
+def test_rounding_error_does_not_accumulate():
+    counts = frame_counts([1.01] * 100, 25)
+    assert sum(counts) == round(101.0 * 25)
+    assert set(counts) <= {25, 26}
+
+
+def test_mixed_rates_match_total_duration():
+    pieces = [(2.5, 1), (0.5, 25), (2.5, 1), (0.5, 25)]
+    counts = timeline_frames(pieces)
+    actual = sum(count / rate for count, (_, rate) in zip(counts, pieces))
+    assert actual == pytest.approx(6.0)
+
+
+def test_short_piece_gets_at_least_one_frame():
+    assert timeline_frames([(0.01, 25), (1.0, 25)]) == [1, 24]
@@ -0,0 +1,28 @@
+from pptx import Presentation
+from pptx.util import Inches
+
+from slide_text import extract_slides, slide_content
+
+
+def test_groups_tables_and_notes(tmp_path):
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    slide.shapes.title.text = "季度回顾"
+    group = slide.shapes.add_group_shape()
+    for i, text in enumerate(("组合一", "组合二")):
+        group.shapes.add_textbox(Inches(1), Inches(2 + i), Inches(3), Inches(1)).text_frame.text = text
+    table = slide.shapes.add_table(2, 2, Inches(1), Inches(4), Inches(4), Inches(1)).table
+    for (row, col), text in {(0, 0): "项目", (0, 1): "数值", (1, 0): "收入", (1, 1): "12%"}.items():
+        table.cell(row, col).text = text
+    slide.notes_slide.notes_text_frame.text = "这里是讲稿"
+    prs.slides.add_slide(prs.slide_layouts[6])
+    path = str(tmp_path / "deck.pptx")
+    prs.save(path)
+
+    first, second = extract_slides(path)
+    assert first['title'] == ["季度回顾"]
+    assert first['body'] == ["组合一", "组合二"]
+    assert first['tables'] == [[["项目", "数值"], ["收入", "12%"]]]
+    assert first['notes'] == ["这里是讲稿"]
+    assert slide_content(first) == "季度回顾\n组合一\n组合二\n项目 | 数值\n收入 | 12%"
+    assert second == {'title': [], 'body': [], 'tables': [], 'hidden': False, 'notes': []}
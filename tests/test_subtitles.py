@@ -0,0 +1,22 @@
+from subtitles import MAX_CUE_CHARS, build_cues, chunk_text, split_sentences
+
+
+def test_long_sentence_is_split():
+    text = "字" * (MAX_CUE_CHARS * 2 + 5)
+    assert [len(part) for part in split_sentences(text)] == [MAX_CUE_CHARS, MAX_CUE_CHARS, 5]
+
+
+def test_short_sentences_are_joined():
+    assert chunk_text("第一句。第二句！\n第三句") == ["第一句。 第二句！ 第三句"]
+    chunks = chunk_text("甲" * 30 + "。" + "乙" * 30 + "。")
+    assert chunks == ["甲" * 30 + "。", "乙" * 30 + "。"]
+    assert all(len(chunk) <= MAX_CUE_CHARS for chunk in chunks)
+
+
+def test_cues_follow_slide_timing():
+    cues = build_cues({1: "甲" * 30 + "。" + "乙" * 8 + "。", 3: "结束"}, [4.0, 2.0, 3.0])
+    assert cues == [(0.0, 3.1, "甲" * 30 + "。"), (3.1, 4.0, "乙" * 8 + "。"), (6.0, 9.0, "结束")]
+
+
+def test_slide_without_text_has_no_cues():
+    assert build_cues({}, [2.0, 2.0]) == []
@@ -0,0 +1,42 @@
+import pytest
+
+from transitions import build_timeline, build_xfade_graph, clamp_transition_duration, plan_transitions
+
+
+def test_clamp_keeps_half_of_shortest_slide():
+    assert clamp_transition_duration([4.0, 1.0, 6.0], 2.0) == 0.5
+    assert clamp_transition_duration([4.0, 4.0], 1.0) == 1.0
+    # 最后一页后没有转场，不参与计算
+    assert clamp_transition_duration([4.0, 0.2], 1.0) == 1.0
+    assert clamp_transition_duration([4.0], 1.0) == 0.0
+
+
+def test_timeline_keeps_total_duration():
+    durations = [3.0, 2.0, 4.0]
+    timeline = build_timeline(durations, ["fade", ""], 0.5)
+    assert [(piece['type'], piece['slide']) for piece in timeline] == [
+        ('hold', 0), ('transition', 0), ('hold', 1), ('hold', 2)]
+    assert timeline[0]['duration'] == 2.5
+    assert timeline[1]['effect'] == "fade"
+    assert sum(piece['duration'] for piece in timeline) == pytest.approx(sum(durations))
+
+
+def test_xfade_offsets_follow_elapsed_time():
+    input_durations, graph = build_xfade_graph([3.0, 2.0, 4.0], ["fade", "wipeleft"], 0.5, "scale=640:360", 25)
+    # 有转场的页多输入一段转场时长
+    assert input_durations == [3.0, 2.5, 4.5]
+    assert "[s0][s1]xfade=transition=fade:duration=0.5:offset=2.5[x1]" in graph
+    assert "[x1][s2]xfade=transition=wipeleft:duration=0.5:offset=4.5[x2]" in graph
+    assert graph.endswith("[x2]null[vout]")
+
+
+def test_xfade_without_effect_concatenates():
+    input_durations, graph = build_xfade_graph([3.0, 2.0], [""], 0.5, "null", 10)
+    assert input_durations == [3.0, 2.0]
+    assert "[s0][s1]concat=n=2:v=1:a=0[x1]" in graph
+
+
+def test_random_transitions_are_reproducible():
+    first = plan_transitions(6, "随机效果", seed="deck")
+    assert first == plan_transitions(6, "随机效果", seed="deck")
+    assert len(first) == 5 and set(first) <= {"fade", "slideleft", "slideright", "slideup", "slidedown"}
@@ -0,0 +1,97 @@
+import random
+
+from PIL import Image
+
+
+TRANSITION_EFFECTS = {
+    "无": "",
+    "淡入淡出": "fade",
+    "向左滑动": "slideleft",
+    "向右滑动": "slideright",
+    "向上滑动": "slideup",
+    "向下滑动": "slidedown",
+    "随机效果": "random"
+}
+
+RANDOM_EFFECTS = list(TRANSITION_EFFECTS.values())[1:-1]  # 排除"无"和"随机"
+
+
+def plan_transitions(count, effect_name, seed=None):
+    # 返回每个页间边界的xfade效果名，共count-1个，""表示直接切换
+    # 随机效果按边界逐个选择，同一份PPT使用固定种子，重复生成时结果不变
+    transition_name = TRANSITION_EFFECTS.get(effect_name, effect_name or "")
+    if transition_name != "random":
+        return [transition_name] * max(0, count - 1)
+    rng = random.Random(seed)
+    return [rng.choice(RANDOM_EFFECTS) for _ in range(max(0, count - 1))]
+
+
+def clamp_transition_duration(durations, transition_duration):
+    # 转场占用前一页停留时间的末尾，至少保留一半时间完整显示该页
+    if len(durations) < 2:
+        return 0.0
+    return max(0.0, min(transition_duration, min(durations[:-1]) / 2))
+
+
+def build_timeline(durations, effects, transition_duration):
+    # 将每页的停留时间拆分为静止段和转场段，总时长与各页时长之和相同
+    timeline = []
+    for i, duration in enumerate(durations):
+        effect = effects[i] if i < len(effects) else ""
+        overlap = transition_duration if effect else 0.0
+        timeline.append({'type': 'hold', 'slide': i, 'duration': duration - overlap})
+        if overlap:
+            timeline.append({'type': 'transition', 'slide': i, 'effect': effect, 'duration': overlap})
+    return timeline
+
+
+def build_xfade_graph(durations, effects, transition_duration, base_filter, fps):
+    # 单次编码模式的转场链：输入i为第i页的循环图片
+    # 返回各输入需要的时长和filter_complex片段，输出标签为[vout]
+    input_durations = []
+    filters = []
+    for i, duration in enumerate(durations):
+        lead = transition_duration if i > 0 and effects[i - 1] else 0.0
+        input_durations.append(duration + lead)
+        filters.append(f"[{i}:v]{base_filter},fps={fps:g},settb=AVTB,format=yuv420p[s{i}]")
+
+    current = "s0"
+    elapsed = durations[0]
+    for i in range(1, len(durations)):
+        output = f"x{i}"
+        effect = effects[i - 1]
+        if effect:
+            filters.append(f"[{current}][s{i}]xfade=transition={effect}:duration={transition_duration:g}"
+                           f":offset={elapsed - transition_duration:g}[{output}]")
+        else:
+            filters.append(f"[{current}][s{i}]concat=n=2:v=1:a=0[{output}]")
+        current = output
+        elapsed += durations[i]
+    filters.append(f"[{current}]null[vout]")
+    return input_durations, ";".join(filters)
+
+
+def transition_frame(first, second, effect, progress):
+    # 用PIL合成与ffmpeg xfade同名效果的画面，first和second为同尺寸的RGB图片
+    width, height = first.size
+    if effect == "fade" or effect not in ("slideleft", "slideright", "slideup", "slidedown"):
+        return Image.blend(first, second, progress)
+
+    frame = Image.new("RGB", first.size)
+    if effect == "slideleft":
+        offset = round(progress * width)
+        frame.paste(first, (-offset, 0))
+        frame.paste(second, (width - offset, 0))
+    elif effect == "slideright":
+        offset = round(progress * width)
+        frame.paste(first, (offset, 0))
+        frame.paste(second, (offset - width, 0))
+    elif effect == "slideup":
+        offset = round(progress * height)
+        frame.paste(first, (0, -offset))
+        frame.paste(second, (0, height - offset))
+    else:
+        offset = round(progress * height)
+        frame.paste(first, (0, offset))
+        frame.paste(second, (0, offset - height))
+    return frame
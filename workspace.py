@@ -0,0 +1,224 @@
+import os
+import errno
+import shutil
+import atexit
+import zipfile
+import tempfile
+import threading
+
+from pptx_package import EMU_PER_PIXEL, slide_part_names, slide_size
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# 每个任务使用独立的工作目录，可以放在内存盘上；结束时(包括异常)删除
+# 进程被强制结束时留下的目录，在下次创建工作目录时按记录的进程号清理
+RAM_ROOT = "/dev/shm"
+PID_FILE = ".owner"
+
+# 估算工作目录大小：渲染的图片按每像素字节数，视频按最高码率，分段、拼接和合成各有一份
+BYTES_PER_SLIDE_PIXEL = 1.0
+VIDEO_BYTES_PER_SECOND = 2 * 1024 * 1024
+VIDEO_COPIES = 3
+# 使用内存盘时至少保留的空闲空间
+RAM_RESERVE_BYTES = 512 * 1024 * 1024
+
+# Linux上的FICLONE，在btrfs、xfs等文件系统上共享数据块而不复制
+FICLONE = 0x40049409
+
+_active = set()
+_active_lock = threading.Lock()
+
+
+def estimate_workspace_bytes(ppt_path, slide_duration, width=0, height=0):
+    # 只读取PPTX包中的页数和尺寸；旧版.ppt无法读取时返回None
+    try:
+        with zipfile.ZipFile(ppt_path) as zf:
+            count = len(slide_part_names(zf))
+            size = slide_size(zf)
+    except (zipfile.BadZipFile, OSError):
+        return None
+    if not (width and height):
+        width, height = size[0] / EMU_PER_PIXEL, size[1] / EMU_PER_PIXEL
+    slides_bytes = count * width * height * BYTES_PER_SLIDE_PIXEL
+    video_bytes = count * slide_duration * VIDEO_BYTES_PER_SECOND * VIDEO_COPIES
+    return int(slides_bytes + video_bytes)
+
+
+def free_bytes(path):
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return 0
+
+
+def pid_alive(pid):
+    if psutil is not None:
+        return psutil.pid_exists(pid)
+    if os.name != "posix":
+        # Windows上os.kill会直接结束进程，无法用来探测，保守地认为仍在运行
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def purge_stale(root):
+    # 删除所属进程已经不存在的工作目录
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(root, name)
+        try:
+            with open(os.path.join(path, PID_FILE), 'r') as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        if not pid_alive(pid):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def choose_root(disk_root, ram_root=None, required_bytes=None):
+    # 内存盘空间足够时使用内存盘，否则(或无法估算大小时)使用磁盘
+    if ram_root and required_bytes is not None and os.path.isdir(os.path.dirname(ram_root) or ram_root):
+        try:
+            os.makedirs(ram_root, exist_ok=True)
+        except OSError:
+            return disk_root
+        if free_bytes(ram_root) >= required_bytes + RAM_RESERVE_BYTES:
+            return ram_root
+    return disk_root
+
+
+class Workspace:
+    # with Workspace(...) as workspace: 在独立的临时目录workspace.path中工作，退出时删除
+    def __init__(self, disk_root, prefix="job", ram_root=None, required_bytes=None):
+        self.root = choose_root(disk_root, ram_root, required_bytes)
+        self.in_ram = self.root != disk_root
+        os.makedirs(self.root, exist_ok=True)
+        purge_stale(self.root)
+        self.path = tempfile.mkdtemp(prefix=f"{prefix}_", dir=self.root)
+        with open(os.path.join(self.path, PID_FILE), 'w') as f:
+            f.write(str(os.getpid()))
+        with _active_lock:
+            _active.add(self.path)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        with _active_lock:
+            _active.discard(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+
+def clear_directory(path):
+    # 清空目录内容，保留所属进程记录
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name == PID_FILE:
+            continue
+        child = os.path.join(path, name)
+        if os.path.isdir(child) and not os.path.islink(child):
+            shutil.rmtree(child)
+        else:
+            os.remove(child)
+
+
+def cleanup_all():
+    with _active_lock:
+        paths = list(_active)
+        _active.clear()
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+atexit.register(cleanup_all)
+
+
+def same_filesystem(first, second):
+    try:
+        return os.stat(first).st_dev == os.stat(second).st_dev
+    except OSError:
+        return False
+
+
+def reflink(src_path, dst_path):
+    # 写时复制克隆，不支持时返回False
+    if fcntl is None:
+        return False
+    try:
+        with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dst_path)
+        except OSError:
+            pass
+        return False
+
+
+def handoff(src_path, dst_path, keep_source=False):
+    # 把生成的文件交给最终位置：同一文件系统直接改名(保留源文件时用硬链接)，否则尝试reflink，最后才复制
+    # 先写入目标目录中的临时文件再改名，目标位置不会出现写了一半的文件
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    os.makedirs(dst_dir, exist_ok=True)
+    if not keep_source:
+        try:
+            os.replace(src_path, dst_path)
+            return dst_path
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    tmp_path = os.path.join(dst_dir, f".{os.path.basename(dst_path)}.{os.getpid()}.tmp")
+    try:
+        linked = False
+        if keep_source and same_filesystem(src_path, dst_dir):
+            try:
+                os.link(src_path, tmp_path)
+                linked = True
+            except OSError:
+                pass
+        if not linked and not reflink(src_path, tmp_path):
+            shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if not keep_source:
+        os.remove(src_path)
+    return dst_path
+
+
+def handoff_tree(src_path, dst_path):
+    # 目录(如HLS、DASH输出)整体改名，跨文件系统时逐个文件交接
+    if os.path.isdir(dst_path):
+        shutil.rmtree(dst_path)
+    try:
+        os.replace(src_path, dst_path)
+        return dst_path
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    shutil.copytree(src_path, dst_path, copy_function=lambda src, dst: handoff(src, dst, keep_source=True))
+    shutil.rmtree(src_path, ignore_errors=True)
+    return dst_path